@@ -0,0 +1,410 @@
+"""
+Offline suspicious-pattern analytics over the full entry_logs history.
+
+entry_logs is loaded once into columnar NumPy arrays (optionally cached as
+.npy files that are memory-mapped on the next load and topped up with only
+the rows that changed), and every report is computed with vectorized array
+operations, so the suspicion rules can be re-run over millions of rows with
+any thresholds.
+
+NumPy is an optional dependency: the gate API works without it, only the
+reports need it. It is imported by the first report, not with the module,
+so it stays out of the API's startup time.
+
+Usage:
+    python -m backend.analytics --short-window 15 --max-duration 30 --top 10
+"""
+
+import argparse
+import json
+import os
+
+# NumPy, once require_numpy() imported it
+np = None
+
+from sqlalchemy import text
+
+from backend.rules import DEFAULT_RULES, RuleSet, suspicion_rules
+from backend.timestamps import sql_ist_ms
+
+
+def rule_thresholds(ruleset):
+    """
+    Report thresholds for a compiled RuleSet: its narrowest and widest
+    window_count rules become the short and long window (a prior count is
+    the number of earlier entries that must fall in the window), its
+    strictest duration rule the maximum visit length. Rule kinds the set
+    does not have are left out.
+    """
+    thresholds = {}
+    windows = sorted((rule.window, rule.limit) for rule in ruleset.entry_rules if rule.window)
+    if windows:
+        (short, short_prior), (long, long_prior) = windows[0], windows[-1]
+        thresholds.update({
+            "short_window_minutes": short.total_seconds() / 60,
+            "short_window_prior": short_prior,
+            "long_window_minutes": long.total_seconds() / 60,
+            "long_window_prior": long_prior,
+        })
+    durations = [rule.limit for rule in ruleset.exit_rules if rule.limit is not None]
+    if durations:
+        thresholds["max_duration_minutes"] = min(durations)
+    return thresholds
+
+
+# The live gate rules; kinds they leave out come from rules.DEFAULT_RULES
+DEFAULT_THRESHOLDS = {**rule_thresholds(RuleSet(DEFAULT_RULES)), **rule_thresholds(suspicion_rules)}
+
+DURATION_PERCENTILES = (50, 75, 90, 95, 99)
+
+COLUMNS = ("id", "plate", "entry_ms", "duration", "is_registered", "is_suspicious", "open", "abandoned")
+
+# Rows read per query. Plates are coded in SQL (analytics_plates, a temp
+# table), and each column of a chunk comes back as one space-separated
+# string that NumPy parses, so the load creates no Python object per value.
+# Durations go through text with SQLite's 15 significant digits.
+_CHUNK_SIZE = 200_000
+_CHUNK_QUERY = f"""
+    SELECT group_concat(entry_logs.id, ' '),
+           group_concat(analytics_plates.code, ' '),
+           group_concat({sql_ist_ms("entry_logs.entry_time")}, ' '),
+           group_concat(ifnull(entry_logs.duration_minutes, 'nan'), ' '),
+           group_concat(ifnull(entry_logs.is_registered, 0), ' '),
+           group_concat(ifnull(entry_logs.is_suspicious, 0), ' '),
+           group_concat(entry_logs.exit_time IS NULL AND entry_logs.abandoned_at IS NULL, ' '),
+           group_concat(entry_logs.abandoned_at IS NOT NULL, ' ')
+    FROM entry_logs
+    JOIN analytics_plates ON analytics_plates.plate = ifnull(entry_logs.plate_number, '')
+    WHERE entry_logs.id >= :low AND entry_logs.id < :high
+"""
+_DTYPES = {
+    "id": "i8",
+    "plate": "i4",
+    "entry_ms": "i8",
+    "duration": "f8",
+    "is_registered": "?",
+    "is_suspicious": "?",
+    "open": "?",
+    "abandoned": "?",
+}
+
+
+class AnalyticsUnavailable(RuntimeError):
+    """Raised when NumPy is not installed"""
+
+
+def require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:  # pragma: no cover - optional dependency
+            raise AnalyticsUnavailable("Analytics need NumPy: pip install numpy") from None
+
+
+class LogArrays:
+    """entry_logs as parallel column arrays, ordered by id"""
+
+    def __init__(self, columns, plates):
+        self.id = columns["id"]
+        self.plate = columns["plate"]            # int32 codes into self.plates
+        self.entry_ms = columns["entry_ms"]
+        self.duration = columns["duration"]      # NaN while on campus, and for abandoned visits
+        self.is_registered = columns["is_registered"]
+        self.is_suspicious = columns["is_suspicious"]
+        self.open = columns["open"]              # on campus: no exit and not abandoned
+        self.abandoned = columns["abandoned"]
+        self.plates = plates
+
+    def __len__(self):
+        return len(self.id)
+
+
+def _empty_columns():
+    return {
+        "id": np.empty(0, np.int64),
+        "plate": np.empty(0, np.int32),
+        "entry_ms": np.empty(0, np.int64),
+        "duration": np.empty(0, np.float64),
+        "is_registered": np.empty(0, bool),
+        "is_suspicious": np.empty(0, bool),
+        "open": np.empty(0, bool),
+        "abandoned": np.empty(0, bool),
+    }
+
+
+def _code_plates(conn, from_id, plates):
+    """Fill analytics_plates with the known plates and then new plates by first appearance"""
+    conn.execute(text(
+        "CREATE TEMP TABLE IF NOT EXISTS analytics_plates (plate TEXT PRIMARY KEY, code INTEGER NOT NULL)"
+    ))
+    conn.execute(text("DELETE FROM analytics_plates"))
+    if plates:
+        conn.execute(
+            text("INSERT INTO analytics_plates (plate, code) VALUES (:plate, :code)"),
+            [{"plate": plate, "code": code} for code, plate in enumerate(plates)],
+        )
+    # Grouped on the bare column so the plate index serves the GROUP BY
+    conn.execute(text("""
+        INSERT INTO analytics_plates (plate, code)
+        SELECT plate, :known + row_number() OVER (ORDER BY first_id) - 1
+        FROM (
+            SELECT ifnull(plate_number, '') AS plate, min(id) AS first_id
+            FROM entry_logs WHERE id >= :from_id
+            GROUP BY plate_number
+        )
+        WHERE plate NOT IN (SELECT plate FROM analytics_plates)
+    """), {"known": len(plates), "from_id": from_id})
+    new_plates = conn.execute(
+        text("SELECT plate FROM analytics_plates WHERE code >= :known ORDER BY code"), {"known": len(plates)}
+    ).scalars()
+    plates.extend(new_plates)
+
+
+def _fetch(conn, from_id, plates):
+    """Read rows with id >= from_id; new plate names are appended to `plates`"""
+    last_id = conn.execute(text("SELECT max(id) FROM entry_logs")).scalar()
+    if last_id is None or last_id < from_id:
+        return _empty_columns()
+    _code_plates(conn, from_id, plates)
+
+    chunks = {name: [] for name in COLUMNS}
+    for low in range(from_id, last_id + 1, _CHUNK_SIZE):
+        values = conn.execute(text(_CHUNK_QUERY), {"low": low, "high": low + _CHUNK_SIZE}).one()
+        if values[0] is None:
+            continue  # no rows left in this id range
+        for name, joined in zip(COLUMNS, values):
+            chunks[name].append(np.fromstring(joined, dtype=_DTYPES[name], sep=" "))
+    if not chunks["id"]:
+        return _empty_columns()
+    columns = {name: np.concatenate(chunks[name]) for name in COLUMNS}
+
+    # group_concat follows the scan order; make the id order explicit
+    order = np.argsort(columns["id"], kind="stable")
+    if (order != np.arange(len(order))).any():
+        columns = {name: values[order] for name, values in columns.items()}
+    return columns
+
+
+def _save_cache(cache_dir, columns, plates):
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, values in list(columns.items()) + [("plates", np.array(plates, dtype=str))]:
+        tmp = os.path.join(cache_dir, f"{name}.tmp.npy")
+        np.save(tmp, values)
+        os.replace(tmp, os.path.join(cache_dir, f"{name}.npy"))
+
+
+def _load_cache(cache_dir):
+    try:
+        columns = {name: np.load(os.path.join(cache_dir, f"{name}.npy"), mmap_mode="r") for name in COLUMNS}
+        plates = np.load(os.path.join(cache_dir, "plates.npy")).tolist()
+    except FileNotFoundError:
+        return None, []
+    return columns, plates
+
+
+def _cache_matches(conn, columns, plates):
+    """
+    Whether cached rows came from this database: the newest cached row may
+    not be newer than the table, and when it is still there it has the same
+    plate and entry time. A reset or replaced database fails this; rows
+    archived by retention are simply missing.
+    """
+    if not len(columns["id"]):
+        return True
+    last_id = int(columns["id"][-1])
+    if (conn.execute(text("SELECT max(id) FROM entry_logs")).scalar() or 0) < last_id:
+        return False
+    row = conn.execute(
+        text(f"SELECT ifnull(plate_number, ''), {sql_ist_ms('entry_time')} FROM entry_logs WHERE id = :id"),
+        {"id": last_id},
+    ).first()
+    return row is None or (row[0] == plates[columns["plate"][-1]] and row[1] == columns["entry_ms"][-1])
+
+
+def _closed_since(conn, columns, keep):
+    """
+    Cached rows before `keep` that were abandoned and have since been closed
+    by a replayed exit scan (see backend.batch). Only the abandoned rows are
+    looked up, by id. Returns the columns with those rows updated, or None
+    when nothing changed.
+    """
+    ids = columns["id"][:keep][columns["abandoned"][:keep]]
+    if not len(ids):
+        return None
+    rows = conn.execute(text("""
+        SELECT id, ifnull(duration_minutes, 'nan'), ifnull(is_suspicious, 0)
+        FROM entry_logs
+        WHERE abandoned_at IS NULL AND id IN (SELECT value FROM json_each(:ids))
+    """), {"ids": json.dumps(ids.tolist())}).all()
+    if not rows:
+        return None
+    # Copies: cached columns are read-only memory maps
+    columns = {name: np.array(values) for name, values in columns.items()}
+    at = np.searchsorted(columns["id"], [row[0] for row in rows])
+    columns["duration"][at] = [float(row[1]) for row in rows]
+    columns["is_suspicious"][at] = [bool(row[2]) for row in rows]
+    columns["abandoned"][at] = False
+    return columns
+
+
+def load_log_arrays(conn, cache_dir=None):
+    """
+    Load entry_logs (sync Connection) into LogArrays. With a cache directory,
+    cached rows are memory-mapped and only rows from the oldest entry that was
+    still on campus at the last load onwards are re-read; rows before that
+    are closed or abandoned, and only a replayed exit can still close an
+    abandoned one (see _closed_since). Rows removed from entry_logs since
+    they were cached are kept, so reports cover the full history. A cache
+    built from another database is discarded.
+    """
+    require_numpy()
+    columns, plates = _load_cache(cache_dir) if cache_dir else (None, [])
+    if columns is not None and not _cache_matches(conn, columns, plates):
+        columns, plates = None, []
+
+    from_id = 0
+    if columns is not None and len(columns["id"]):
+        open_rows = np.flatnonzero(columns["open"])
+        from_id = int(columns["id"][open_rows[0]]) if len(open_rows) else int(columns["id"][-1]) + 1
+
+    fresh = _fetch(conn, from_id, plates)
+    if columns is None:
+        columns = fresh
+    else:
+        keep = int(np.searchsorted(columns["id"], from_id))
+        closed = _closed_since(conn, columns, keep)
+        if not len(fresh["id"]) and keep == len(columns["id"]) and closed is None:
+            return LogArrays(columns, plates)  # cache is current
+        columns = closed or columns
+        columns = {name: np.concatenate([columns[name][:keep], fresh[name]]) for name in COLUMNS}
+
+    if cache_dir:
+        _save_cache(cache_dir, columns, plates)
+        columns, plates = _load_cache(cache_dir)
+    return LogArrays(columns, plates)
+
+
+def prior_entries(arrays, windows_minutes):
+    """
+    For every entry, the number of earlier entries of the same plate within
+    each window before it (what the gate's frequency check counts). Returns
+    one count array per window; the sort is shared between windows.
+    """
+    if not len(arrays):
+        return [np.zeros(0, np.int64) for _ in windows_minutes]
+    windows = [int(minutes * 60_000) for minutes in windows_minutes]
+
+    # One sortable key per entry: plates are spaced further apart than the
+    # widest window, so a searchsorted never crosses into another plate's
+    # entries. Rows are in id order, so a stable sort breaks ties by id.
+    entry_ms = arrays.entry_ms - arrays.entry_ms.min()
+    stride = int(entry_ms.max()) + max(windows) + 1
+    key = arrays.plate.astype(np.int64) * stride + entry_ms
+    order = np.argsort(key, kind="stable")
+    key = key[order]
+
+    positions = np.arange(len(arrays))
+    counts = []
+    for window in windows:
+        in_window = np.empty(len(arrays), np.int64)
+        in_window[order] = positions - np.searchsorted(key, key - window, side="left")
+        counts.append(in_window)
+    return counts
+
+
+def evaluate(arrays, thresholds):
+    """Re-apply the suspicion rules; returns (frequency_flags, duration_flags)"""
+    short, long = prior_entries(arrays, (thresholds["short_window_minutes"], thresholds["long_window_minutes"]))
+    frequency = ~arrays.is_registered & (
+        (short >= thresholds["short_window_prior"]) | (long >= thresholds["long_window_prior"])
+    )
+    with np.errstate(invalid="ignore"):
+        duration = arrays.duration > thresholds["max_duration_minutes"]
+    return frequency, duration
+
+
+def duration_distribution(durations):
+    """Count, mean and percentiles of the closed visits in `durations`"""
+    closed = durations[~np.isnan(durations)]
+    if not len(closed):
+        return {"count": 0}
+    percentiles = np.percentile(closed, DURATION_PERCENTILES)
+    return {
+        "count": int(len(closed)),
+        "mean": float(closed.mean()),
+        **{f"p{pct}": float(value) for pct, value in zip(DURATION_PERCENTILES, percentiles)},
+        "max": float(closed.max()),
+    }
+
+
+def repeat_offenders(arrays, flagged, top=20):
+    """Plates with the most flagged visits, most first"""
+    flagged_per_plate = np.bincount(arrays.plate[flagged], minlength=len(arrays.plates))
+    entries_per_plate = np.bincount(arrays.plate, minlength=len(arrays.plates))
+    candidates = np.flatnonzero(flagged_per_plate)
+    if len(candidates) > top:
+        candidates = candidates[np.argpartition(-flagged_per_plate[candidates], top - 1)[:top]]
+    candidates = candidates[np.lexsort((candidates, -flagged_per_plate[candidates]))]
+    return [{
+        "plate_number": arrays.plates[code],
+        "flagged_visits": int(flagged_per_plate[code]),
+        "entries": int(entries_per_plate[code]),
+    } for code in candidates]
+
+
+def suspicion_report(arrays, thresholds=None, top=20):
+    """Re-evaluate the whole history with `thresholds` (defaults: the live rules)"""
+    require_numpy()
+    thresholds = {**DEFAULT_THRESHOLDS, **(thresholds or {})}
+    frequency, duration = evaluate(arrays, thresholds)
+    flagged = frequency | duration
+
+    return {
+        "thresholds": thresholds,
+        "rows": len(arrays),
+        "plates": len(arrays.plates),
+        "flagged": {
+            "frequency": int(frequency.sum()),
+            "duration": int(duration.sum()),
+            "total": int(flagged.sum()),
+            # Compared with the flags stored when the visits happened
+            "newly_flagged": int((flagged & ~arrays.is_suspicious).sum()),
+            "no_longer_flagged": int((~flagged & arrays.is_suspicious).sum()),
+        },
+        "durations": {
+            "all": duration_distribution(arrays.duration),
+            "registered": duration_distribution(arrays.duration[arrays.is_registered]),
+            "unregistered": duration_distribution(arrays.duration[~arrays.is_registered]),
+        },
+        "repeat_offenders": repeat_offenders(arrays, flagged, top),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Suspicious-pattern report over entry_logs")
+    parser.add_argument("--short-window", type=float, default=DEFAULT_THRESHOLDS["short_window_minutes"])
+    parser.add_argument("--short-prior", type=int, default=DEFAULT_THRESHOLDS["short_window_prior"])
+    parser.add_argument("--long-window", type=float, default=DEFAULT_THRESHOLDS["long_window_minutes"])
+    parser.add_argument("--long-prior", type=int, default=DEFAULT_THRESHOLDS["long_window_prior"])
+    parser.add_argument("--max-duration", type=float, default=DEFAULT_THRESHOLDS["max_duration_minutes"])
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--cache", help="directory for the memory-mapped column cache")
+    args = parser.parse_args()
+
+    from backend.database import engine
+
+    with engine.connect() as conn:
+        arrays = load_log_arrays(conn, args.cache)
+    report = suspicion_report(arrays, {
+        "short_window_minutes": args.short_window,
+        "short_window_prior": args.short_prior,
+        "long_window_minutes": args.long_window,
+        "long_window_prior": args.long_prior,
+        "max_duration_minutes": args.max_duration,
+    }, top=args.top)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
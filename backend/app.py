@@ -1,40 +1,164 @@
+import asyncio
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import APIRouter, FastAPI, Depends, File, Header, HTTPException, Query, UploadFile
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
-from sqlalchemy.orm import Session
-from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel
+from fastapi.responses import HTMLResponse, FileResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import Optional, List, Union
+from pydantic import BaseModel, Field
 
-from backend.database import get_db, init_db, Vehicle, EntryLog
+from backend import analytics, retention
+from backend.background import cancel_tasks, retry_until_done, run_periodically
+from backend.batch import apply_entry_batch, apply_exit_batch
+from backend.bulk_vehicles import (
+    ImportFormatError,
+    VEHICLE_COLUMNS,
+    VEHICLE_FIELDS,
+    import_vehicles,
+    serialize_vehicle,
+)
+from backend.coherence import cache_coherence, event_relay
+from backend.config import (
+    REGISTRY_REFRESH_SECONDS,
+    ANALYTICS_CACHE_DIR,
+    CACHE_SYNC_INTERVAL,
+    RETENTION_DAYS,
+    RETENTION_INTERVAL,
+    STORAGE_BACKEND,
+)
+from backend.database import (
+    get_db, get_engine, init_db, new_session, serialized_write,
+    ActiveEntry, Vehicle, EntryLog, TrafficRollup, TrafficDurationBin,
+)
+from backend.events import EVENT_TYPES, event_broker, publish_scan
+from backend.export import export_response, EXPORT_FORMATS
+from backend.frequency import entry_tracker, PRUNE_INTERVAL
+from backend.group_commit import group_commit, replay_journals
+from backend.metrics import MetricsMiddleware, render as render_metrics, stage
+from backend.plates import PlateNumber
+from backend.pagination import LOG_ORDER, after_cursor, decode_cursor, paginate
+from backend.registry import registry_cache
+from backend.repository import (
+    Repository,
+    get_repository,
+    load_entry_windows,
+    load_registry,
+    shared_repository,
+)
+from backend.rollups import serialize_rollup
+from backend.serialization import FastJSONResponse
 from backend.timezone_utils import get_ist_now
 from backend.utils import (
-    check_suspicious_duration,
-    check_suspicious_frequency,
-    get_past_entries,
+    check_entry_rules,
+    check_exit_rules,
+    check_registered,
+    suspicious_reason,
+    entry_message,
+    exit_message,
+    format_past_entries,
     format_duration,
+    log_records,
+    serialize_log,
+    LOG_COLUMNS,
+    LOG_FIELDS,
 )
 
 
+async def load_caches():
+    """Rebuild the in-memory entry windows and registry from the storage backend"""
+    if STORAGE_BACKEND == "sqlite":
+        async with new_session() as db:
+            await entry_tracker.rebuild(db)
+            await registry_cache.load(db)
+    else:
+        repository = shared_repository()
+        await load_entry_windows(repository)
+        await load_registry(repository)
+
+
+async def warm_caches(tasks):
+    """
+    Load the caches, then start the jobs that keep them fresh (appended to
+    `tasks`). Runs after startup, so the server accepts connections while
+    it loads: entry scans wait for the entry windows, and registration is
+    read from the database until the registry cache is loaded.
+    """
+    await retry_until_done(load_caches)
+    if STORAGE_BACKEND == "sqlite":
+        refresh_registry = (registry_cache.refresh,)
+    else:
+        refresh_registry = (load_registry, shared_repository())
+    
+    tasks.append(asyncio.create_task(run_periodically(PRUNE_INTERVAL, entry_tracker.prune)))
+    if REGISTRY_REFRESH_SECONDS > 0:
+        tasks.append(asyncio.create_task(
+            run_periodically(REGISTRY_REFRESH_SECONDS, *refresh_registry)
+        ))
+    # Other workers' writes are only visible in SQLite (data_version polling)
+    if CACHE_SYNC_INTERVAL > 0 and STORAGE_BACKEND == "sqlite":
+        tasks.append(asyncio.create_task(
+            run_periodically(CACHE_SYNC_INTERVAL, cache_coherence.poll)
+        ))
+    if RETENTION_DAYS > 0:
+        # Blocking file and database work: run each pass in a thread
+        tasks.append(asyncio.create_task(
+            run_periodically(RETENTION_INTERVAL, asyncio.to_thread, retention.enforce_retention, get_engine())
+        ))
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    init_db()
+    # Two PRAGMA reads when the schema is already current
+    await init_db()
+    if STORAGE_BACKEND == "sqlite":
+        # Writes acknowledged by a group-commit process that stopped before committing them
+        await replay_journals()
+        await group_commit.start()
+    
+    tasks = []
+    tasks.append(asyncio.create_task(warm_caches(tasks)))
     yield
+    event_broker.close()
+    await cancel_tasks(tasks)
+    await group_commit.close()
+    await cache_coherence.close()
+
+
+router = APIRouter()
+
 
+def create_app() -> FastAPI:
+    """
+    Build the API application. Cheap: the database is opened and migrated
+    in the lifespan, and the caches fill in the background after that.
+    """
+    app = FastAPI(title="Vehicle Entry Management System", lifespan=lifespan)
+    app.add_middleware(MetricsMiddleware)
+    app.include_router(router)
+    return app
 
-app = FastAPI(title="Vehicle Entry Management System", lifespan=lifespan)
+
+def __getattr__(name):
+    # `backend.app:app` is built on first access, so uvicorn --factory
+    # (backend.app:create_app) does not build a second application
+    if name == "app":
+        globals()["app"] = application = create_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Pydantic models for request/response
+# Plates are normalized on input ("ka 09 ab 4821" -> "KA09AB4821")
 class EntryCheckRequest(BaseModel):
-    plate_number: str
+    plate_number: PlateNumber
 
 class ExitCheckRequest(BaseModel):
-    plate_number: str
+    plate_number: PlateNumber
 
 class VehicleCreate(BaseModel):
-    plate_number: str
+    plate_number: PlateNumber
     owner_name: str
     vehicle_type: Optional[str] = "Unknown"
 
@@ -45,6 +169,9 @@ class EntryResponse(BaseModel):
     is_suspicious: bool
     message: str
     suspicious_reason: Optional[str] = ""
+    triggered_rules: List[str] = []
+    # Registered plates an unregistered read is probably a misread of
+    suggested_plates: List[str] = []
 
 class ExitResponse(BaseModel):
     plate_number: str
@@ -54,83 +181,136 @@ class ExitResponse(BaseModel):
     duration_formatted: str
     is_suspicious: bool
     message: str
+    triggered_rules: List[str] = []
+
+class GateEvent(BaseModel):
+    plate_number: PlateNumber
+    timestamp: datetime
+    idempotency_key: str = Field(min_length=1, max_length=128)
+
+class GateEventBatch(BaseModel):
+    events: List[GateEvent] = Field(min_length=1, max_length=1000)
+
+class BatchResponse(BaseModel):
+    results: List[dict]
+
+# Documentation only: the log listings are built by log_records and returned
+# as FastJSONResponse without validation
+class LogRecord(BaseModel):
+    id: Union[int, str]
+    plate_number: str
+    entry_time: datetime
+    exit_time: Optional[datetime]
+    duration_minutes: Optional[float]
+    duration_formatted: str
+    is_registered: bool
+    is_suspicious: bool
+
+class HistoryResponse(BaseModel):
+    plate_number: str
+    entries: List[LogRecord]
+    next_cursor: Optional[str]
 
 # API Endpoints
 
-@app.post("/api/check-entry", response_model=EntryResponse)
-async def check_entry(request: EntryCheckRequest, db: Session = Depends(get_db)):
+@router.post("/api/check-entry", response_model=EntryResponse)
+async def check_entry(request: EntryCheckRequest, repository: Repository = Depends(get_repository)):
     """Check vehicle at entry gate"""
-    plate_number = request.plate_number.upper().strip()
+    plate_number = request.plate_number
+    now = get_ist_now()
+    
+    # Vehicle and past 3 entries in one read
+    with stage("snapshot"):
+        vehicle, recent_entries = await repository.entry_snapshot(
+            plate_number, limit=3, with_vehicle=not registry_cache.loaded
+        )
     
-    # Check if registered
-    vehicle = db.query(Vehicle).filter(Vehicle.plate_number == plate_number).first()
-    is_registered = vehicle is not None
+    # Check if registered (from the registry cache once it is loaded)
+    with stage("registry"):
+        if registry_cache.loaded:
+            is_registered, vehicle_type = registry_cache.lookup(plate_number)
+        else:
+            is_registered, vehicle_type = vehicle is not None, vehicle.vehicle_type if vehicle else None
+        suggested_plates = [] if is_registered else registry_cache.suggest(plate_number)
     
-    # Check for suspicious frequency (unregistered, multiple entries)
-    is_suspicious_freq, suspicious_reason = check_suspicious_frequency(db, plate_number, is_registered)
+    # Evaluate the suspicion rules (frequency windows, time of day, ...);
+    # only waits while the entry windows load after startup
+    await entry_tracker.ready.wait()
+    with stage("rules"):
+        triggered = check_entry_rules(plate_number, is_registered, vehicle_type, now=now)
+    is_suspicious = bool(triggered)
+    reason = suspicious_reason(triggered)
     
-    # Get past 3 entries
-    past_entries = get_past_entries(db, plate_number, limit=3)
+    past_entries = format_past_entries(recent_entries, now)
     
     # Create entry log
-    entry_log = EntryLog(
-        plate_number=plate_number,
-        entry_time=get_ist_now(),
-        is_registered=is_registered,
-        is_suspicious=is_suspicious_freq
-    )
-    db.add(entry_log)
-    db.commit()
-    
-    # Build message with specific reason
-    if is_suspicious_freq:
-        message = f"⚠️ RED FLAG: {suspicious_reason}"
-    elif not is_registered:
-        message = "❌ UNREGISTERED VEHICLE"
-    else:
-        message = "✅ REGISTERED VEHICLE"
+    with stage("commit"):
+        entry_log = await repository.record_entry(plate_number, now, is_registered, is_suspicious)
+    
+    message = entry_message(is_registered, is_suspicious, reason)
+    triggered_rules = [rule.name for rule in triggered]
+    repository.publish("entry", {
+        "log_id": entry_log.id,
+        "plate_number": plate_number,
+        "entry_time": entry_log.entry_time,
+        "is_registered": is_registered,
+        "is_suspicious": is_suspicious,
+        "triggered_rules": triggered_rules,
+        "suggested_plates": suggested_plates,
+        "message": message,
+    })
     
     return EntryResponse(
         is_registered=is_registered,
         plate_number=plate_number,
         past_entries=past_entries,
-        is_suspicious=is_suspicious_freq,
+        is_suspicious=is_suspicious,
         message=message,
-        suspicious_reason=suspicious_reason if is_suspicious_freq else ""
+        suspicious_reason=reason,
+        triggered_rules=triggered_rules,
+        suggested_plates=suggested_plates
     )
 
-@app.post("/api/check-exit", response_model=ExitResponse)
-async def check_exit(request: ExitCheckRequest, db: Session = Depends(get_db)):
+@router.post("/api/check-exit", response_model=ExitResponse)
+async def check_exit(request: ExitCheckRequest, repository: Repository = Depends(get_repository)):
     """Process vehicle exit"""
-    plate_number = request.plate_number.upper().strip()
+    plate_number = request.plate_number
     
-    # Find the most recent entry without exit
-    entry_log = db.query(EntryLog).filter(
-        EntryLog.plate_number == plate_number,
-        EntryLog.exit_time.is_(None)
-    ).order_by(EntryLog.entry_time.desc()).first()
+    async with repository.write_scope():
+        # Take the vehicle off campus (no entry_logs scan)
+        with stage("active_entry"):
+            entry_log = await repository.pop_open_entry(plate_number)
+        
+        if not entry_log:
+            raise HTTPException(status_code=404, detail="No active entry found for this vehicle")
+        
+        # Calculate duration
+        exit_time = get_ist_now()
+        duration = (exit_time - entry_log.entry_time).total_seconds() / 60
+        
+        # Check the exit rules (visit duration)
+        _, vehicle_type = await check_registered(repository, plate_number)
+        triggered = check_exit_rules(duration, entry_log.is_registered, vehicle_type, now=exit_time)
+        is_suspicious_dur = bool(triggered)
+        
+        # Update entry log
+        with stage("commit"):
+            await repository.close_entry(entry_log, exit_time, duration, entry_log.is_suspicious or is_suspicious_dur)
     
-    if not entry_log:
-        raise HTTPException(status_code=404, detail="No active entry found for this vehicle")
-    
-    # Calculate duration
-    exit_time = get_ist_now()
-    duration = (exit_time - entry_log.entry_time).total_seconds() / 60
-    
-    # Check if suspicious duration
-    is_suspicious_dur = check_suspicious_duration(duration)
-    
-    # Update entry log
-    entry_log.exit_time = exit_time
-    entry_log.duration_minutes = duration
-    entry_log.is_suspicious = entry_log.is_suspicious or is_suspicious_dur
-    db.commit()
-    
-    # Build message
-    if is_suspicious_dur:
-        message = f"⚠️ SUSPICIOUS: Stayed {format_duration(duration)} (>20min)"
-    else:
-        message = "✅ Exit recorded"
+    message = exit_message(duration, is_suspicious_dur, suspicious_reason(triggered))
+    triggered_rules = [rule.name for rule in triggered]
+    repository.publish("exit", {
+        "log_id": entry_log.id,
+        "plate_number": plate_number,
+        "entry_time": entry_log.entry_time,
+        "exit_time": exit_time,
+        "duration_minutes": duration,
+        "duration_formatted": format_duration(duration),
+        "is_registered": entry_log.is_registered,
+        "is_suspicious": is_suspicious_dur,
+        "triggered_rules": triggered_rules,
+        "message": message,
+    })
     
     return ExitResponse(
         plate_number=plate_number,
@@ -139,49 +319,135 @@ async def check_exit(request: ExitCheckRequest, db: Session = Depends(get_db)):
         duration_minutes=duration,
         duration_formatted=format_duration(duration),
         is_suspicious=is_suspicious_dur,
-        message=message
+        message=message,
+        triggered_rules=triggered_rules
     )
 
-@app.get("/api/history/{plate_number}")
-async def get_history(plate_number: str, db: Session = Depends(get_db)):
-    """Get full history for a vehicle"""
-    plate_number = plate_number.upper().strip()
-    entries = db.query(EntryLog).filter(
-        EntryLog.plate_number == plate_number
-    ).order_by(EntryLog.entry_time.desc()).all()
-    
-    result = []
-    for entry in entries:
-        result.append({
-            "entry_time": entry.entry_time.isoformat() if entry.entry_time else None,
-            "exit_time": entry.exit_time.isoformat() if entry.exit_time else None,
-            "duration_minutes": entry.duration_minutes,
-            "duration_formatted": format_duration(entry.duration_minutes),
-            "is_registered": entry.is_registered,
-            "is_suspicious": entry.is_suspicious
-        })
-    
-    return {"plate_number": plate_number, "entries": result}
+def log_query(*where, cursor: Optional[str] = None):
+    """Column-only entry_logs query in LOG_ORDER, continuing after `cursor`"""
+    stmt = select(*LOG_COLUMNS).where(*where).order_by(*LOG_ORDER)
+    if cursor:
+        try:
+            stmt = stmt.where(after_cursor(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return stmt
+
+def sqlite_only():
+    """Dependency of the endpoints that read SQLite directly (see backend.repository)"""
+    if STORAGE_BACKEND != "sqlite":
+        raise HTTPException(status_code=501, detail=f"Not available with STORAGE_BACKEND={STORAGE_BACKEND}")
+
+SQLITE_ONLY = [Depends(sqlite_only)]
+
+def check_export_format(fmt: str):
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported format, use one of: {', '.join(EXPORT_FORMATS)}")
+
+@router.get("/api/history/{plate_number}", response_class=FastJSONResponse,
+         responses={200: {"model": HistoryResponse}})
+async def get_history(plate_number: PlateNumber, limit: int = Query(500, ge=1, le=5000),
+                      cursor: Optional[str] = None, include_archived: bool = False,
+                      repository: Repository = Depends(get_repository)):
+    """
+    Get history for a vehicle, newest first, one keyset page at a time.
+    With include_archived, logs moved to the archive by the retention job
+    are merged in (slower: archive partitions are scanned).
+    """
+    try:
+        before = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    rows = await repository.history(plate_number, limit + 1, before)
+    if include_archived:
+        try:
+            archived = await asyncio.to_thread(retention.read_archived_history, plate_number, limit + 1, before)
+        except retention.ArchiveUnavailable as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        rows = retention.merge_history(rows, archived, limit + 1)
+    entries, next_cursor = paginate(rows, limit)
+    
+    return FastJSONResponse({
+        "plate_number": plate_number,
+        "entries": log_records(entries),
+        "next_cursor": next_cursor
+    })
+
+@router.get("/api/history/{plate_number}/export", dependencies=SQLITE_ONLY)
+async def export_history(plate_number: PlateNumber, fmt: str = Query("ndjson", alias="format")):
+    """Stream a vehicle's full history as NDJSON or CSV"""
+    check_export_format(fmt)
+    stmt = log_query(EntryLog.plate_number == plate_number)
+    return export_response(stmt, LOG_FIELDS, serialize_log, fmt, f"history-{plate_number}")
+
+def publish_applied(kind: str, results):
+    """Stream the newly applied events of a batch (duplicates were streamed the first time)"""
+    for result in results:
+        if result["status"] == "applied":
+            publish_scan(kind, result)
+
+@router.post("/api/check-entry/batch", response_model=BatchResponse, dependencies=SQLITE_ONLY)
+async def check_entry_batch(batch: GateEventBatch, db: AsyncSession = Depends(get_db)):
+    """Replay buffered entry scans in one transaction (safe to retry)"""
+    await entry_tracker.ready.wait()
+    async with serialized_write():
+        results = await apply_entry_batch(db, batch.events)
+    publish_applied("entry", results)
+    return BatchResponse(results=results)
+
+@router.post("/api/check-exit/batch", response_model=BatchResponse, dependencies=SQLITE_ONLY)
+async def check_exit_batch(batch: GateEventBatch, db: AsyncSession = Depends(get_db)):
+    """Replay buffered exit scans in one transaction (safe to retry)"""
+    async with serialized_write():
+        results = await apply_exit_batch(db, batch.events)
+    publish_applied("exit", results)
+    return BatchResponse(results=results)
+
+@router.get("/api/events")
+async def stream_events(types: Optional[str] = None, last_event_id: Optional[str] = Header(None)):
+    """
+    Server-Sent Events stream of gate activity, so dashboards don't poll /api/logs.
+    `types` filters by a comma-separated subset of entry, exit and suspicious;
+    reconnecting EventSource clients resume after their Last-Event-ID.
+    """
+    wanted = [t for t in (types or "").split(",") if t]
+    unknown = set(wanted) - set(EVENT_TYPES)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown event types, use: {', '.join(EVENT_TYPES)}")
+    subscriber = event_broker.subscribe(last_event_id, wanted)
+    return StreamingResponse(
+        event_broker.stream_frames(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.get("/api/on-campus", dependencies=SQLITE_ONLY)
+async def get_on_campus(db: AsyncSession = Depends(get_db)):
+    """List vehicles currently on campus (read from active_entries only)"""
+    now = get_ist_now()
+    active = await db.scalars(select(ActiveEntry).order_by(ActiveEntry.entry_time.desc()))
+    
+    vehicles = [{
+        "plate_number": entry.plate_number,
+        "entry_time": entry.entry_time.isoformat(),
+        "time_on_campus": format_duration((now - entry.entry_time).total_seconds() / 60),
+        "is_registered": entry.is_registered,
+        "is_suspicious": entry.is_suspicious
+    } for entry in active]
+    
+    return {"count": len(vehicles), "vehicles": vehicles}
 
 # Admin endpoints
 
-@app.post("/api/vehicles")
-async def create_vehicle(vehicle: VehicleCreate, db: Session = Depends(get_db)):
+@router.post("/api/vehicles")
+async def create_vehicle(vehicle: VehicleCreate, repository: Repository = Depends(get_repository)):
     """Register a new vehicle"""
-    plate_number = vehicle.plate_number.upper().strip()
+    plate_number = vehicle.plate_number
     
-    # Check if already exists
-    existing = db.query(Vehicle).filter(Vehicle.plate_number == plate_number).first()
-    if existing:
+    new_vehicle = await repository.add_vehicle(plate_number, vehicle.owner_name, vehicle.vehicle_type)
+    if new_vehicle is None:
         raise HTTPException(status_code=400, detail="Vehicle already registered")
-    
-    new_vehicle = Vehicle(
-        plate_number=plate_number,
-        owner_name=vehicle.owner_name,
-        vehicle_type=vehicle.vehicle_type
-    )
-    db.add(new_vehicle)
-    db.commit()
+    registry_cache.add(plate_number, new_vehicle.vehicle_type)
     
     return {"message": "Vehicle registered successfully", "vehicle": {
         "plate_number": new_vehicle.plate_number,
@@ -189,48 +455,168 @@ async def create_vehicle(vehicle: VehicleCreate, db: Session = Depends(get_db)):
         "vehicle_type": new_vehicle.vehicle_type
     }}
 
-@app.get("/api/vehicles")
-async def list_vehicles(db: Session = Depends(get_db)):
-    """List all registered vehicles"""
-    vehicles = db.query(Vehicle).all()
-    return [{
-        "plate_number": v.plate_number,
-        "owner_name": v.owner_name,
-        "vehicle_type": v.vehicle_type,
-        "registered_date": v.registered_date.isoformat() if v.registered_date else None
-    } for v in vehicles]
-
-@app.delete("/api/vehicles/{plate_number}")
-async def delete_vehicle(plate_number: str, db: Session = Depends(get_db)):
+@router.get("/api/vehicles", response_class=FastJSONResponse)
+async def list_vehicles(repository: Repository = Depends(get_repository)):
+    """List all registered vehicles (use /api/vehicles/export for large registries)"""
+    return FastJSONResponse([serialize_vehicle(row) for row in await repository.list_vehicles()])
+
+@router.get("/api/vehicles/export", dependencies=SQLITE_ONLY)
+async def export_vehicles(fmt: str = Query("ndjson", alias="format")):
+    """Stream the registry as NDJSON or CSV (importable with /api/vehicles/import)"""
+    check_export_format(fmt)
+    stmt = select(*VEHICLE_COLUMNS).order_by(Vehicle.plate_number)
+    return export_response(stmt, VEHICLE_FIELDS, serialize_vehicle, fmt, "vehicles")
+
+@router.post("/api/vehicles/import", dependencies=SQLITE_ONLY)
+async def import_vehicle_file(file: UploadFile = File(...), fmt: Optional[str] = Query(None, alias="format"),
+                              db: AsyncSession = Depends(get_db)):
+    """
+    Register or update vehicles from a CSV (with header) or NDJSON upload.
+    The format defaults to the file extension. Valid rows are upserted in
+    chunks; invalid rows are skipped and reported by line number.
+    """
+    fmt = fmt or (file.filename or "").rsplit(".", 1)[-1].lower()
+    check_export_format(fmt)
+    try:
+        return await import_vehicles(db, file.file, fmt)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.delete("/api/vehicles/{plate_number}")
+async def delete_vehicle(plate_number: PlateNumber, repository: Repository = Depends(get_repository)):
     """Remove a vehicle from registry"""
-    plate_number = plate_number.upper().strip()
-    vehicle = db.query(Vehicle).filter(Vehicle.plate_number == plate_number).first()
-    
-    if not vehicle:
+    if not await repository.delete_vehicle(plate_number):
         raise HTTPException(status_code=404, detail="Vehicle not found")
-    
-    db.delete(vehicle)
-    db.commit()
+    registry_cache.discard(plate_number)
     
     return {"message": "Vehicle removed successfully"}
 
-@app.get("/api/logs")
-async def get_all_logs(limit: int = 1000, db: Session = Depends(get_db)):
-    """Get all entry logs"""
-    logs = db.query(EntryLog).order_by(EntryLog.entry_time.desc()).limit(limit).all()
-    
-    return [{
-        "id": log.id,
-        "plate_number": log.plate_number,
-        "entry_time": log.entry_time.isoformat() if log.entry_time else None,
-        "exit_time": log.exit_time.isoformat() if log.exit_time else None,
-        "duration_minutes": log.duration_minutes,
-        "duration_formatted": format_duration(log.duration_minutes),
-        "is_registered": log.is_registered,
-        "is_suspicious": log.is_suspicious
-    } for log in logs]
+@router.get("/api/logs", response_class=FastJSONResponse,
+         responses={200: {"model": List[LogRecord]}}, dependencies=SQLITE_ONLY)
+async def get_all_logs(limit: int = Query(1000, ge=1, le=5000),
+                       cursor: Optional[str] = None, db: AsyncSession = Depends(get_db)):
+    """
+    Get entry logs, newest first. The body stays a plain list; when more rows
+    exist the cursor for the next page is returned in the X-Next-Cursor header.
+    """
+    rows = (await db.execute(log_query(cursor=cursor).limit(limit + 1))).all()
+    logs, next_cursor = paginate(rows, limit)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    
+    return FastJSONResponse(log_records(logs), headers=headers)
+
+@router.get("/api/logs/export", dependencies=SQLITE_ONLY)
+async def export_logs(fmt: str = Query("ndjson", alias="format"),
+                      since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Stream entry logs (optionally within [since, until)) as NDJSON or CSV"""
+    check_export_format(fmt)
+    where = []
+    if since:
+        where.append(EntryLog.entry_time >= since)
+    if until:
+        where.append(EntryLog.entry_time < until)
+    return export_response(log_query(*where), LOG_FIELDS, serialize_log, fmt, "entry-logs")
+
+async def rollup_stats(db: AsyncSession, granularity: str, since: datetime, until: datetime):
+    """Rollup rows for buckets in [since, until), oldest first"""
+    where = (
+        TrafficRollup.granularity == granularity,
+        TrafficRollup.bucket_start >= since,
+        TrafficRollup.bucket_start < until,
+    )
+    rollups = (await db.scalars(select(TrafficRollup).where(*where).order_by(TrafficRollup.bucket_start))).all()
+    
+    bins = {}
+    result = await db.execute(
+        select(TrafficDurationBin.bucket_start, TrafficDurationBin.bin, TrafficDurationBin.count)
+        .where(
+            TrafficDurationBin.granularity == granularity,
+            TrafficDurationBin.bucket_start >= since,
+            TrafficDurationBin.bucket_start < until,
+        )
+    )
+    for bucket_start, index, count in result:
+        bins.setdefault(bucket_start, {})[index] = count
+    
+    return {
+        "granularity": granularity,
+        "buckets": [serialize_rollup(rollup, bins.get(rollup.bucket_start, {})) for rollup in rollups]
+    }
+
+@router.get("/api/stats/hourly", dependencies=SQLITE_ONLY)
+async def get_hourly_stats(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                           db: AsyncSession = Depends(get_db)):
+    """Traffic per hour (default: the last 24 hours) from the rollup tables"""
+    until = until or get_ist_now()
+    since = since or until - timedelta(hours=24)
+    return await rollup_stats(db, "hour", since.replace(minute=0, second=0, microsecond=0), until)
+
+@router.get("/api/stats/daily", dependencies=SQLITE_ONLY)
+async def get_daily_stats(since: Optional[datetime] = None, until: Optional[datetime] = None,
+                          db: AsyncSession = Depends(get_db)):
+    """Traffic per day (default: the last 30 days) from the rollup tables"""
+    until = until or get_ist_now()
+    since = since or until - timedelta(days=30)
+    return await rollup_stats(db, "day", since.replace(hour=0, minute=0, second=0, microsecond=0), until)
+
+# One report at a time: each refreshes the shared column cache
+_report_lock = asyncio.Lock()
+
+def build_suspicion_report(thresholds, top):
+    with get_engine().connect() as conn:
+        arrays = analytics.load_log_arrays(conn, ANALYTICS_CACHE_DIR)
+    return analytics.suspicion_report(arrays, thresholds, top)
+
+@router.get("/api/reports/suspicious", dependencies=SQLITE_ONLY)
+async def get_suspicion_report(
+    short_window_minutes: float = Query(analytics.DEFAULT_THRESHOLDS["short_window_minutes"], gt=0),
+    short_window_prior: int = Query(analytics.DEFAULT_THRESHOLDS["short_window_prior"], ge=1),
+    long_window_minutes: float = Query(analytics.DEFAULT_THRESHOLDS["long_window_minutes"], gt=0),
+    long_window_prior: int = Query(analytics.DEFAULT_THRESHOLDS["long_window_prior"], ge=1),
+    max_duration_minutes: float = Query(analytics.DEFAULT_THRESHOLDS["max_duration_minutes"], gt=0),
+    top: int = Query(20, ge=1, le=1000),
+):
+    """Re-run the suspicion rules over the full history with the given thresholds"""
+    thresholds = {
+        "short_window_minutes": short_window_minutes,
+        "short_window_prior": short_window_prior,
+        "long_window_minutes": long_window_minutes,
+        "long_window_prior": long_window_prior,
+        "max_duration_minutes": max_duration_minutes,
+    }
+    try:
+        async with _report_lock:
+            # CPU-bound: keep it off the event loop
+            return await asyncio.to_thread(build_suspicion_report, thresholds, top)
+    except analytics.AnalyticsUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Request, stage, query and pool timings in Prometheus text format"""
+    registry = registry_cache.stats()
+    body = render_metrics(
+        gauges=[
+            ("gate_registry_cache_size", "Registered plates held in memory", registry["size"]),
+            ("gate_tracked_plates", "Plates with entries inside the frequency windows", len(entry_tracker)),
+            ("gate_event_subscribers", "Connected live event streams", len(event_broker.subscribers)),
+            ("gate_group_commit_pending", "Gate writes waiting for their group commit", len(group_commit)),
+        ],
+        counters=[
+            ("gate_registry_cache_hits_total", "Registry lookups for registered plates", registry["hits"]),
+            ("gate_registry_cache_misses_total", "Registry lookups for unregistered plates", registry["misses"]),
+            ("gate_cache_syncs_total", "Cache refreshes after writes by other workers", cache_coherence.syncs),
+            ("gate_archived_logs_total", "Entry logs moved to the archive by this process", retention.archived_total),
+            ("gate_events_published_total", "Gate events published to the live stream", event_broker.published),
+            ("gate_events_relayed_total", "Scans by other workers relayed to the live stream", event_relay.relayed),
+            ("gate_event_subscribers_dropped_total", "Stream subscribers disconnected for falling behind", event_broker.dropped),
+            ("gate_group_commits_total", "Group commit batches committed", group_commit.commits),
+            ("gate_group_commit_rejected_total", "Queued exits whose entry was already closed", group_commit.rejected),
+        ],
+    )
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    uvicorn.run(create_app(), host="0.0.0.0", port=8000)
 
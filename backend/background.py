@@ -0,0 +1,37 @@
+"""
+Helpers for periodic background jobs started from the FastAPI lifespan.
+"""
+
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+async def run_periodically(interval: float, func, *args):
+    """Call func(*args) every `interval` seconds until cancelled"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            result = func(*args)
+            if asyncio.iscoroutine(result):
+                await result
+        except Exception:
+            logger.exception("Periodic job %s failed", getattr(func, "__name__", func))
+
+
+async def cancel_tasks(tasks):
+    """Cancel background tasks and wait for them to finish"""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def retry_until_done(func, *args, delay: float = 1.0):
+    """Await func(*args) until it succeeds, trying again `delay` seconds after each failure"""
+    while True:
+        try:
+            return await func(*args)
+        except Exception:
+            logger.exception("Background job %s failed, retrying", getattr(func, "__name__", func))
+            await asyncio.sleep(delay)
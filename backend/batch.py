@@ -0,0 +1,302 @@
+"""
+Batch replay of gate events buffered by offline devices.
+
+Each event carries its own timestamp and an idempotency key. Events are
+evaluated with the same rules as /api/check-entry and /api/check-exit, but
+against the event's timestamp instead of the current time, and the whole
+batch is written in one transaction. Keys of applied events are stored in
+processed_events (entry and exit keys separately), so replaying a batch
+returns the original results instead of logging the scans twice.
+
+Exits are applied in timestamp order, each to the latest visit of its
+plate that began at or before it and is still open. A visit abandoned by
+a later entry (see trg_active_entry) still counts as open for exits up
+to that entry, so visits replayed from a device's buffer pair up with
+their own exits.
+"""
+
+import asyncio
+import json
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import timedelta
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import ActiveEntry, EntryLog, ProcessedEvent
+from backend.frequency import entry_tracker
+from backend.repository import SQLiteRepository
+from backend.rules import Scan, suspicion_rules
+from backend.timezone_utils import get_ist_datetime
+from backend.utils import (
+    check_exit_rules,
+    check_registered,
+    entry_message,
+    exit_message,
+    format_duration,
+    suspicious_reason,
+)
+
+# Attempts of an exit batch whose visits were closed concurrently, and the
+# seconds before the first retry (doubled for each further one)
+EXIT_BATCH_ATTEMPTS = 3
+EXIT_BATCH_BACKOFF = 0.02
+
+
+async def _replayed_results(db: AsyncSession, kind, events):
+    """Stored results for idempotency keys of this kind that were already applied"""
+    keys = {event.idempotency_key for event in events}
+    rows = await db.scalars(
+        select(ProcessedEvent).where(ProcessedEvent.kind == kind, ProcessedEvent.idempotency_key.in_(keys))
+    )
+    return {row.idempotency_key: json.loads(row.result) for row in rows}
+
+
+async def _commit_or_replay(db: AsyncSession, apply, events):
+    """
+    Commit the batch, or, when a concurrent replay stored one of its keys
+    first, roll back and apply it again (its events then come back as
+    duplicates with the stored results)
+    """
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        return await apply(db, events)
+    return None
+
+
+def _split_new(events, replayed):
+    """Separate duplicate events from new ones, ordering new ones by timestamp"""
+    results = {}
+    new_events = []
+    seen = set()
+    for event in events:
+        key = event.idempotency_key
+        if key in replayed:
+            results[key] = {**replayed[key], "status": "duplicate"}
+        elif key not in seen:
+            # A key repeated within the batch shares the first event's result
+            seen.add(key)
+            new_events.append(event)
+    new_events.sort(key=lambda event: get_ist_datetime(event.timestamp))
+    return results, new_events
+
+
+async def apply_entry_batch(db: AsyncSession, events):
+    """Apply entry events in one transaction. Returns per-event results in request order."""
+    replayed = await _replayed_results(db, "entry", events)
+    results, new_events = _split_new(events, replayed)
+    if not new_events:
+        return [results[event.idempotency_key] for event in events]
+
+    # Prior entry times per plate covering every event's widest rule window,
+    # fetched with one query instead of COUNTs per event
+    plates = {event.plate_number for event in new_events}
+    widest = suspicion_rules.windows[-1] if suspicion_rules.windows else timedelta(0)
+    earliest = get_ist_datetime(new_events[0].timestamp) - widest
+    latest = get_ist_datetime(new_events[-1].timestamp)
+    rows = await db.execute(
+        select(EntryLog.plate_number, EntryLog.entry_time)
+        .where(EntryLog.plate_number.in_(plates), EntryLog.entry_time >= earliest, EntryLog.entry_time <= latest)
+        .order_by(EntryLog.entry_time)
+    )
+    history = defaultdict(list)
+    for plate_number, entry_time in rows:
+        history[plate_number].append(entry_time)
+
+    repository = SQLiteRepository(db)
+    registered = {plate: await check_registered(repository, plate) for plate in plates}
+
+    logs = []
+    for event in new_events:
+        plate_number = event.plate_number
+        entry_time = get_ist_datetime(event.timestamp)
+        is_registered, vehicle_type = registered[plate_number]
+
+        # Entries strictly before this event, counted like the entry tracker does
+        times = history[plate_number]
+        before = bisect_left(times, entry_time)
+        def prior(window):
+            return before - bisect_left(times, entry_time - window)
+
+        triggered = suspicion_rules.check_entry(Scan(entry_time, is_registered, vehicle_type, prior=prior))
+        is_suspicious = bool(triggered)
+        reason = suspicious_reason(triggered)
+
+        # Later events in the batch see this one
+        history[plate_number].insert(bisect_left(history[plate_number], entry_time), entry_time)
+
+        logs.append({
+            "plate_number": plate_number,
+            "entry_time": entry_time,
+            "is_registered": is_registered,
+            "is_suspicious": is_suspicious,
+        })
+        results[event.idempotency_key] = {
+            "idempotency_key": event.idempotency_key,
+            "status": "applied",
+            "plate_number": plate_number,
+            "entry_time": entry_time.isoformat(),
+            "is_registered": is_registered,
+            "is_suspicious": is_suspicious,
+            "suspicious_reason": reason,
+            "triggered_rules": [rule.name for rule in triggered],
+            "message": entry_message(is_registered, is_suspicious, reason),
+        }
+
+    # One multi-row INSERT for the logs; trg_active_entry puts the newest
+    # entry per plate on campus unless a newer live entry is already there.
+    # RETURNING rows come back in no particular order (SQLite has no insert
+    # sentinel, and asking for parameter order would split the INSERT per
+    # row), so each carries its own plate and time.
+    inserted = (await db.execute(
+        insert(EntryLog).returning(EntryLog.id, EntryLog.plate_number, EntryLog.entry_time),
+        logs,
+    )).all()
+    log_ids = defaultdict(list)
+    for log_id, plate_number, entry_time in inserted:
+        log_ids[plate_number, entry_time].append(log_id)
+    for event, log in zip(new_events, logs):
+        results[event.idempotency_key]["log_id"] = log_ids[log["plate_number"], log["entry_time"]].pop()
+
+    _store_results(db, "entry", new_events, results)
+    replay = await _commit_or_replay(db, apply_entry_batch, events)
+    if replay is not None:
+        return replay
+
+    for log_id, plate_number, entry_time in inserted:
+        entry_tracker.record(plate_number, entry_time, log_id)
+    return [results[event.idempotency_key] for event in events]
+
+
+class _VisitClosed(Exception):
+    """A visit read by the batch was closed by a concurrent request"""
+
+
+async def apply_exit_batch(db: AsyncSession, events):
+    """
+    Apply exit events in one transaction. Returns per-event results in request order.
+
+    When a concurrent request closes a visit the batch read, the batch is
+    applied again on fresh state, EXIT_BATCH_ATTEMPTS times at most; in the
+    last attempt such exits fail instead (they can be sent again).
+    """
+    for attempt in range(EXIT_BATCH_ATTEMPTS):
+        try:
+            return await _apply_exit_batch(db, events, final=attempt == EXIT_BATCH_ATTEMPTS - 1)
+        except _VisitClosed:
+            await db.rollback()
+            await asyncio.sleep(EXIT_BATCH_BACKOFF * 2 ** attempt)
+
+
+async def _apply_exit_batch(db: AsyncSession, events, final):
+    replayed = await _replayed_results(db, "exit", events)
+    results, new_events = _split_new(events, replayed)
+    if not new_events:
+        return [results[event.idempotency_key] for event in events]
+
+    # Open and abandoned visits of every plate, oldest first, fetched at once
+    plates = {event.plate_number for event in new_events}
+    rows = await db.execute(
+        select(EntryLog.id, EntryLog.plate_number, EntryLog.entry_time, EntryLog.abandoned_at,
+               EntryLog.is_registered, EntryLog.is_suspicious)
+        .where(EntryLog.plate_number.in_(plates), EntryLog.exit_time.is_(None))
+        .order_by(EntryLog.entry_time)
+    )
+    visits = defaultdict(list)
+    for row in rows:
+        visits[row.plate_number].append(row)
+    repository = SQLiteRepository(db)
+
+    applied = []
+    closed = []
+    for event in new_events:
+        plate_number = event.plate_number
+        exit_time = get_ist_datetime(event.timestamp)
+        entry_log = _open_visit(visits[plate_number], exit_time)
+
+        if entry_log is None:
+            # An open visit that began after the exit: out-of-order timestamps
+            later = any(visit.entry_time > exit_time for visit in visits[plate_number])
+            detail = "Exit timestamp is before the entry time" if later else "No active entry found for this vehicle"
+            results[event.idempotency_key] = _error(event, detail)
+            continue
+
+        duration = (exit_time - entry_log.entry_time).total_seconds() / 60
+        _, vehicle_type = await check_registered(repository, plate_number)
+        triggered = check_exit_rules(duration, entry_log.is_registered, vehicle_type, now=exit_time)
+        is_suspicious_dur = bool(triggered)
+
+        # Guarded on the visit still being open: a concurrent request may
+        # have closed it since it was read
+        updated = await db.execute(
+            update(EntryLog)
+            .where(EntryLog.id == entry_log.id, EntryLog.exit_time.is_(None))
+            .values(
+                exit_time=exit_time,
+                abandoned_at=None,
+                duration_minutes=duration,
+                is_suspicious=entry_log.is_suspicious or is_suspicious_dur,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        if not updated.rowcount:
+            if not final:
+                raise _VisitClosed()
+            results[event.idempotency_key] = _error(event, "The entry was closed by a concurrent request")
+            continue
+        visits[plate_number].remove(entry_log)
+        closed.append(entry_log.id)
+        applied.append(event)
+
+        results[event.idempotency_key] = {
+            "idempotency_key": event.idempotency_key,
+            "status": "applied",
+            "log_id": entry_log.id,
+            "plate_number": plate_number,
+            "entry_time": entry_log.entry_time.isoformat(),
+            "exit_time": exit_time.isoformat(),
+            "duration_minutes": duration,
+            "duration_formatted": format_duration(duration),
+            "is_suspicious": is_suspicious_dur,
+            "triggered_rules": [rule.name for rule in triggered],
+            "message": exit_message(duration, is_suspicious_dur, suspicious_reason(triggered)),
+        }
+
+    if closed:
+        await db.execute(delete(ActiveEntry).where(ActiveEntry.entry_log_id.in_(closed)))
+    _store_results(db, "exit", applied, results)
+    replay = await _commit_or_replay(db, apply_exit_batch, events)
+    if replay is not None:
+        return replay
+    return [results[event.idempotency_key] for event in events]
+
+
+def _open_visit(visits, exit_time):
+    """
+    Latest visit (oldest first list) that began at or before exit_time and
+    was open then: still open, or abandoned at or after exit_time
+    """
+    for visit in reversed(visits[:bisect_right([visit.entry_time for visit in visits], exit_time)]):
+        if visit.abandoned_at is None or visit.abandoned_at >= exit_time:
+            return visit
+    return None
+
+
+def _error(event, detail):
+    return {"idempotency_key": event.idempotency_key, "status": "error", "detail": detail}
+
+
+def _store_results(db: AsyncSession, kind, events, results):
+    """Remember applied events so replays are answered from processed_events"""
+    db.add_all([
+        ProcessedEvent(
+            idempotency_key=event.idempotency_key,
+            kind=kind,
+            result=json.dumps(results[event.idempotency_key])
+        )
+        for event in events
+    ])
@@ -0,0 +1,165 @@
+"""
+Bulk registry import and export.
+
+Uploads (CSV with a header row, or NDJSON with one object per line) are
+parsed chunk by chunk from the spooled upload file in a worker thread, so
+memory stays bounded by the chunk size and the event loop keeps serving
+the gates. Within a chunk a repeated plate keeps its last row, and rows
+that match the registry are skipped; the rest are upserted with one
+executemany INSERT ... ON CONFLICT DO UPDATE and committed on their own,
+which lets gate writes interleave with a long import. Invalid rows are
+skipped and reported with their line number.
+
+Columns: plate_number and owner_name are required, vehicle_type defaults
+to "Unknown". Exports use the same columns, so an export can be imported
+again as-is.
+"""
+
+import asyncio
+import codecs
+import csv
+import json
+from itertools import islice
+
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.database import Vehicle, serialized_write
+from backend.plates import normalize_plate
+from backend.registry import registry_cache
+
+VEHICLE_FIELDS = ["plate_number", "owner_name", "vehicle_type", "registered_date"]
+VEHICLE_COLUMNS = tuple(getattr(Vehicle, field) for field in VEHICLE_FIELDS)
+
+# Rows parsed per worker thread call, and upserted (at most) per
+# executemany / commit
+IMPORT_CHUNK_SIZE = 1000
+
+# Row errors listed in the response (all of them are counted)
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(ValueError):
+    """The upload can't be parsed at all (bad header, wrong encoding)"""
+
+
+def serialize_vehicle(row):
+    """Export representation of a VEHICLE_COLUMNS row"""
+    return {
+        "plate_number": row.plate_number,
+        "owner_name": row.owner_name,
+        "vehicle_type": row.vehicle_type,
+        "registered_date": row.registered_date.isoformat() if row.registered_date else None,
+    }
+
+
+def _csv_records(text_file):
+    reader = csv.DictReader(text_file)
+    if not reader.fieldnames or not {"plate_number", "owner_name"} <= set(reader.fieldnames):
+        raise ImportFormatError("CSV header must include plate_number and owner_name")
+    for record in reader:
+        # Header is line 1; quoted newlines make reader.line_num the safe choice
+        yield reader.line_num, record
+
+
+def _ndjson_records(text_file):
+    for line_number, line in enumerate(text_file, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_number, None
+            continue
+        yield line_number, record if isinstance(record, dict) else None
+
+
+def parse_upload(binary_file, fmt):
+    """
+    Yield (line, values, error) for every row of an uploaded file; exactly
+    one of values (a dict ready for the vehicles table) and error is set.
+    """
+    text_file = codecs.getreader("utf-8-sig")(binary_file)
+    records = _csv_records(text_file) if fmt == "csv" else _ndjson_records(text_file)
+    try:
+        for line, record in records:
+            if record is None:
+                yield line, None, "Invalid JSON object"
+                continue
+            plate_number = normalize_plate(str(record.get("plate_number") or ""))
+            owner_name = str(record.get("owner_name") or "").strip()
+            if not plate_number:
+                yield line, None, "Missing or invalid plate_number"
+            elif not owner_name:
+                yield line, None, "Missing owner_name"
+            else:
+                yield line, {
+                    "plate_number": plate_number,
+                    "owner_name": owner_name,
+                    "vehicle_type": str(record.get("vehicle_type") or "").strip() or "Unknown",
+                }, None
+    except UnicodeDecodeError:
+        raise ImportFormatError("Upload must be UTF-8 encoded")
+    except csv.Error as e:
+        raise ImportFormatError(f"Malformed CSV: {e}")
+
+
+async def _upsert_chunk(db: AsyncSession, rows):
+    """Upsert one chunk; returns how many plates were created and updated"""
+    # A plate repeated in the chunk keeps its last row
+    rows = list({row["plate_number"]: row for row in rows}.values())
+    existing = {
+        plate_number: (owner_name, vehicle_type)
+        for plate_number, owner_name, vehicle_type in await db.execute(
+            select(Vehicle.plate_number, Vehicle.owner_name, Vehicle.vehicle_type)
+            .where(Vehicle.plate_number.in_([row["plate_number"] for row in rows]))
+        )
+    }
+    rows = [
+        row for row in rows
+        if existing.get(row["plate_number"]) != (row["owner_name"], row["vehicle_type"])
+    ]
+    if not rows:
+        return 0, 0
+    upsert = sqlite_insert(Vehicle)
+    async with serialized_write():
+        await db.execute(
+            upsert.on_conflict_do_update(
+                index_elements=[Vehicle.plate_number],
+                set_={"owner_name": upsert.excluded.owner_name, "vehicle_type": upsert.excluded.vehicle_type},
+            ),
+            rows,
+        )
+        await db.commit()
+    for row in rows:
+        registry_cache.add(row["plate_number"], row["vehicle_type"])
+    created = sum(row["plate_number"] not in existing for row in rows)
+    return created, len(rows) - created
+
+
+def _next_rows(rows):
+    """The next IMPORT_CHUNK_SIZE parsed rows (blocking: reads the upload)"""
+    return list(islice(rows, IMPORT_CHUNK_SIZE))
+
+
+async def import_vehicles(db: AsyncSession, binary_file, fmt: str):
+    """Import an uploaded CSV/NDJSON file. Returns counts and per-row errors."""
+    report = {"rows": 0, "created": 0, "updated": 0, "error_count": 0, "errors": []}
+    rows = parse_upload(binary_file, fmt)
+
+    while parsed := await asyncio.to_thread(_next_rows, rows):
+        chunk = []
+        for line, values, error in parsed:
+            report["rows"] += 1
+            if error:
+                report["error_count"] += 1
+                if len(report["errors"]) < MAX_REPORTED_ERRORS:
+                    report["errors"].append({"line": line, "error": error})
+                continue
+            chunk.append(values)
+        if chunk:
+            created, updated = await _upsert_chunk(db, chunk)
+            report["created"] += created
+            report["updated"] += updated
+    return report
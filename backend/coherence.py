@@ -0,0 +1,130 @@
+"""
+Keeps the in-process caches of several workers coherent.
+
+Each uvicorn worker has its own registry cache and entry tracker. Every
+CACHE_SYNC_INTERVAL seconds a worker reads SQLite's PRAGMA data_version on
+a dedicated connection; the value only changes after another connection
+committed, so an idle database costs one PRAGMA per poll. When it changes:
+
+- the registry is reloaded if cache_versions['vehicles'] (bumped by
+  triggers on the vehicles table) moved
+- entry_logs rows with ids above the tracker's high-water mark are fed to
+  the entry tracker (rows this worker recorded itself are skipped)
+- the event relay publishes the entries and exits committed since the last
+  poll to this worker's live event stream (see backend/events.py)
+"""
+
+from sqlalchemy import func, select
+
+from backend.database import CacheVersion, EntryLog, get_async_engine, new_session
+from backend.events import event_broker, publish_scan
+from backend.frequency import entry_tracker
+from backend.registry import registry_cache
+from backend.utils import format_duration
+
+RELAY_COLUMNS = (
+    EntryLog.id, EntryLog.plate_number, EntryLog.entry_time, EntryLog.exit_time,
+    EntryLog.duration_minutes, EntryLog.is_registered, EntryLog.is_suspicious,
+)
+
+# Bound parameters per IN (...) lookup of closed entries
+RELAY_CHUNK = 500
+
+
+class EventRelay:
+    """
+    Finds scans in entry_logs: entries by id above a high-water mark, exits
+    as ids that left the set of rows with no exit_time (the partial index
+    ix_entry_logs_open_plate_entry_time covers that scan). Scans this
+    worker published itself are skipped by EventBroker.claim().
+    """
+
+    def __init__(self):
+        self.last_log_id = None
+        self.open_ids = set()
+        self.relayed = 0
+
+    async def _open_ids(self, db):
+        return set(await db.scalars(select(EntryLog.id).where(EntryLog.exit_time.is_(None))))
+
+    async def sync(self, db):
+        if self.last_log_id is None:
+            self.last_log_id = await db.scalar(select(func.max(EntryLog.id))) or 0
+            self.open_ids = await self._open_ids(db)
+            event_broker.relaying = True
+            return
+
+        entries = (await db.execute(
+            select(*RELAY_COLUMNS).where(EntryLog.id > self.last_log_id).order_by(EntryLog.id)
+        )).all()
+        open_ids = await self._open_ids(db)
+        closed = sorted((self.open_ids | {row.id for row in entries}) - open_ids)
+        exits = []
+        for start in range(0, len(closed), RELAY_CHUNK):
+            exits.extend((await db.execute(
+                select(*RELAY_COLUMNS)
+                .where(EntryLog.id.in_(closed[start:start + RELAY_CHUNK]), EntryLog.exit_time.is_not(None))
+            )).all())
+        if entries:
+            self.last_log_id = entries[-1].id
+        self.open_ids = open_ids
+
+        for row in entries:
+            self._publish("entry", row, {})
+        for row in sorted(exits, key=lambda row: row.exit_time):
+            self._publish("exit", row, {
+                "exit_time": row.exit_time,
+                "duration_minutes": row.duration_minutes,
+                "duration_formatted": format_duration(row.duration_minutes),
+            })
+
+    def _publish(self, kind, row, extra):
+        self.relayed += publish_scan(kind, {
+            "log_id": row.id,
+            "plate_number": row.plate_number,
+            "entry_time": row.entry_time,
+            **extra,
+            "is_registered": row.is_registered,
+            "is_suspicious": row.is_suspicious,
+        })
+
+
+event_relay = EventRelay()
+
+
+class CacheCoherence:
+    """Polls the database for writes made by other workers"""
+
+    def __init__(self):
+        self._conn = None
+        self.data_version = None
+        self.registry_version = None
+        self.syncs = 0
+
+    async def poll(self):
+        if self._conn is None:
+            self._conn = await get_async_engine().connect()
+        data_version = (await self._conn.exec_driver_sql("PRAGMA data_version")).scalar()
+        await self._conn.rollback()
+        if data_version == self.data_version:
+            return
+        self.data_version = data_version
+
+        async with new_session() as db:
+            registry_version = await db.scalar(
+                select(CacheVersion.version).where(CacheVersion.name == "vehicles")
+            )
+            if registry_version != self.registry_version:
+                await registry_cache.load(db)
+                self.registry_version = registry_version
+            await entry_tracker.sync(db)
+            await event_relay.sync(db)
+        self.syncs += 1
+
+    async def close(self):
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+
+cache_coherence = CacheCoherence()
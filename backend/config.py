@@ -0,0 +1,85 @@
+"""
+Runtime settings for the backend, read from environment variables.
+"""
+
+import os
+
+# Seconds between full reloads of the registered-plate cache, so several
+# workers converge on the same registry (0 disables the periodic refresh)
+REGISTRY_REFRESH_SECONDS = float(os.environ.get("REGISTRY_REFRESH_SECONDS", "300"))
+
+# SQLite performance profile, applied to every new connection
+SQLITE_PRAGMAS = {
+    # Only takes effect on a new database (existing ones need a VACUUM, see
+    # `python -m backend.retention --convert`); lets retention hand freed
+    # pages back to the filesystem with incremental vacuums
+    "auto_vacuum": os.environ.get("SQLITE_AUTO_VACUUM", "INCREMENTAL"),
+    "journal_mode": os.environ.get("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("SQLITE_SYNCHRONOUS", "NORMAL"),
+    # Negative values are in KiB (64 MB page cache)
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", "-64000")),
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": os.environ.get("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+# Queue writes from the gate and admin endpoints behind a single writer
+# instead of letting them contend for the SQLite write lock (off by default:
+# it removes "database is locked" errors but lowers write throughput)
+SQLITE_SERIALIZE_WRITES = os.environ.get("SQLITE_SERIALIZE_WRITES", "0") == "1"
+
+# Log a timing breakdown (stages and SQL statements) for any request slower
+# than this many milliseconds (0 disables the slow-request log)
+SLOW_REQUEST_MS = float(os.environ.get("SLOW_REQUEST_MS", "0"))
+
+# Column cache for the analytics reports (memory-mapped .npy files)
+ANALYTICS_CACHE_DIR = os.environ.get("ANALYTICS_CACHE_DIR", "./analytics_cache")
+
+# JSON file with the suspicion rules (see backend/rules.py); empty uses the
+# built-in rules
+SUSPICION_RULES_FILE = os.environ.get("SUSPICION_RULES_FILE", "")
+
+# Seconds between checks for writes made by other worker processes, which
+# keep each worker's registry cache, entry tracker and live event stream in
+# step (0 disables; a single worker does not need it, and `run.py --prod`
+# sets it to 0.5 when it starts several workers)
+CACHE_SYNC_INTERVAL = float(os.environ.get("CACHE_SYNC_INTERVAL", "0"))
+
+# Data retention (see backend/retention.py): closed entry logs older than
+# RETENTION_DAYS are moved to date-partitioned archive files every
+# RETENTION_INTERVAL seconds (0 days keeps everything in the database)
+RETENTION_DAYS = float(os.environ.get("RETENTION_DAYS", "0"))
+RETENTION_INTERVAL = float(os.environ.get("RETENTION_INTERVAL", "3600"))
+RETENTION_BATCH_SIZE = int(os.environ.get("RETENTION_BATCH_SIZE", "5000"))
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "./archive")
+# "ndjson" (gzipped) or "parquet" (needs pyarrow)
+ARCHIVE_FORMAT = os.environ.get("ARCHIVE_FORMAT", "ndjson")
+
+# Live event stream (see backend/events.py): events kept for Last-Event-ID
+# resumes, events buffered per subscriber before a slow one is disconnected,
+# and seconds between keepalive comments on an idle stream
+EVENT_HISTORY = int(os.environ.get("EVENT_HISTORY", "1000"))
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "256"))
+EVENT_HEARTBEAT_SECONDS = float(os.environ.get("EVENT_HEARTBEAT_SECONDS", "15"))
+
+# Storage behind the gate and vehicle endpoints (see backend/repository.py):
+# "sqlite", "firestore" (the Android app's collections, needs firebase-admin
+# and a service account key) or "memory" (in-process Firestore stand-in)
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "sqlite")
+FIREBASE_CREDENTIALS = os.environ.get("FIREBASE_CREDENTIALS", "firebase-admin-key.json")
+# Milliseconds a Firestore write waits for concurrent writes to share its batch
+FIRESTORE_BATCH_WINDOW_MS = float(os.environ.get("FIRESTORE_BATCH_WINDOW_MS", "5"))
+
+# Storage of entry/exit times (see backend/timestamps.py): "datetime"
+# strings or "epoch_ms" integers; existing rows are converted at startup
+TIMESTAMP_STORAGE = os.environ.get("TIMESTAMP_STORAGE", "datetime")
+
+# Write-behind group commit of the gate's entry and exit writes on SQLite
+# (see backend/group_commit.py): "off", "durable" (a scan's response waits
+# for its batch to commit) or "fast_ack" (it waits only for the local
+# journal). A batch is committed GROUP_COMMIT_WINDOW_MS after its first
+# write, or as soon as GROUP_COMMIT_MAX_WRITES are queued.
+GROUP_COMMIT = os.environ.get("GROUP_COMMIT", "off")
+GROUP_COMMIT_WINDOW_MS = float(os.environ.get("GROUP_COMMIT_WINDOW_MS", "5"))
+GROUP_COMMIT_MAX_WRITES = int(os.environ.get("GROUP_COMMIT_MAX_WRITES", "200"))
+GROUP_COMMIT_JOURNAL_DIR = os.environ.get("GROUP_COMMIT_JOURNAL_DIR", "./journal")
@@ -1,6 +1,18 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Boolean, Float
+import asyncio
+import time
+import zlib
+from contextlib import asynccontextmanager
+from functools import cache
+
+from sqlalchemy import create_engine, event, inspect, text, Column, Integer, String, DateTime, Boolean, Float, Index, ForeignKey
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 
+from backend import rollups
+from backend.config import SQLITE_PRAGMAS, SQLITE_SERIALIZE_WRITES, TIMESTAMP_STORAGE
+from backend.metrics import instrument_engine, observe_pool_wait
+from backend.plates import normalize_plate
+from backend.timestamps import Timestamp, convert_timestamps
 from backend.timezone_utils import get_ist_now
 
 
@@ -20,27 +32,439 @@ class EntryLog(Base):
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     plate_number = Column(String)
-    entry_time = Column(DateTime)
-    exit_time = Column(DateTime, nullable=True)
+    entry_time = Column(Timestamp)
+    exit_time = Column(Timestamp, nullable=True)
     duration_minutes = Column(Float, nullable=True)
     is_registered = Column(Boolean)
     is_suspicious = Column(Boolean, default=False)
     created_at = Column(DateTime, default=get_ist_now)
+    # Set when a later entry took the plate's on-campus row without an exit
+    # scan; exit_time stays NULL, as no exit was seen at the gate
+    abandoned_at = Column(Timestamp, nullable=True)
+    
+    __table_args__ = (
+        # Per-plate history, past entries and frequency windows
+        Index("ix_entry_logs_plate_entry_time", "plate_number", "entry_time"),
+        # /api/logs ordering
+        Index("ix_entry_logs_entry_time", "entry_time"),
+        # check_exit: open entries only (partial index)
+        Index(
+            "ix_entry_logs_open_plate_entry_time", "plate_number", "entry_time",
+            sqlite_where=text("exit_time IS NULL"),
+        ),
+    )
+
+class ActiveEntry(Base):
+    """Vehicles currently on campus: one row per plate, pointing at its open entry log"""
+    __tablename__ = "active_entries"
+    
+    plate_number = Column(String, primary_key=True)
+    entry_log_id = Column(Integer, ForeignKey("entry_logs.id"))
+    entry_time = Column(Timestamp)
+    is_registered = Column(Boolean)
+    is_suspicious = Column(Boolean, default=False)
+
+class ProcessedEvent(Base):
+    """Result of an applied batch gate event, keyed by the device's idempotency key and the event kind"""
+    __tablename__ = "processed_events"
+    
+    idempotency_key = Column(String, primary_key=True)
+    kind = Column(String, primary_key=True)
+    result = Column(String)
+    created_at = Column(DateTime, default=get_ist_now)
+
+class TrafficRollup(Base):
+    """Traffic totals for one hour or day, maintained by triggers (see backend.rollups)"""
+    __tablename__ = "traffic_rollups"
+    
+    granularity = Column(String, primary_key=True)  # "hour" or "day"
+    bucket_start = Column(DateTime, primary_key=True)
+    entries = Column(Integer, nullable=False, default=0)
+    exits = Column(Integer, nullable=False, default=0)
+    unique_plates = Column(Integer, nullable=False, default=0)
+    registered_entries = Column(Integer, nullable=False, default=0)
+    unregistered_entries = Column(Integer, nullable=False, default=0)
+    suspicious = Column(Integer, nullable=False, default=0)
+    duration_sum = Column(Float, nullable=False, default=0)
+    duration_min = Column(Float)
+    duration_max = Column(Float)
+
+class TrafficRollupPlate(Base):
+    """Plates already counted in a rollup bucket (for unique_plates)"""
+    __tablename__ = "traffic_rollup_plates"
+    
+    granularity = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    plate_number = Column(String, primary_key=True)
+
+class TrafficDurationBin(Base):
+    """Histogram of visit durations per rollup bucket (bins in rollups.DURATION_BINS)"""
+    __tablename__ = "traffic_duration_bins"
+    
+    granularity = Column(String, primary_key=True)
+    bucket_start = Column(DateTime, primary_key=True)
+    bin = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+class ArchiveHorizon(Base):
+    """First day whose rollups entry_logs still holds every row of (see backend.retention)"""
+    __tablename__ = "archive_horizon"
+    
+    id = Column(Integer, primary_key=True)  # a single row, id 1
+    rollups_from = Column(DateTime, nullable=False)
+
+class JournalCheckpoint(Base):
+    """Last write of a group-commit journal file applied to the database (see backend.group_commit)"""
+    __tablename__ = "journal_checkpoints"
+    
+    journal = Column(String, primary_key=True)
+    seq = Column(Integer, nullable=False)
+
+class CacheVersion(Base):
+    """Change counters bumped by triggers, polled by workers to invalidate their caches"""
+    __tablename__ = "cache_versions"
+    
+    name = Column(String, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
 
 # SQLite database
+# The API uses the async engine (aiosqlite) so queries never block the event
+# loop; the sync engine is kept for scripts and offline tools. Both are
+# created on first use, so importing the app stays cheap.
 DATABASE_URL = "sqlite:///./vehicle_tracking.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ASYNC_DATABASE_URL = "sqlite+aiosqlite:///./vehicle_tracking.db"
 
-def init_db():
-    """Initialize database tables"""
-    Base.metadata.create_all(bind=engine)
+def sqlite_profile(pragmas):
+    """Build a connect listener that applies the given PRAGMAs"""
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # Setting auto_vacuum takes the write lock (a busy writer makes the
+        # connect fail) and only matters before the first table is created
+        cursor.execute("PRAGMA page_count")
+        new_database = cursor.fetchone()[0] == 0
+        for name, value in pragmas.items():
+            if name != "auto_vacuum" or new_database:
+                cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+    return apply_pragmas
 
-def get_db():
-    """Get database session"""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+@cache
+def get_engine():
+    """The sync engine, for scripts, offline tools and blocking jobs run in threads"""
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+    event.listen(engine, "connect", sqlite_profile(SQLITE_PRAGMAS))
+    return engine
+
+@cache
+def get_async_engine():
+    """The async engine the API runs on"""
+    async_engine = create_async_engine(ASYNC_DATABASE_URL)
+    event.listen(async_engine.sync_engine, "connect", sqlite_profile(SQLITE_PRAGMAS))
+    instrument_engine(async_engine.sync_engine)
+    return async_engine
+
+@cache
+def _async_sessionmaker():
+    return async_sessionmaker(get_async_engine(), autoflush=False, expire_on_commit=False)
+
+def new_session():
+    """A new AsyncSession on the async engine (use as `async with new_session() as db`)"""
+    return _async_sessionmaker()()
 
+_LAZY_ATTRIBUTES = {
+    "engine": get_engine,
+    "async_engine": get_async_engine,
+    "SessionLocal": lambda: sessionmaker(autocommit=False, autoflush=False, bind=get_engine()),
+    "AsyncSessionLocal": _async_sessionmaker,
+}
+
+def __getattr__(name):
+    # `from backend.database import engine` and friends keep working for
+    # scripts; the objects are only built when first imported this way
+    if name in _LAZY_ATTRIBUTES:
+        value = _LAZY_ATTRIBUTES[name]()
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Single-writer serialization: SELECTs don't open a transaction in sqlite3,
+# so holding this lock from the first write to the commit is enough to keep
+# this process's writers from contending for the database lock
+_write_lock = asyncio.Lock()
+
+@asynccontextmanager
+async def serialized_write():
+    """Queue behind other writers when SQLITE_SERIALIZE_WRITES is on"""
+    if not SQLITE_SERIALIZE_WRITES:
+        yield
+        return
+    async with _write_lock:
+        yield
+
+async def init_db():
+    """Initialize database tables (a no-op apart from two PRAGMA reads once the schema is current)"""
+    async with get_async_engine().begin() as conn:
+        if await conn.run_sync(schema_current):
+            return
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate_db)
+
+def _backfill_active_entries(conn):
+    """Seed active_entries with the latest open entry of every plate"""
+    # Rows are inserted oldest first, so the latest open entry wins
+    conn.execute(text("""
+        INSERT OR REPLACE INTO active_entries
+            (plate_number, entry_log_id, entry_time, is_registered, is_suspicious)
+        SELECT plate_number, id, entry_time, is_registered, is_suspicious
+        FROM entry_logs
+        WHERE exit_time IS NULL
+        ORDER BY entry_time, id
+    """))
+
+def _create_traffic_rollups(conn):
+    """Install the rollup triggers and compute rollups for existing history"""
+    rollups.create_triggers(conn)
+    rollups.rebuild(conn)
+
+def _create_cache_version_triggers(conn):
+    """Bump cache_versions['vehicles'] on every change to the registry"""
+    for operation in ("INSERT", "UPDATE", "DELETE"):
+        name = f"trg_cache_version_vehicles_{operation.lower()}"
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text(f"""
+            CREATE TRIGGER {name} AFTER {operation} ON vehicles BEGIN
+                INSERT INTO cache_versions (name, version) VALUES ('vehicles', 1)
+                ON CONFLICT (name) DO UPDATE SET version = version + 1;
+            END
+        """))
+
+def _create_active_entry_trigger(conn):
+    """
+    Put every new open entry log on campus from inside its INSERT. The open
+    entry it replaces had no exit scan: it is marked abandoned at the new
+    entry time and keeps a NULL exit_time. An entry older than the plate's
+    on-campus entry (a batch replay or a concurrent scan committed late) is
+    abandoned at that entry's time instead.
+    """
+    conn.execute(text("DROP TRIGGER IF EXISTS trg_active_entry"))
+    conn.execute(text("""
+        CREATE TRIGGER trg_active_entry AFTER INSERT ON entry_logs
+        WHEN NEW.exit_time IS NULL
+        BEGIN
+            UPDATE entry_logs SET abandoned_at = (
+                SELECT entry_time FROM active_entries WHERE plate_number = NEW.plate_number
+            )
+            WHERE id = NEW.id AND EXISTS (
+                SELECT 1 FROM active_entries
+                WHERE plate_number = NEW.plate_number AND entry_time > NEW.entry_time
+            );
+            UPDATE entry_logs SET abandoned_at = NEW.entry_time
+            WHERE exit_time IS NULL AND abandoned_at IS NULL AND id = (
+                SELECT entry_log_id FROM active_entries
+                WHERE plate_number = NEW.plate_number AND entry_time <= NEW.entry_time
+            );
+            INSERT INTO active_entries (plate_number, entry_log_id, entry_time, is_registered, is_suspicious)
+            VALUES (NEW.plate_number, NEW.id, NEW.entry_time, NEW.is_registered, NEW.is_suspicious)
+            ON CONFLICT (plate_number) DO UPDATE SET
+                entry_log_id = excluded.entry_log_id,
+                entry_time = excluded.entry_time,
+                is_registered = excluded.is_registered,
+                is_suspicious = excluded.is_suspicious
+            WHERE active_entries.entry_time <= excluded.entry_time;
+        END
+    """))
+
+def _merge_vehicles(conn, old, new):
+    """
+    Fold the vehicle registered as `old` into the canonical row `new`: blank
+    fields are filled in and the earlier registration date is kept. Raises
+    ValueError when the two rows disagree, so the migration rolls back.
+    """
+    query = text("SELECT owner_name, vehicle_type, registered_date FROM vehicles WHERE plate_number = :plate")
+    keep = conn.execute(query, {"plate": new}).one()
+    other = conn.execute(query, {"plate": old}).one()
+    conflicts = [
+        f"{field} {keep_value!r} / {other_value!r}"
+        for field, keep_value, other_value in zip(("owner_name", "vehicle_type"), keep[:2], other[:2])
+        if keep_value and other_value and keep_value != other_value
+    ]
+    if conflicts:
+        raise ValueError(
+            f"Vehicles {new!r} and {old!r} are the same plate but differ in {', '.join(conflicts)}; "
+            f"delete or correct one of them and restart"
+        )
+    dates = [date for date in (keep.registered_date, other.registered_date) if date is not None]
+    conn.execute(text("""
+        UPDATE vehicles SET owner_name = :owner_name, vehicle_type = :vehicle_type, registered_date = :registered_date
+        WHERE plate_number = :new
+    """), {
+        "new": new,
+        "owner_name": keep.owner_name or other.owner_name,
+        "vehicle_type": keep.vehicle_type or other.vehicle_type,
+        "registered_date": min(dates) if dates else None,
+    })
+    conn.execute(text("DELETE FROM vehicles WHERE plate_number = :old"), {"old": old})
+
+def _normalize_plates(conn):
+    """
+    Rewrite stored plates in canonical form. A vehicle registered under two
+    spellings is merged into the canonical row; on-campus rows and rollups
+    are rebuilt when any log changed.
+    """
+    for plate_number in conn.execute(text("SELECT plate_number FROM vehicles")).scalars().all():
+        canonical = normalize_plate(plate_number)
+        if not canonical or canonical == plate_number:
+            continue
+        params = {"old": plate_number, "new": canonical}
+        if conn.execute(text("SELECT 1 FROM vehicles WHERE plate_number = :new"), params).first():
+            _merge_vehicles(conn, plate_number, canonical)
+        else:
+            conn.execute(text("UPDATE vehicles SET plate_number = :new WHERE plate_number = :old"), params)
+    
+    changed = False
+    for plate_number in conn.execute(text("SELECT DISTINCT plate_number FROM entry_logs")).scalars().all():
+        canonical = normalize_plate(plate_number or "")
+        if canonical and canonical != plate_number:
+            conn.execute(text("UPDATE entry_logs SET plate_number = :new WHERE plate_number = :old"),
+                         {"old": plate_number, "new": canonical})
+            changed = True
+    if changed:
+        conn.execute(text("DELETE FROM active_entries"))
+        _backfill_active_entries(conn)
+        rollups.rebuild(conn)
+
+def _close_abandoned_entries(conn):
+    """
+    Install the triggers that mark an abandoned entry on re-entry, then mark
+    the open entries earlier re-entries left behind (any open entry no
+    longer on campus) as abandoned at the plate's next entry time. Entries
+    abandoned by older versions were closed with that time as exit_time and
+    no duration; their exit_time is cleared.
+    """
+    columns = {column["name"] for column in inspect(conn).get_columns("entry_logs")}
+    if "abandoned_at" not in columns:
+        conn.execute(text(f"ALTER TABLE entry_logs ADD COLUMN abandoned_at {EntryLog.abandoned_at.type.compile(conn.dialect)}"))
+    conn.execute(text("""
+        UPDATE entry_logs SET abandoned_at = exit_time, exit_time = NULL
+        WHERE exit_time IS NOT NULL AND duration_minutes IS NULL
+    """))
+    rollups.create_triggers(conn)
+    _create_active_entry_trigger(conn)
+    conn.execute(text("""
+        UPDATE entry_logs SET abandoned_at = (
+            SELECT min(later.entry_time) FROM entry_logs AS later
+            WHERE later.plate_number = entry_logs.plate_number AND later.entry_time > entry_logs.entry_time
+        )
+        WHERE exit_time IS NULL AND abandoned_at IS NULL
+          AND id NOT IN (SELECT entry_log_id FROM active_entries WHERE entry_log_id IS NOT NULL)
+    """))
+
+def _key_processed_events_by_kind(conn):
+    """Rebuild processed_events keyed on (idempotency_key, kind), so entry and exit keys are separate"""
+    conn.execute(text("ALTER TABLE processed_events RENAME TO processed_events_old"))
+    ProcessedEvent.__table__.create(conn)
+    conn.execute(text("""
+        INSERT INTO processed_events (idempotency_key, kind, result, created_at)
+        SELECT idempotency_key, kind, result, created_at FROM processed_events_old
+    """))
+    conn.execute(text("DROP TABLE processed_events_old"))
+
+def _add_rollup_duration_range(conn):
+    """Track the shortest and longest visit per rollup bucket (bounds the percentile estimates)"""
+    columns = {column["name"] for column in inspect(conn).get_columns("traffic_rollups")}
+    for name in ("duration_min", "duration_max"):
+        if name not in columns:
+            conn.execute(text(f"ALTER TABLE traffic_rollups ADD COLUMN {name} FLOAT"))
+    rollups.create_triggers(conn)
+    rollups.rebuild(conn)
+
+# Data migrations run once per database, tracked with PRAGMA user_version
+DATA_MIGRATIONS = [
+    (1, _backfill_active_entries),
+    (2, _create_traffic_rollups),
+    (3, _create_cache_version_triggers),
+    (4, _normalize_plates),
+    (5, _create_active_entry_trigger),
+    (6, _close_abandoned_entries),
+    (7, _key_processed_events_by_kind),
+    # Count exits replayed onto abandoned visits
+    (8, rollups.create_triggers),
+    (9, _add_rollup_duration_range),
+    # Abandon entries that arrive older than the plate's on-campus entry
+    (10, _close_abandoned_entries),
+    # Mark abandoned entries with abandoned_at instead of an exit_time
+    (11, _close_abandoned_entries),
+]
+SCHEMA_VERSION = DATA_MIGRATIONS[-1][0]
+
+def _schema_fingerprint():
+    """
+    Checksum of everything create_all() and migrate_db() bring a database up
+    to: the tables and indexes by name, the data migrations and the
+    timestamp format. Stored in PRAGMA application_id after a migration.
+    """
+    parts = [str(SCHEMA_VERSION), TIMESTAMP_STORAGE]
+    for table in Base.metadata.sorted_tables:
+        parts.append(table.name)
+        parts.extend(sorted(index.name for index in table.indexes))
+    # application_id is a signed 32-bit integer
+    return zlib.crc32("\n".join(parts).encode()) & 0x7FFFFFFF
+
+SCHEMA_FINGERPRINT = _schema_fingerprint()
+
+def schema_current(conn):
+    """Whether migrate_db() last ran against this exact schema (sync Connection)"""
+    return (
+        conn.execute(text("PRAGMA application_id")).scalar() == SCHEMA_FINGERPRINT
+        and conn.execute(text("PRAGMA user_version")).scalar() == SCHEMA_VERSION
+    )
+
+def migrate_db(conn):
+    """
+    Bring an existing database up to the current schema.
+    create_all() skips tables that already exist, so indexes added to a model
+    later are created here, followed by any pending data migrations. Takes a
+    sync Connection (use run_sync from async code). Returns the names of the
+    indexes that were added.
+    """
+    created = []
+    inspector = inspect(conn)
+    existing_tables = inspector.get_table_names()
+    
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing_indexes = {ix["name"] for ix in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing_indexes:
+                index.create(bind=conn)
+                created.append(index.name)
+    
+    if created:
+        # Refresh planner statistics so the new indexes get used
+        conn.execute(text("ANALYZE"))
+    
+    version = conn.execute(text("PRAGMA user_version")).scalar()
+    for target, migration in DATA_MIGRATIONS:
+        if version < target:
+            migration(conn)
+    if version < SCHEMA_VERSION:
+        conn.execute(text(f"PRAGMA user_version = {SCHEMA_VERSION}"))
+    
+    # TIMESTAMP_STORAGE changed: rewrite stored times and the triggers reading them
+    convert_timestamps(conn)
+    if not rollups.triggers_current(conn):
+        rollups.create_triggers(conn)
+    
+    # Later startups skip create_all() and this function (see init_db)
+    conn.execute(text(f"PRAGMA application_id = {SCHEMA_FINGERPRINT}"))
+    return created
+
+async def get_db():
+    """Get async database session"""
+    async with new_session() as db:
+        # Check out the connection up front so pool waits are measured on their own
+        start = time.perf_counter()
+        await db.connection()
+        observe_pool_wait(time.perf_counter() - start)
+        yield db
@@ -0,0 +1,180 @@
+"""
+Live gate activity pushed to dashboards over Server-Sent Events.
+
+The gate endpoints publish an event after every committed scan ("entry",
+"exit", plus "suspicious" for flagged scans). Each event is encoded once as
+an SSE frame and fanned out to every subscriber's bounded queue, so a
+publish costs one encode plus one queue put per subscriber and never
+touches the database.
+
+Backpressure: a subscriber whose queue is full is disconnected instead of
+slowing down the gate. Browsers' EventSource reconnects on its own and
+sends Last-Event-ID; the broker keeps the last EVENT_HISTORY events and
+replays everything after that id. When the id is unknown (too old, or
+issued by another process or before a restart) a "reset" event tells the
+client to reload the listing from /api/logs before following the stream.
+
+With several workers, each worker also republishes the scans the others
+committed, read from entry_logs by its cache coherence poll (see
+backend.coherence), so every stream carries every gate's scans. Relayed
+events carry the logged columns only (no message or triggered_rules) and
+reach other workers' streams up to CACHE_SYNC_INTERVAL later. Event ids
+are per worker: a client reconnecting to another worker gets a "reset".
+"""
+
+import asyncio
+import uuid
+from collections import OrderedDict, deque
+
+from backend.config import EVENT_HEARTBEAT_SECONDS, EVENT_HISTORY, EVENT_QUEUE_SIZE
+from backend.serialization import dumps
+
+EVENT_TYPES = ("entry", "exit", "suspicious")
+
+# Reconnect delay suggested to EventSource clients
+RETRY_MS = 3000
+
+# Scans remembered by EventBroker.claim() while they wait for their second
+# publish (by the request or by the relay)
+CLAIMED_SCANS = 10000
+
+
+class Event:
+    __slots__ = ("seq", "type", "frame")
+
+    def __init__(self, seq, type, frame):
+        self.seq = seq
+        self.type = type
+        self.frame = frame
+
+
+class Subscriber:
+    """One connected stream: a replay backlog, then its bounded queue"""
+
+    __slots__ = ("types", "backlog", "queue")
+
+    def __init__(self, types, backlog, queue_size):
+        self.types = types
+        self.backlog = backlog
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def close(self):
+        """End the stream after whatever the client already received"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+
+class EventBroker:
+    """In-process fan-out of gate events to SSE subscribers"""
+
+    def __init__(self, history=EVENT_HISTORY, queue_size=EVENT_QUEUE_SIZE):
+        # Ids are "<stream>-<seq>"; the stream part changes on every start
+        self.stream = uuid.uuid4().hex[:12]
+        self.queue_size = queue_size
+        self.history = deque(maxlen=history)
+        self.subscribers = set()
+        self.seq = 0
+        self.published = 0
+        self.dropped = 0
+        # Set by the relay's first sync: from then on a scan this process
+        # committed is published by its request and read back by the relay
+        self.relaying = False
+        self.claimed = OrderedDict()
+
+    def claim(self, kind, log_id):
+        """False when the scan was published already (entry_logs ids only, while relaying)"""
+        if not self.relaying or not isinstance(log_id, int):
+            return True
+        key = (kind, log_id)
+        if key in self.claimed:
+            del self.claimed[key]
+            return False
+        self.claimed[key] = None
+        if len(self.claimed) > CLAIMED_SCANS:
+            self.claimed.popitem(last=False)
+        return True
+
+    def publish(self, type, data):
+        """Encode an event once and queue it for every matching subscriber"""
+        self.seq += 1
+        self.published += 1
+        frame = b"id: %s-%d\nevent: %s\ndata: %s\n\n" % (
+            self.stream.encode(), self.seq, type.encode(), dumps(data)
+        )
+        event = Event(self.seq, type, frame)
+        self.history.append(event)
+
+        for subscriber in list(self.subscribers):
+            if subscriber.types and type not in subscriber.types:
+                continue
+            try:
+                subscriber.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # Too slow: disconnect; the client resumes from its last id
+                self.dropped += 1
+                self.subscribers.discard(subscriber)
+                subscriber.close()
+
+    def _replay(self, last_event_id, types):
+        """Backlog frames after last_event_id, or a reset frame when it can't be resumed"""
+        if not last_event_id:
+            return []
+        stream, _, seq = last_event_id.rpartition("-")
+        oldest = self.history[0].seq if self.history else self.seq + 1
+        if stream != self.stream or not seq.isdigit() or int(seq) < oldest - 1 or int(seq) > self.seq:
+            return [b"event: reset\ndata: {}\n\n"]
+        return [
+            event.frame for event in self.history
+            if event.seq > int(seq) and (not types or event.type in types)
+        ]
+
+    def subscribe(self, last_event_id=None, types=()):
+        """Register a subscriber; events published from now on are queued for it"""
+        subscriber = Subscriber(frozenset(types), self._replay(last_event_id, types), self.queue_size)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.discard(subscriber)
+
+    def close(self):
+        """End every stream (shutdown)"""
+        for subscriber in self.subscribers:
+            subscriber.close()
+        self.subscribers.clear()
+
+    async def stream_frames(self, subscriber, heartbeat=EVENT_HEARTBEAT_SECONDS):
+        """SSE body for a subscriber; comments keep idle connections open through proxies"""
+        try:
+            yield b"retry: %d\n\n" % RETRY_MS
+            for frame in subscriber.backlog:
+                yield frame
+            subscriber.backlog = None
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                if event is None:
+                    return
+                yield event.frame
+        finally:
+            self.unsubscribe(subscriber)
+
+
+event_broker = EventBroker()
+
+
+def publish_scan(kind, data):
+    """
+    Publish a committed gate scan ("entry" or "exit"), and a "suspicious"
+    event if it was flagged. Returns False for a scan published already.
+    """
+    if not event_broker.claim(kind, data.get("log_id")):
+        return False
+    event_broker.publish(kind, data)
+    if data.get("is_suspicious"):
+        event_broker.publish("suspicious", {**data, "phase": kind})
+    return True
@@ -0,0 +1,65 @@
+"""
+Streaming NDJSON/CSV exports.
+
+Rows are read through a server-side cursor (AsyncSession.stream with
+yield_per) in a session owned by the generator, and written out chunk by
+chunk, so memory stays bounded no matter how many rows are exported.
+"""
+
+import csv
+import io
+
+from fastapi.responses import StreamingResponse
+
+from backend.database import new_session
+from backend.serialization import dumps
+
+EXPORT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+# Rows fetched from the cursor per round trip
+EXPORT_CHUNK_SIZE = 1000
+
+
+async def _stream_rows(stmt, row_to_dict):
+    async with new_session() as db:
+        result = await db.stream(stmt.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        async for partition in result.partitions():
+            yield [row_to_dict(row) for row in partition]
+
+
+async def _ndjson(stmt, row_to_dict):
+    async for rows in _stream_rows(stmt, row_to_dict):
+        yield b"".join(dumps(row) + b"\n" for row in rows)
+
+
+async def _csv(stmt, fields, row_to_dict):
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    async for rows in _stream_rows(stmt, row_to_dict):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    # Header only when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(stmt, fields, row_to_dict, fmt: str, filename: str):
+    """
+    Build a StreamingResponse exporting the rows of `stmt`.
+    `fields` is the column order for CSV, `row_to_dict` maps a result row to a dict.
+    """
+    if fmt == "csv":
+        body = _csv(stmt, fields, row_to_dict)
+    else:
+        body = _ndjson(stmt, row_to_dict)
+    return StreamingResponse(
+        body,
+        media_type=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'},
+    )
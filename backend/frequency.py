@@ -0,0 +1,169 @@
+"""
+In-process sliding-window tracker for recent gate entries.
+
+Holds the entry timestamps of every plate seen in the last hour so the
+suspicious-frequency check can be answered from memory instead of running
+COUNT queries against entry_logs on every scan.
+"""
+
+import asyncio
+from bisect import insort
+from collections import defaultdict, deque
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+from backend.database import EntryLog
+from backend.rules import suspicion_rules
+from backend.timezone_utils import get_ist_now
+
+# How often expired timestamps are dropped (seconds)
+PRUNE_INTERVAL = 60
+
+
+class EntryWindowTracker:
+    """
+    Per-plate sliding windows of entry timestamps.
+
+    Each window keeps its own deque per plate, ordered by entry time, so
+    counting only pops expired timestamps off the left end (O(1) amortized).
+    """
+
+    def __init__(self, windows):
+        self.windows = tuple(sorted(windows))
+        self._entries = {window: defaultdict(deque) for window in self.windows}
+        # Highest entry_logs id seen by rebuild()/sync(), and the ids (with
+        # entry times) this process recorded itself, so sync() skips them
+        self.last_log_id = 0
+        self._local_ids = {}
+        # Set once rebuild() or load() has filled the windows; counts taken
+        # before that would miss the entries still in the database
+        self.ready = asyncio.Event()
+
+    def record(self, plate_number: str, entry_time, log_id=None):
+        """
+        Add an entry timestamp for a plate (log_id: the entry_logs row it came
+        from; document ids of other storage backends are not tracked by sync())
+        """
+        if isinstance(log_id, int):
+            if log_id <= self.last_log_id:
+                return  # already picked up by sync()
+            self._local_ids[log_id] = entry_time
+        self._append(plate_number, entry_time)
+
+    def claim(self, log_id: int, entry_time):
+        """
+        Mark an entry_logs row as recorded here, for entries recorded before
+        their id was known (group commit). Call it before the row's
+        transaction commits, so sync() never counts it a second time.
+        """
+        self._local_ids[log_id] = entry_time
+
+    def unclaim(self, log_id: int):
+        """Undo claim() for a row whose transaction rolled back"""
+        self._local_ids.pop(log_id, None)
+
+    def forget(self, plate_number: str, entry_time):
+        """Undo record() for an entry whose write failed"""
+        for plates in self._entries.values():
+            timestamps = plates.get(plate_number)
+            if timestamps and entry_time in timestamps:  # may have expired meanwhile
+                timestamps.remove(entry_time)
+                if not timestamps:
+                    del plates[plate_number]
+
+    def _append(self, plate_number: str, entry_time):
+        for plates in self._entries.values():
+            timestamps = plates[plate_number]
+            if not timestamps or timestamps[-1] <= entry_time:
+                timestamps.append(entry_time)
+            else:
+                # Out-of-order timestamp, keep the deque sorted
+                insort(timestamps, entry_time)
+
+    def count(self, plate_number: str, window: timedelta, now=None) -> int:
+        """Count entries for a plate with entry_time >= now - window"""
+        plates = self._entries[window]
+        timestamps = plates.get(plate_number)
+        if not timestamps:
+            return 0
+
+        cutoff = (now or get_ist_now()) - window
+        while timestamps and timestamps[0] < cutoff:
+            timestamps.popleft()
+
+        if not timestamps:
+            del plates[plate_number]
+            return 0
+        return len(timestamps)
+
+    def prune(self, now=None):
+        """Drop expired timestamps and empty plates from every window"""
+        now = now or get_ist_now()
+        for window, plates in self._entries.items():
+            cutoff = now - window
+            for plate_number in list(plates):
+                timestamps = plates[plate_number]
+                while timestamps and timestamps[0] < cutoff:
+                    timestamps.popleft()
+                if not timestamps:
+                    del plates[plate_number]
+
+        # Local ids sync() has not seen yet would be outside every window by now
+        if self.windows:
+            cutoff = now - self.windows[-1]
+            self._local_ids = {
+                log_id: entry_time for log_id, entry_time in self._local_ids.items() if entry_time >= cutoff
+            }
+
+    def clear(self):
+        """Forget all tracked entries"""
+        for plates in self._entries.values():
+            plates.clear()
+        self._local_ids.clear()
+
+    async def rebuild(self, db):
+        """Reload the tracker from entry_logs rows inside the longest window"""
+        self.clear()
+        self.last_log_id = await db.scalar(select(func.max(EntryLog.id))) or 0
+        if not self.windows:
+            self.ready.set()
+            return
+        since = get_ist_now() - self.windows[-1]
+        result = await db.execute(
+            select(EntryLog.plate_number, EntryLog.entry_time)
+            .where(EntryLog.entry_time >= since, EntryLog.id <= self.last_log_id)
+            .order_by(EntryLog.entry_time)
+        )
+
+        for plate_number, entry_time in result:
+            self._append(plate_number, entry_time)
+        self.ready.set()
+
+    def load(self, entries):
+        """Reload the tracker from (plate_number, entry_time) pairs, oldest first"""
+        self.clear()
+        for plate_number, entry_time in entries:
+            self._append(plate_number, entry_time)
+        self.ready.set()
+
+    async def sync(self, db):
+        """Record entries committed by other processes since the last rebuild or sync"""
+        result = await db.execute(
+            select(EntryLog.id, EntryLog.plate_number, EntryLog.entry_time)
+            .where(EntryLog.id > self.last_log_id)
+            .order_by(EntryLog.id)
+        )
+        since = get_ist_now() - self.windows[-1] if self.windows else None
+        for log_id, plate_number, entry_time in result:
+            self.last_log_id = log_id
+            if self._local_ids.pop(log_id, None) is None and since is not None and entry_time >= since:
+                self._append(plate_number, entry_time)
+
+    def __len__(self):
+        """Number of plates currently tracked"""
+        return len(self._entries[self.windows[-1]]) if self.windows else 0
+
+
+# Keeps exactly the windows the configured window_count rules look at
+entry_tracker = EntryWindowTracker(windows=suspicion_rules.windows)
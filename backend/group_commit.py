@@ -0,0 +1,511 @@
+"""
+Write-behind group commit for the gate's entry and exit writes (SQLite).
+
+With GROUP_COMMIT=off (the default) every check-entry and check-exit
+commits its own transaction. Otherwise their writes go into an in-process
+queue, and a background task applies everything queued in one transaction,
+GROUP_COMMIT_WINDOW_MS after the first write or as soon as
+GROUP_COMMIT_MAX_WRITES are queued:
+
+- "durable": a request waits until its batch has committed
+- "fast_ack": a request returns once its write is appended to this
+  process's journal in GROUP_COMMIT_JOURNAL_DIR and synced to disk
+
+Each batch of a journaled process also records, in journal_checkpoints and
+in the same transaction, the last journal write it applied. At startup the
+journals of processes that stopped with writes still queued are replayed
+from their checkpoint, so every acknowledged write is applied exactly once.
+Concurrent requests share one fdatasync of the journal, so an acknowledged
+write survives a power cut as well as a crash of the process.
+
+Reads see a fast-acked write once its batch commits. An exit closes the
+newest entry of its plate, committed or only acknowledged (a durable exit
+first waits for the plate's queued writes), and holds the plate until its
+own write is queued, so it always finds the entry acknowledged before it
+and two exits cannot close the same entry. An entry is counted by the
+entry tracker as soon as it is queued, and the gate events of fast-acked
+writes are published once their batch has committed and the entry log id
+is known.
+"""
+
+import asyncio
+import glob
+import json
+import logging
+import os
+import time
+from collections import Counter
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from backend.config import (
+    GROUP_COMMIT,
+    GROUP_COMMIT_JOURNAL_DIR,
+    GROUP_COMMIT_MAX_WRITES,
+    GROUP_COMMIT_WINDOW_MS,
+)
+from backend.database import (
+    ActiveEntry,
+    EntryLog,
+    JournalCheckpoint,
+    get_async_engine,
+    new_session,
+    serialized_write,
+)
+from backend.frequency import entry_tracker
+from backend.metrics import GROUP_COMMIT_BATCH, GROUP_COMMIT_FLUSH
+from backend.serialization import dumps
+
+logger = logging.getLogger(__name__)
+
+GROUP_COMMIT_MODES = ("off", "durable", "fast_ack")
+
+if GROUP_COMMIT not in GROUP_COMMIT_MODES:
+    raise ValueError(f"GROUP_COMMIT must be one of: {', '.join(GROUP_COMMIT_MODES)}")
+if GROUP_COMMIT == "fast_ack" and fcntl is None:
+    raise ValueError("GROUP_COMMIT=fast_ack needs file locks (fcntl), which this platform lacks")
+
+JOURNAL_PATTERN = "entry-journal-*.ndjson"
+
+# Journal fields holding datetimes
+_TIME_FIELDS = ("entry_time", "exit_time")
+
+
+class EntryAlreadyClosed(RuntimeError):
+    """Raised for an exit whose entry was closed by another process first"""
+
+
+class PendingWrite:
+    """
+    A queued write. kind "entry" carries entry_time, is_registered and
+    is_suspicious; kind "exit" carries entry_log_id (None for an entry that
+    was still queued when the exit matched it), entry_time, exit_time,
+    duration_minutes and is_suspicious.
+    """
+
+    __slots__ = ("seq", "kind", "plate_number", "values", "future")
+
+    def __init__(self, seq, kind, plate_number, values, future=None):
+        self.seq = seq
+        self.kind = kind
+        self.plate_number = plate_number
+        self.values = values
+        self.future = future
+
+    def to_json(self):
+        return dumps({"seq": self.seq, "kind": self.kind, "plate_number": self.plate_number, **self.values})
+
+    @classmethod
+    def from_json(cls, line):
+        record = json.loads(line)
+        for field in _TIME_FIELDS:
+            if field in record:
+                record[field] = datetime.fromisoformat(record[field])
+        return cls(record.pop("seq"), record.pop("kind"), record.pop("plate_number"), record)
+
+
+async def apply_writes(db, writes, journal=None):
+    """
+    Apply writes in order inside the transaction of `db` (an AsyncSession
+    or AsyncConnection; not committed).
+    Returns one result per write: the id of the entry log it inserted or
+    closed, or the EntryAlreadyClosed that rejected it. With a journal
+    name, its checkpoint moves to the last write.
+    """
+    results = []
+    for write in writes:
+        values = write.values
+        if write.kind == "entry":
+            # trg_active_entry puts the plate on campus
+            results.append(await db.scalar(
+                insert(EntryLog)
+                .values(plate_number=write.plate_number, **values)
+                .returning(EntryLog.id)
+            ))
+            continue
+        log_id = values["entry_log_id"]
+        if log_id is None:
+            # Matched while its entry was queued; that entry is inserted by now
+            log_id = await db.scalar(
+                select(EntryLog.id)
+                .where(EntryLog.plate_number == write.plate_number, EntryLog.entry_time == values["entry_time"])
+                .order_by(EntryLog.id.desc())
+                .limit(1)
+            )
+        closed = await db.execute(
+            update(EntryLog)
+            .where(EntryLog.id == log_id, EntryLog.exit_time.is_(None), EntryLog.abandoned_at.is_(None))
+            .values(
+                exit_time=values["exit_time"],
+                duration_minutes=values["duration_minutes"],
+                is_suspicious=values["is_suspicious"],
+            )
+        )
+        if not closed.rowcount:
+            results.append(EntryAlreadyClosed(f"Entry {log_id} of {write.plate_number} is already closed"))
+            continue
+        # A newer entry of the plate may already hold its on-campus row
+        await db.execute(delete(ActiveEntry).where(
+            ActiveEntry.plate_number == write.plate_number,
+            ActiveEntry.entry_log_id == log_id,
+        ))
+        results.append(log_id)
+    if journal and writes:
+        await db.execute(
+            sqlite_insert(JournalCheckpoint)
+            .values(journal=journal, seq=writes[-1].seq)
+            .on_conflict_do_update(index_elements=["journal"], set_={"seq": writes[-1].seq})
+        )
+    return results
+
+
+class Journal:
+    """This process's append-only file of fast-acked writes, locked while the process runs"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.name = None
+        self.path = None
+        self._fd = None
+        # Lines appended, and how many of them the last finished sync covered
+        self._appended = 0
+        self._synced = 0
+        self._syncing = None
+
+    def open(self):
+        """
+        Create and lock a new journal. It is locked under a temporary name and
+        only then renamed into JOURNAL_PATTERN, so replay_journals in another
+        worker never sees it unlocked.
+        """
+        if self._fd is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # The start time keeps names unique when a pid is reused
+        self.name = JOURNAL_PATTERN.replace("*", f"{os.getpid()}-{time.time_ns()}")
+        self.path = os.path.join(self.directory, self.name)
+        tmp_path = self.path + ".tmp"
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.rename(tmp_path, self.path)
+        except BaseException:
+            os.close(fd)
+            os.unlink(tmp_path)
+            raise
+        self._fd = fd
+        # Make the new file's directory entry durable too
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def append(self, write):
+        if self._fd is None:
+            self.open()
+        os.write(self._fd, write.to_json() + b"\n")
+        self._appended += 1
+
+    async def sync(self):
+        """
+        Wait until every line appended so far is on disk. One fdatasync runs
+        at a time, in a thread; lines appended meanwhile share the next one.
+        """
+        target = self._appended
+        while self._synced < target:
+            if self._syncing is None:
+                self._syncing = asyncio.ensure_future(self._sync())
+            await asyncio.shield(self._syncing)
+
+    async def _sync(self):
+        covered = self._appended
+        try:
+            await asyncio.to_thread(_fdatasync, self._fd)
+            self._synced = covered
+        finally:
+            self._syncing = None
+
+    def truncate(self):
+        """Drop the journaled writes once all of them are committed"""
+        if self._fd is not None:
+            os.ftruncate(self._fd, 0)
+
+    async def remove(self):
+        """Delete the file and its checkpoint (nothing left to replay)"""
+        if self._fd is None:
+            return
+        if self._syncing is not None:
+            await asyncio.wait([self._syncing])
+        os.unlink(self.path)
+        os.close(self._fd)
+        self._fd = None
+        await _drop_checkpoint(self.name)
+
+
+# fdatasync is missing on macOS
+_fdatasync = getattr(os, "fdatasync", os.fsync)
+
+
+async def _drop_checkpoint(name):
+    async with serialized_write():
+        async with new_session() as db:
+            await db.execute(delete(JournalCheckpoint).where(JournalCheckpoint.journal == name))
+            await db.commit()
+
+
+class GroupCommitter:
+    """
+    Queues entry and exit writes and commits them in batches from one
+    background task (start() / close() from the lifespan). The task has
+    its own connection: the requests waiting for it may hold every pooled one.
+    """
+
+    def __init__(self, mode=GROUP_COMMIT, window_ms=GROUP_COMMIT_WINDOW_MS,
+                 max_writes=GROUP_COMMIT_MAX_WRITES, journal_dir=GROUP_COMMIT_JOURNAL_DIR):
+        self.mode = mode
+        self.window = window_ms / 1000
+        self.max_writes = max_writes
+        self.journal = Journal(journal_dir) if mode == "fast_ack" else None
+        self._queue = []
+        self._in_flight = []
+        # Plates whose exit has read its entry but not queued its write yet
+        self._held = Counter()
+        self._released = {}
+        self._queued = asyncio.Event()
+        self._flush_now = asyncio.Event()
+        self._runner = None
+        self._conn = None
+        self._closing = False
+        self._seq = 0
+        self.commits = 0
+        self.rejected = 0
+        # Flushes finished, committed or not: a read spanning a change of
+        # this may have missed the writes that just left the queue
+        self.flushed = 0
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    @property
+    def durable(self):
+        """Whether requests wait for their batch to commit"""
+        return self.mode == "durable"
+
+    def __len__(self):
+        """Writes queued or being committed"""
+        return len(self._queue) + len(self._in_flight)
+
+    def submit(self, kind, plate_number, **values):
+        """
+        Queue a write (journaled first in fast_ack mode). Returns a future
+        resolved with apply_writes' result for it once its batch committed.
+        """
+        self._seq += 1
+        write = PendingWrite(self._seq, kind, plate_number, values, asyncio.get_running_loop().create_future())
+        if self.journal:
+            self.journal.append(write)
+        self._queue.append(write)
+        self._queued.set()
+        if len(self._queue) >= self.max_writes:
+            self._flush_now.set()
+        return write.future
+
+    async def journaled(self):
+        """fast_ack: wait until the writes submitted so far are synced to the journal"""
+        await self.journal.sync()
+
+    def pending(self, plate_number):
+        """The plate's queued and uncommitted writes, oldest first"""
+        return [write for write in self._in_flight + self._queue if write.plate_number == plate_number]
+
+    def hold(self, plate_number):
+        """Keep other exits of a plate waiting (see settle) until release()"""
+        self._held[plate_number] += 1
+
+    def release(self, plate_number):
+        self._held[plate_number] -= 1
+        if not self._held[plate_number]:
+            del self._held[plate_number]
+            waiter = self._released.pop(plate_number, None)
+            if waiter is not None:
+                waiter.set()
+
+    def held(self, plate_number):
+        """Whether an exit of the plate read its entry but has not queued its write"""
+        return plate_number in self._held
+
+    def idle(self, plate_number):
+        """Whether the plate has no held exit and no uncommitted write"""
+        return not self.held(plate_number) and not any(
+            write.plate_number == plate_number for write in self._in_flight + self._queue
+        )
+
+    async def unheld(self, plate_number):
+        """Wait until the plate has no held exit"""
+        while self.held(plate_number):
+            await self._released.setdefault(plate_number, asyncio.Event()).wait()
+
+    async def settle(self, plate_number):
+        """Wait until the plate has no held exit and no uncommitted write"""
+        while not self.idle(plate_number):
+            if self.held(plate_number):
+                await self.unheld(plate_number)
+                continue
+            # Commit now instead of waiting out the window
+            self._flush_now.set()
+            await asyncio.wait([
+                write.future for write in self._in_flight + self._queue if write.plate_number == plate_number
+            ])
+
+    async def start(self):
+        if self.enabled and self._runner is None:
+            if self.journal:
+                self.journal.open()
+            self._conn = await get_async_engine().connect()
+            self._closing = False
+            self._runner = asyncio.create_task(self._run())
+
+    async def close(self):
+        """Commit what is still queued and stop; the journal stays behind if that fails"""
+        if self._runner is None:
+            return
+        self._closing = True
+        self._queued.set()
+        self._flush_now.set()
+        await self._runner
+        self._runner = None
+        await self._conn.close()
+        self._conn = None
+        if self.journal and not self._queue:
+            await self.journal.remove()
+
+    async def _run(self):
+        while True:
+            await self._queued.wait()
+            if not self._closing and len(self._queue) < self.max_writes:
+                try:
+                    await asyncio.wait_for(self._flush_now.wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            committed = await self.flush()
+            if self._closing and (not self._queue or not committed):
+                return
+            if not committed:
+                await asyncio.sleep(self.window)
+
+    async def flush(self):
+        """Apply and commit everything queued in one transaction. Returns False if the commit failed."""
+        batch, self._queue = self._queue, []
+        self._queued.clear()
+        self._flush_now.clear()
+        if not batch:
+            return True
+        self._in_flight = batch
+        start = time.perf_counter()
+        claimed = []
+        try:
+            async with serialized_write(), self._conn.begin():
+                results = await apply_writes(self._conn, batch, self.journal.name if self.journal else None)
+                # The requests recorded these entries without ids
+                for write, result in zip(batch, results):
+                    if write.kind == "entry":
+                        entry_tracker.claim(result, write.values["entry_time"])
+                        claimed.append(result)
+        except Exception as e:
+            for log_id in claimed:
+                entry_tracker.unclaim(log_id)
+            if self.durable:
+                logger.exception("Group commit of %d writes failed", len(batch))
+                for write in batch:
+                    write.future.set_exception(e)
+            else:
+                # Acknowledged already: keep them (and their journal lines) for the next attempt
+                logger.exception("Group commit of %d writes failed, retrying", len(batch))
+                self._queue[:0] = batch
+                self._queued.set()
+            return False
+        finally:
+            self._in_flight = []
+            self.flushed += 1
+
+        GROUP_COMMIT_FLUSH.observe(time.perf_counter() - start)
+        GROUP_COMMIT_BATCH.observe(len(batch))
+        self.commits += 1
+        for write, result in zip(batch, results):
+            if isinstance(result, EntryAlreadyClosed):
+                self.rejected += 1
+                if not self.durable:
+                    logger.warning("Dropped acknowledged exit: %s", result)
+                    result = None
+            if isinstance(result, Exception):
+                write.future.set_exception(result)
+            else:
+                write.future.set_result(result)
+        if self.journal and not self._queue:
+            self.journal.truncate()
+        return True
+
+
+def _read_journal(path):
+    writes = []
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                writes.append(PendingWrite.from_json(line))
+            except ValueError:
+                # A line cut short by the crash was never acknowledged
+                logger.warning("Skipping unreadable line in %s", path)
+    return writes
+
+
+async def replay_journals(directory=GROUP_COMMIT_JOURNAL_DIR):
+    """
+    Apply the writes that processes acknowledged but did not commit before
+    they stopped, from every journal in `directory` no running process holds.
+    Returns the number of writes applied.
+    """
+    if fcntl is None or not os.path.isdir(directory):
+        return 0
+    replayed = 0
+    for path in sorted(glob.glob(os.path.join(directory, JOURNAL_PATTERN))):
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            continue  # replayed by another worker since the glob
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                continue  # a running worker's journal
+            if os.fstat(fd).st_nlink == 0:
+                continue  # another worker replayed and unlinked it before we locked it
+            name = os.path.basename(path)
+            async with serialized_write():
+                async with new_session() as db:
+                    done = await db.scalar(select(JournalCheckpoint.seq).where(JournalCheckpoint.journal == name))
+                    writes = [write for write in _read_journal(path) if write.seq > (done or 0)]
+                    results = await apply_writes(db, writes, name)
+                    await db.commit()
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.warning("Journal %s: %s", name, result)
+            replayed += len(writes)
+            os.unlink(path)
+        finally:
+            os.close(fd)
+        await _drop_checkpoint(name)
+    if replayed:
+        logger.info("Replayed %d journaled gate writes", replayed)
+    return replayed
+
+
+group_commit = GroupCommitter()
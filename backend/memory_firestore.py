@@ -0,0 +1,486 @@
+"""
+In-memory stand-in for the async Firestore client.
+
+Implements the subset of google.cloud.firestore.AsyncClient that
+FirestoreRepository uses (documents, where/order_by/limit queries, write
+batches, transactions), with Firestore's behaviour where it matters to the
+adapter:
+
+- naive datetimes are stored as UTC and every timestamp is returned
+  timezone-aware in UTC
+- documents without an order_by field are left out of the results, and
+  ties are broken by document id in the direction of the last order
+- queries that need a composite index fail unless firestore.indexes.json
+  declares one, so a query shape that would break in production breaks in
+  local runs too
+- a batch holds at most 500 writes and commits all or nothing
+- a transaction commits only if the documents it read are unchanged, and
+  async_transactional retries it otherwise
+
+MemoryFirestore.sync() is a blocking view of the same store with the calls
+of the synchronous client, for migrate_to_firebase.py --fake; commits are
+thread-safe, and fail_after simulates an outage part way through.
+
+Used by STORAGE_BACKEND=memory for tests and local development.
+"""
+
+import copy
+import functools
+import itertools
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+# Firestore batches hold at most 500 writes
+MAX_BATCH_WRITES = 500
+
+INDEXES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "firestore.indexes.json")
+
+EQUALITY_OPS = ("==",)
+RANGE_OPS = ("<", "<=", ">", ">=")
+_COMPARE = {
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+class MissingIndexError(RuntimeError):
+    """The query needs a composite index that firestore.indexes.json does not declare"""
+
+
+class Aborted(RuntimeError):
+    """A transaction read a document that changed before it committed"""
+
+
+class FieldFilter:
+    """Same attributes as google.cloud.firestore_v1.base_query.FieldFilter"""
+
+    def __init__(self, field_path, op_string, value=None):
+        self.field_path = field_path
+        self.op_string = op_string
+        self.value = value
+
+
+def _operator(field_filter):
+    """The filter's operator as a string (the real FieldFilter turns == None into an IS_NULL enum)"""
+    op = field_filter.op_string
+    if isinstance(op, str):
+        return op
+    if getattr(op, "name", None) == "IS_NULL":
+        return "=="
+    raise NotImplementedError(f"Unsupported filter operator {op!r}")
+
+
+def _stored(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc)
+    return value
+
+
+def load_indexes(path=INDEXES_PATH):
+    """Composite indexes per collection: [[(field, "ASCENDING" | "DESCENDING"), ...], ...]"""
+    with open(path) as f:
+        spec = json.load(f)
+    indexes = {}
+    for index in spec.get("indexes", []):
+        fields = [(field["fieldPath"], field.get("order", "ASCENDING")) for field in index["fields"]]
+        indexes.setdefault(index["collectionGroup"], []).append(fields)
+    return indexes
+
+
+class DocumentSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+
+    @property
+    def exists(self):
+        return self._data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return self._data.get(field)
+
+
+class DocumentReference:
+    def __init__(self, client, collection, doc_id):
+        self._client = client
+        self._collection = collection
+        self.id = doc_id
+
+    def _docs(self):
+        return self._client.store.setdefault(self._collection, {})
+
+    async def get(self):
+        return DocumentSnapshot(self, copy.deepcopy(self._docs().get(self.id)))
+
+    async def set(self, data):
+        self._set(data)
+
+    async def update(self, data):
+        self._update(data)
+
+    async def delete(self):
+        self._delete(None)
+
+    @property
+    def _key(self):
+        return (self._collection, self.id)
+
+    def _set(self, data):
+        self._docs()[self.id] = {key: _stored(value) for key, value in data.items()}
+        self._client.touch(self._key)
+
+    def _update(self, data):
+        if self.id not in self._docs():
+            raise KeyError(f"No document to update: {self._collection}/{self.id}")
+        self._docs()[self.id].update({key: _stored(value) for key, value in data.items()})
+        self._client.touch(self._key)
+
+    def _delete(self, _):
+        self._docs().pop(self.id, None)
+        self._client.touch(self._key)
+
+
+class Query:
+    def __init__(self, client, collection, filters=(), orders=(), limit=None, start_after=None):
+        self._client = client
+        self._collection = collection
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._limit = limit
+        self._start_after = start_after
+
+    def _copy(self, **changes):
+        state = {
+            "filters": self._filters, "orders": self._orders,
+            "limit": self._limit, "start_after": self._start_after,
+        }
+        return Query(self._client, self._collection, **{**state, **changes})
+
+    def where(self, *, filter):
+        return self._copy(filters=self._filters + (filter,))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def limit(self, count):
+        return self._copy(limit=count)
+
+    def start_after(self, document_fields):
+        """document_fields: {order_by field: value}; "__name__" takes a document id or reference"""
+        return self._copy(start_after=document_fields)
+
+    def _full_orders(self):
+        """Explicit orders plus the implicit __name__ order, in the last order's direction"""
+        orders = list(self._orders)
+        if "__name__" not in [field for field, _ in orders]:
+            orders.append(("__name__", orders[-1][1] if orders else "ASCENDING"))
+        return orders
+
+    def _check_index(self):
+        equality = {f.field_path for f in self._filters if _operator(f) in EQUALITY_OPS}
+        ranges = [f.field_path for f in self._filters if _operator(f) in RANGE_OPS]
+        orders = list(self._orders)
+        if ranges and ranges[0] not in [field for field, _ in orders]:
+            orders.insert(0, (ranges[0], "ASCENDING"))
+        # Every index ends with __name__ in the direction of its last field
+        if len(orders) > 1 and orders[-1] == ("__name__", orders[-2][1]):
+            orders.pop()
+        if not orders or len(equality | {field for field, _ in orders}) <= 1:
+            return  # served by the automatic single-field indexes (merged for equality-only queries)
+        for index in self._client.indexes.get(self._collection, []):
+            if {field for field, _ in index[:len(equality)]} == equality and index[len(equality):] == orders:
+                return
+        needed = [(field, "ASCENDING") for field in sorted(equality)] + orders
+        raise MissingIndexError(f"Query on {self._collection} needs a composite index on {needed}")
+
+    def _matches(self, data):
+        for f in self._filters:
+            op = _operator(f)
+            if f.field_path not in data:
+                return False  # missing fields never match, not even == None
+            value = data[f.field_path]
+            expected = _stored(f.value)
+            if op == "==":
+                if value != expected:
+                    return False
+            elif value is None or expected is None or not _COMPARE[op](value, expected):
+                return False
+        return True
+
+    @staticmethod
+    def _sort_key(value):
+        # null sorts before every other value, as in Firestore
+        return (value is not None, value)
+
+    def _after_cursor(self, doc_id, data, orders):
+        for field, direction in orders[:len(self._start_after)]:
+            value = doc_id if field == "__name__" else data[field]
+            cursor = self._start_after[field]
+            if field == "__name__":
+                cursor = getattr(cursor, "id", cursor)
+            else:
+                cursor = _stored(cursor)
+            if value != cursor:
+                before = self._sort_key(value) < self._sort_key(cursor)
+                return before if direction == "DESCENDING" else not before
+        return False
+
+    async def stream(self, transaction=None):
+        self._check_index()
+        orders = self._full_orders()
+        docs = self._client.store.get(self._collection, {})
+        rows = [
+            (doc_id, data) for doc_id, data in docs.items()
+            if self._matches(data) and all(field in data for field, _ in self._orders if field != "__name__")
+        ]
+        # Stable sorts from the last key to the first
+        for field, direction in reversed(orders):
+            rows.sort(
+                key=lambda row: row[0] if field == "__name__" else self._sort_key(row[1][field]),
+                reverse=direction == "DESCENDING",
+            )
+        if self._start_after:
+            rows = [(doc_id, data) for doc_id, data in rows if self._after_cursor(doc_id, data, orders)]
+        for doc_id, data in rows[:self._limit] if self._limit is not None else rows:
+            reference = DocumentReference(self._client, self._collection, doc_id)
+            if transaction is not None:
+                transaction._read(reference)
+            yield DocumentSnapshot(reference, copy.deepcopy(data))
+
+    async def get(self, transaction=None):
+        return [snapshot async for snapshot in self.stream(transaction)]
+
+
+class CollectionReference(Query):
+    def __init__(self, client, name):
+        super().__init__(client, name)
+        self.id = name
+
+    def document(self, doc_id=None):
+        return DocumentReference(self._client, self._collection, doc_id or self._client.next_id())
+
+
+class WriteBatch:
+    def __init__(self, client):
+        self._client = client
+        self._ops = []
+
+    def set(self, reference, data):
+        self._ops.append((reference, reference._set, data))
+
+    def update(self, reference, data):
+        self._ops.append((reference, reference._update, data))
+
+    def delete(self, reference):
+        self._ops.append((reference, reference._delete, None))
+
+    async def commit(self):
+        self._commit()
+        return []
+
+    def _check(self):
+        """Raise before anything is written when the commit may not go ahead"""
+
+    def _commit(self):
+        if len(self._ops) > MAX_BATCH_WRITES:
+            raise ValueError(f"Batch of {len(self._ops)} writes, at most {MAX_BATCH_WRITES} allowed")
+        with self._client.lock:
+            self._client.check_available()
+            self._check()
+            # All or nothing: restore the touched documents if a write fails
+            saved = {}
+            try:
+                for reference, apply, data in self._ops:
+                    docs = reference._docs()
+                    saved.setdefault(reference._key, (docs, copy.deepcopy(docs.get(reference.id))))
+                    apply(data)
+            except Exception:
+                for (_, doc_id), (docs, data) in saved.items():
+                    if data is None:
+                        docs.pop(doc_id, None)
+                    else:
+                        docs[doc_id] = data
+                raise
+            self._client.commits += 1
+
+
+class Transaction(WriteBatch):
+    """Writes of one transaction attempt, committed only if its reads are still current"""
+
+    def __init__(self, client, max_attempts=5):
+        super().__init__(client)
+        self.max_attempts = max_attempts
+        self._versions = {}
+
+    def _begin(self):
+        self._ops = []
+        self._versions = {}
+
+    def _read(self, reference):
+        self._versions.setdefault(reference._key, self._client.version(reference._key))
+
+    def _check(self):
+        for key, version in self._versions.items():
+            if self._client.version(key) != version:
+                raise Aborted(f"{key[0]}/{key[1]} changed during the transaction")
+
+
+def async_transactional(func):
+    """Same contract as google.cloud.firestore_v1.async_transaction.async_transactional"""
+
+    @functools.wraps(func)
+    async def run(transaction, *args, **kwargs):
+        for _ in range(transaction.max_attempts):
+            transaction._begin()
+            result = await func(transaction, *args, **kwargs)
+            try:
+                transaction._commit()
+            except Aborted:
+                continue
+            return result
+        raise Aborted(f"Transaction failed after {transaction.max_attempts} attempts")
+    return run
+
+
+class MemoryFirestore:
+    """
+    Async Firestore client over a dict: {collection: {doc_id: data}}.
+    With fail_after=N, every commit after the first N raises ConnectionError.
+    """
+
+    def __init__(self, indexes=None, fail_after=None):
+        self.store = {}
+        self.indexes = load_indexes() if indexes is None else indexes
+        self.commits = 0
+        self.fail_after = fail_after
+        self.lock = threading.Lock()
+        self._versions = {}
+        self._ids = itertools.count(1)
+        self._changes = itertools.count(1)
+
+    def next_id(self):
+        # Fixed width keeps ids in creation order, like sequential auto ids would
+        return f"mem{next(self._ids):012d}"
+
+    def touch(self, key):
+        self._versions[key] = next(self._changes)
+
+    def version(self, key):
+        return self._versions.get(key, 0)
+
+    def check_available(self):
+        if self.fail_after is not None and self.commits >= self.fail_after:
+            raise ConnectionError("Simulated Firestore outage")
+
+    def collection(self, name):
+        return CollectionReference(self, name)
+
+    def batch(self):
+        return WriteBatch(self)
+
+    def transaction(self, max_attempts=5):
+        return Transaction(self, max_attempts)
+
+    def sync(self):
+        """Blocking view with the calls of google.cloud.firestore.Client"""
+        return SyncClient(self)
+
+
+# Blocking view. None of the coroutines above ever suspends, so they are
+# run to completion in place, from any thread.
+
+def _resolve(coroutine):
+    try:
+        coroutine.send(None)
+    except StopIteration as done:
+        return done.value
+    coroutine.close()
+    raise RuntimeError("MemoryFirestore coroutine suspended")
+
+
+class SyncDocumentReference:
+    def __init__(self, reference):
+        self._reference = reference
+        self.id = reference.id
+
+    def get(self):
+        return _resolve(self._reference.get())
+
+    def set(self, data):
+        _resolve(self._reference.set(data))
+
+    def update(self, data):
+        _resolve(self._reference.update(data))
+
+    def delete(self):
+        _resolve(self._reference.delete())
+
+
+class SyncQuery:
+    def __init__(self, query):
+        self._query = query
+
+    def where(self, *, filter):
+        return SyncQuery(self._query.where(filter=filter))
+
+    def order_by(self, field_path, direction="ASCENDING"):
+        return SyncQuery(self._query.order_by(field_path, direction))
+
+    def limit(self, count):
+        return SyncQuery(self._query.limit(count))
+
+    def start_after(self, document_fields):
+        return SyncQuery(self._query.start_after(document_fields))
+
+    def get(self):
+        return _resolve(self._query.get())
+
+    def stream(self):
+        return iter(self.get())
+
+
+class SyncCollectionReference(SyncQuery):
+    def __init__(self, collection):
+        super().__init__(collection)
+        self.id = collection.id
+
+    def document(self, doc_id=None):
+        return SyncDocumentReference(self._query.document(doc_id))
+
+
+class SyncWriteBatch:
+    def __init__(self, batch):
+        self._batch = batch
+
+    def set(self, reference, data):
+        self._batch.set(reference._reference, data)
+
+    def update(self, reference, data):
+        self._batch.update(reference._reference, data)
+
+    def delete(self, reference):
+        self._batch.delete(reference._reference)
+
+    def commit(self):
+        return _resolve(self._batch.commit())
+
+
+class SyncClient:
+    def __init__(self, client):
+        self.client = client
+
+    def collection(self, name):
+        return SyncCollectionReference(self.client.collection(name))
+
+    def batch(self):
+        return SyncWriteBatch(self.client.batch())
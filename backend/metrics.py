@@ -0,0 +1,221 @@
+"""
+Lightweight request metrics in Prometheus text format.
+
+Histograms are plain bucket counters updated from the event loop (no locks,
+no client library). Per-request state - stage timings and the SQL statements
+run - lives in a context variable so SQLAlchemy cursor events can attribute
+queries to the request that issued them.
+"""
+
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from sqlalchemy import event
+
+from backend.config import SLOW_REQUEST_MS
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds in seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# Endpoint label for work done outside a request (startup, periodic jobs)
+BACKGROUND = "background"
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values"""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observe(self, value, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            # per-bucket counts (last slot is +Inf), sum, count
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            labels = ",".join(f'{k}="{v}"' for k, v in zip(self.labels, label_values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = "{" + labels + "}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "gate_request_duration_seconds", "HTTP request latency", labels=("method", "endpoint", "status")
+)
+STAGE_LATENCY = Histogram(
+    "gate_stage_duration_seconds", "Latency of named stages inside a request", labels=("endpoint", "stage")
+)
+REQUEST_QUERIES = Histogram(
+    "gate_request_queries", "SQL statements executed per request", labels=("endpoint",), buckets=COUNT_BUCKETS
+)
+QUERY_LATENCY = Histogram(
+    "gate_query_duration_seconds", "SQL statement latency", labels=("endpoint",)
+)
+POOL_WAIT = Histogram(
+    "gate_db_pool_wait_seconds", "Time spent waiting for a database connection"
+)
+GROUP_COMMIT_BATCH = Histogram(
+    "gate_group_commit_batch_size", "Gate writes applied per group commit", buckets=BATCH_BUCKETS
+)
+GROUP_COMMIT_FLUSH = Histogram(
+    "gate_group_commit_flush_seconds", "Time to apply and commit one group commit batch"
+)
+
+HISTOGRAMS = (REQUEST_LATENCY, STAGE_LATENCY, REQUEST_QUERIES, QUERY_LATENCY, POOL_WAIT,
+              GROUP_COMMIT_BATCH, GROUP_COMMIT_FLUSH)
+
+
+class RequestStats:
+    """What one request spent its time on"""
+
+    __slots__ = ("scope", "stages", "queries")
+
+    def __init__(self, scope):
+        self.scope = scope
+        self.stages = []
+        self.queries = []
+
+    @property
+    def endpoint(self):
+        """Route template (e.g. /api/history/{plate_number}) once routing has run"""
+        route = self.scope.get("route")
+        return route.path if route is not None else "unmatched"
+
+
+_current = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def track_request(scope):
+    """Collect stage and query timings for the request running in this context"""
+    stats = RequestStats(scope)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name):
+    """Time a block of a request handler as a named stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stats = _current.get()
+        endpoint = stats.endpoint if stats else BACKGROUND
+        STAGE_LATENCY.observe(elapsed, endpoint, name)
+        if stats:
+            stats.stages.append((name, elapsed))
+
+
+def observe_pool_wait(seconds):
+    POOL_WAIT.observe(seconds)
+
+
+def observe_request(method, endpoint, status, elapsed, stats):
+    """Record a finished request and log it if it was slow"""
+    REQUEST_LATENCY.observe(elapsed, method, endpoint, str(status))
+    REQUEST_QUERIES.observe(len(stats.queries), endpoint)
+
+    if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+        stages = ", ".join(f"{name}={seconds * 1000:.1f}ms" for name, seconds in stats.stages)
+        queries = "\n".join(
+            f"  {seconds * 1000:8.2f}ms  {' '.join(statement.split())[:200]}"
+            for statement, seconds in sorted(stats.queries, key=lambda q: -q[1])
+        )
+        logger.warning(
+            "Slow request %s %s: %.1fms, %d queries [%s]\n%s",
+            method, endpoint, elapsed * 1000, len(stats.queries), stages, queries,
+        )
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current.get()
+    QUERY_LATENCY.observe(elapsed, stats.endpoint if stats else BACKGROUND)
+    if stats:
+        stats.queries.append((statement, elapsed))
+
+
+def _handle_error(context):
+    # The failed statement never reaches after_cursor_execute
+    starts = context.connection.info.get("query_start") if context.connection else None
+    if starts:
+        starts.pop()
+
+
+def instrument_engine(engine):
+    """Time every statement run on `engine` (a sync Engine)"""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class MetricsMiddleware:
+    """ASGI middleware timing every HTTP request by its route template"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        with track_request(scope) as stats:
+            try:
+                await self.app(scope, receive, send_wrapper)
+            finally:
+                observe_request(scope["method"], stats.endpoint, status, time.perf_counter() - start, stats)
+
+
+def render(gauges=(), counters=()):
+    """
+    All histograms plus extra gauges and counters, in Prometheus text
+    exposition format. Each extra metric is a (name, help, value) tuple.
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for kind, metrics in (("gauge", gauges), ("counter", counters)):
+        for name, help_text, value in metrics:
+            lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} {kind}", f"{name} {float(value)}"])
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,57 @@
+"""
+Keyset (cursor) pagination over entry_logs ordered by (entry_time, id) DESC.
+
+A cursor is the opaque, URL-safe encoding of the last row of a page; the
+next page continues strictly after it, so deep pages cost the same as the
+first one and rows inserted meanwhile never shift the page boundaries.
+"""
+
+import base64
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+from backend.database import EntryLog
+from backend.timestamps import time_tuple
+
+# Newest first, id breaks ties between identical entry times
+LOG_ORDER = (EntryLog.entry_time.desc(), EntryLog.id.desc())
+
+
+def encode_cursor(entry_time, log_id) -> str:
+    """Encode the position of a row as an opaque cursor"""
+    raw = f"{entry_time.isoformat()}|{log_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """
+    Decode a cursor into (entry_time, id). Raises ValueError if malformed.
+    Ids are ints for SQLite rows and strings for Firestore documents.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    try:
+        entry_time, log_id = base64.urlsafe_b64decode(padded).decode().split("|")
+        if not log_id:
+            raise ValueError("Missing id")
+        return datetime.fromisoformat(entry_time), int(log_id) if log_id.isdigit() else log_id
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def after_cursor(cursor: str):
+    """WHERE clause selecting rows that come after the cursor in LOG_ORDER"""
+    entry_time, log_id = decode_cursor(cursor)
+    return tuple_(EntryLog.entry_time, EntryLog.id) < time_tuple(entry_time, log_id)
+
+
+def paginate(rows, limit: int):
+    """
+    Split a result fetched with limit + 1 rows into (page, next_cursor).
+    Rows must expose entry_time and id.
+    """
+    if len(rows) <= limit:
+        return rows, None
+    page = rows[:limit]
+    last = page[-1]
+    return page, encode_cursor(last.entry_time, last.id)
@@ -0,0 +1,116 @@
+"""
+Canonical plate numbers and fuzzy matching for misread plates.
+
+Every endpoint, the batch replay and the Firebase migration store plates in
+one canonical form: upper case letters and digits only, so "ka 09-ab 4821"
+and "KA09AB4821" are the same vehicle.
+
+PlateIndex suggests registered plates for an unregistered read. Characters
+that OCR and people mix up (O/0, I/1, S/5, ...) are folded onto one
+"skeleton" character first, so those misreads match exactly; any other
+single-character error is found through a deletion-neighbourhood index:
+each skeleton is stored under every variant with one character deleted,
+and a query looks up its own variants. That is a fixed number of dict
+lookups per query (plate length + 1), independent of the registry size.
+"""
+
+import re
+from collections import defaultdict
+from typing import Annotated
+
+from pydantic import AfterValidator
+
+_NOT_ALNUM = re.compile(r"[^0-9A-Z]")
+
+# Commonly confused characters, folded onto the digit they resemble
+_SKELETON = str.maketrans("OQDILZSBG", "000112586")
+
+
+def normalize_plate(plate_number: str) -> str:
+    """Canonical form of a plate: "ka 09-ab 4821" -> "KA09AB4821" (may be empty)"""
+    return _NOT_ALNUM.sub("", plate_number.upper())
+
+
+def _validate_plate(plate_number: str) -> str:
+    plate = normalize_plate(plate_number)
+    if not plate:
+        raise ValueError("Plate number must contain letters or digits")
+    return plate
+
+
+# Request field / path parameter type that normalizes and rejects empty plates
+PlateNumber = Annotated[str, AfterValidator(_validate_plate)]
+
+
+def skeleton(plate: str) -> str:
+    return plate.translate(_SKELETON)
+
+
+def _deletions(word: str):
+    """The word and every variant of it with one character removed"""
+    return {word, *(word[:i] + word[i + 1:] for i in range(len(word)))}
+
+
+def within_one_edit(a: str, b: str) -> bool:
+    """Whether the Levenshtein distance between a and b is at most 1"""
+    if len(a) < len(b):
+        a, b = b, a
+    if len(a) - len(b) > 1:
+        return False
+    if len(a) == len(b):
+        return sum(x != y for x, y in zip(a, b)) <= 1
+    i = 0
+    while i < len(b) and a[i] == b[i]:
+        i += 1
+    return a[i + 1:] == b[i:]
+
+
+def _differences(a: str, b: str) -> int:
+    """Differing positions plus the length difference (cheap ranking key)"""
+    return sum(x != y for x, y in zip(a, b)) + abs(len(a) - len(b))
+
+
+class PlateIndex:
+    """Registered plates indexed for "did you mean" suggestions"""
+
+    def __init__(self):
+        self._by_skeleton = defaultdict(set)     # skeleton -> plates
+        self._by_deletion = defaultdict(set)     # one-deletion variant -> skeletons
+
+    def add(self, plate: str):
+        key = skeleton(plate)
+        if not self._by_skeleton[key]:
+            for variant in _deletions(key):
+                self._by_deletion[variant].add(key)
+        self._by_skeleton[key].add(plate)
+
+    def discard(self, plate: str):
+        key = skeleton(plate)
+        plates = self._by_skeleton.get(key)
+        if not plates or plate not in plates:
+            return
+        plates.discard(plate)
+        if not plates:
+            del self._by_skeleton[key]
+            for variant in _deletions(key):
+                keys = self._by_deletion[variant]
+                keys.discard(key)
+                if not keys:
+                    del self._by_deletion[variant]
+
+    def suggest(self, plate: str, limit: int = 3):
+        """
+        Registered plates within one edit of `plate` after folding confusable
+        characters, closest first: pure confusions before other misreads,
+        then fewest differing characters.
+        """
+        key = skeleton(plate)
+        keys = set()
+        for variant in _deletions(key):
+            keys |= self._by_deletion.get(variant, set())
+        candidates = [
+            (other != key, _differences(plate, match), match)
+            for other in keys if within_one_edit(key, other)
+            for match in self._by_skeleton[other] if match != plate
+        ]
+        return [match for *_, match in sorted(candidates)[:limit]]
@@ -0,0 +1,85 @@
+"""
+Process-wide cache of registered plate numbers and their vehicle types.
+
+The registry only changes through the vehicle admin endpoints, so the
+registered plates are loaded once after startup, patched on every write and
+reloaded on an interval. check_entry then answers "is this plate registered?"
+(and the vehicle type the suspicion rules filter on) without a database
+round trip. A PlateIndex over the same plates suggests likely registered
+plates for unregistered reads.
+"""
+
+from sqlalchemy import select
+
+from backend.database import Vehicle, new_session
+from backend.plates import PlateIndex
+from backend.timezone_utils import get_ist_now
+
+
+class RegistryCache:
+    """Registered plates (plate -> vehicle_type) with hit/miss counters"""
+
+    def __init__(self):
+        self._plates = {}
+        self._index = PlateIndex()
+        self.loaded = False
+        self.refreshed_at = None
+        self.hits = 0
+        self.misses = 0
+
+    async def load(self, db):
+        """Replace the cache with the plates currently in the vehicles table"""
+        result = await db.execute(select(Vehicle.plate_number, Vehicle.vehicle_type))
+        self.replace(dict(result.all()))
+
+    def replace(self, plates):
+        """Replace the cache with the given plates (plate -> vehicle_type)"""
+        # Patch the index with the difference instead of rebuilding it
+        for plate_number in self._plates.keys() - plates.keys():
+            self._index.discard(plate_number)
+        for plate_number in plates.keys() - self._plates.keys():
+            self._index.add(plate_number)
+        self._plates = plates
+        self.loaded = True
+        self.refreshed_at = get_ist_now()
+
+    async def refresh(self):
+        """Full reload using a fresh session (used by the periodic refresh)"""
+        async with new_session() as db:
+            await self.load(db)
+
+    def lookup(self, plate_number: str):
+        """Registration from memory, counting the lookup. Returns (is_registered, vehicle_type)."""
+        if plate_number in self._plates:
+            self.hits += 1
+            return True, self._plates[plate_number]
+        self.misses += 1
+        return False, None
+
+    def suggest(self, plate_number: str, limit: int = 3):
+        """Registered plates the given plate is probably a misread of"""
+        return self._index.suggest(plate_number, limit)
+
+    def add(self, plate_number: str, vehicle_type=None):
+        self._plates[plate_number] = vehicle_type
+        self._index.add(plate_number)
+
+    def discard(self, plate_number: str):
+        self._plates.pop(plate_number, None)
+        self._index.discard(plate_number)
+
+    def stats(self):
+        """Counters for monitoring"""
+        return {
+            "size": len(self._plates),
+            "hits": self.hits,
+            "misses": self.misses,
+            "loaded": self.loaded,
+            "refreshed_at": self.refreshed_at.isoformat() if self.refreshed_at else None,
+        }
+
+    def __len__(self):
+        return len(self._plates)
+
+
+registry_cache = RegistryCache()
@@ -0,0 +1,607 @@
+"""
+Storage backends for the gate and registry endpoints.
+
+check_entry, check_exit, get_history and the vehicle endpoints go through a
+Repository rather than SQLAlchemy. STORAGE_BACKEND selects the backend:
+
+    sqlite     vehicles / entry_logs / active_entries in the SQLite database
+    firestore  the Android app's Firestore collections (vehicles, entryLogs)
+    memory     the Firestore adapter over MemoryFirestore, an in-process
+               stand-in for tests and local development
+
+Repositories return VehicleRecord and EntryRecord tuples, which have the same
+shape as VEHICLE_COLUMNS and LOG_COLUMNS rows, so the serializers and keyset
+pagination work with any backend. Entry ids are integers in SQLite and
+document ids in Firestore.
+
+The registry cache and the entry tracker stay in front of every backend.
+The on-campus listing, reports, rollups, exports, batch replay, bulk
+import, retention and cross-worker cache coherence read SQLite directly
+and need the sqlite backend; with any other backend their endpoints
+answer 501 (backend.app.sqlite_only) rather than serve the wrong store.
+"""
+
+import asyncio
+from collections import namedtuple
+from contextlib import asynccontextmanager, nullcontext
+
+from sqlalchemy import literal, select, true, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from backend.bulk_vehicles import VEHICLE_COLUMNS, VEHICLE_FIELDS
+from backend.config import FIREBASE_CREDENTIALS, FIRESTORE_BATCH_WINDOW_MS, STORAGE_BACKEND
+from backend.database import ActiveEntry, EntryLog, Vehicle, get_db, serialized_write
+from backend.events import publish_scan
+from backend.frequency import entry_tracker
+from backend.group_commit import group_commit
+from backend.pagination import LOG_ORDER
+from backend.registry import registry_cache
+from backend.timestamps import storage_value, time_tuple
+from backend.timezone_utils import get_ist_datetime, get_ist_now, localize_ist
+from backend.utils import LOG_COLUMNS, pop_active_entry
+
+STORAGE_BACKENDS = ("sqlite", "firestore", "memory")
+
+VehicleRecord = namedtuple("VehicleRecord", VEHICLE_FIELDS)
+EntryRecord = namedtuple("EntryRecord", [column.key for column in LOG_COLUMNS])
+
+
+class Repository:
+    """Storage used by the gate and registry endpoints"""
+
+    async def get_vehicle(self, plate_number):
+        """VehicleRecord or None"""
+        raise NotImplementedError
+
+    async def list_vehicles(self):
+        """All VehicleRecords, ordered by plate"""
+        raise NotImplementedError
+
+    async def add_vehicle(self, plate_number, owner_name, vehicle_type):
+        """Register a vehicle; returns its VehicleRecord, or None if the plate is already registered"""
+        raise NotImplementedError
+
+    async def delete_vehicle(self, plate_number):
+        """Remove a vehicle; returns False if it was not registered"""
+        raise NotImplementedError
+
+    async def history(self, plate_number, limit, before=None):
+        """
+        Up to `limit` EntryRecords of a plate in LOG_ORDER (newest first),
+        strictly after the (entry_time, id) position `before`
+        """
+        raise NotImplementedError
+
+    async def entries_since(self, since):
+        """(plate_number, entry_time) of every entry at or after `since`, oldest first"""
+        raise NotImplementedError
+
+    async def entry_snapshot(self, plate_number, limit, with_vehicle=True):
+        """
+        What check_entry reads: (VehicleRecord or None, the latest `limit`
+        EntryRecords). The vehicle may be skipped when the registry cache
+        already answers.
+        """
+        if not with_vehicle:
+            return None, await self.history(plate_number, limit)
+        vehicle, entries = await asyncio.gather(self.get_vehicle(plate_number), self.history(plate_number, limit))
+        return vehicle, entries
+
+    async def record_entry(self, plate_number, entry_time, is_registered, is_suspicious):
+        """
+        Log an entry, mark the plate as on campus and count it in the entry
+        tracker; returns the EntryRecord
+        """
+        raise NotImplementedError
+
+    def write_scope(self):
+        """Async context manager held from pop_open_entry to close_entry"""
+        return nullcontext()
+
+    async def pop_open_entry(self, plate_number):
+        """Take a plate off campus and return its open EntryRecord, or None if it is not on campus"""
+        raise NotImplementedError
+
+    async def close_entry(self, entry, exit_time, duration_minutes, is_suspicious):
+        """Record the exit of an entry returned by pop_open_entry"""
+        raise NotImplementedError
+
+    def publish(self, kind, data):
+        """Publish the gate scan of the last record_entry / close_entry once it is committed"""
+        publish_scan(kind, data)
+
+
+class SQLiteRepository(Repository):
+    """
+    Repository over an AsyncSession (one per request). With GROUP_COMMIT
+    on, entry and exit writes go through the process-wide group committer
+    instead of committing on the session.
+    """
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+        self._open_logs = {}
+        self._held = []
+        # fast_ack: the last write, whose entry log id is only known once it commits
+        self._acked = None
+
+    async def get_vehicle(self, plate_number):
+        vehicle = await self.db.get(Vehicle, plate_number)
+        if vehicle is None:
+            return None
+        return VehicleRecord(vehicle.plate_number, vehicle.owner_name, vehicle.vehicle_type, vehicle.registered_date)
+
+    async def list_vehicles(self):
+        rows = await self.db.execute(select(*VEHICLE_COLUMNS).order_by(Vehicle.plate_number))
+        return [VehicleRecord(*row) for row in rows]
+
+    async def add_vehicle(self, plate_number, owner_name, vehicle_type):
+        async with serialized_write():
+            if await self.db.get(Vehicle, plate_number):
+                return None
+            vehicle = Vehicle(plate_number=plate_number, owner_name=owner_name, vehicle_type=vehicle_type)
+            self.db.add(vehicle)
+            await self.db.commit()
+        return VehicleRecord(vehicle.plate_number, vehicle.owner_name, vehicle.vehicle_type, vehicle.registered_date)
+
+    async def delete_vehicle(self, plate_number):
+        async with serialized_write():
+            vehicle = await self.db.get(Vehicle, plate_number)
+            if not vehicle:
+                return False
+            await self.db.delete(vehicle)
+            await self.db.commit()
+        return True
+
+    async def history(self, plate_number, limit, before=None):
+        stmt = select(*LOG_COLUMNS).where(EntryLog.plate_number == plate_number)
+        if before:
+            stmt = stmt.where(tuple_(EntryLog.entry_time, EntryLog.id) < time_tuple(*before))
+        return (await self.db.execute(stmt.order_by(*LOG_ORDER).limit(limit))).all()
+
+    async def entry_snapshot(self, plate_number, limit, with_vehicle=True):
+        # One statement: the plate LEFT JOINed to its vehicle and latest
+        # entries (the primary-key join costs nothing, so it is always made)
+        plate = select(literal(plate_number).label("plate_number")).subquery()
+        recent = (
+            select(*LOG_COLUMNS)
+            .where(EntryLog.plate_number == plate_number)
+            .order_by(*LOG_ORDER)
+            .limit(limit)
+            .subquery()
+        )
+        stmt = (
+            select(*VEHICLE_COLUMNS, *recent.c)
+            .select_from(
+                plate.outerjoin(Vehicle, Vehicle.plate_number == plate.c.plate_number).outerjoin(recent, true())
+            )
+            .order_by(recent.c.entry_time.desc(), recent.c.id.desc())
+        )
+        rows = (await self.db.execute(stmt)).all()
+        width = len(VEHICLE_FIELDS)
+        first = rows[0]
+        vehicle = VehicleRecord(*first[:width]) if first[0] is not None else None
+        entries = [EntryRecord(*row[width:]) for row in rows if row[width] is not None]
+        return vehicle, entries
+
+    async def entries_since(self, since):
+        result = await self.db.execute(
+            select(EntryLog.plate_number, EntryLog.entry_time)
+            .where(EntryLog.entry_time >= since)
+            .order_by(EntryLog.entry_time)
+        )
+        return result.all()
+
+    async def record_entry(self, plate_number, entry_time, is_registered, is_suspicious):
+        if group_commit.enabled:
+            written = group_commit.submit(
+                "entry", plate_number, entry_time=entry_time, is_registered=is_registered, is_suspicious=is_suspicious
+            )
+            # Counted before the batch commits, so concurrent scans of the
+            # plate see it; flush() claims the id
+            entry_tracker.record(plate_number, entry_time)
+            log_id = None
+            if group_commit.durable:
+                try:
+                    log_id = await self._committed(written)
+                except Exception:
+                    entry_tracker.forget(plate_number, entry_time)
+                    raise
+            else:
+                await self._acknowledged(written)
+            return EntryRecord(log_id, plate_number, entry_time, None, None, is_registered, is_suspicious)
+        entry_log = EntryLog(
+            plate_number=plate_number,
+            entry_time=entry_time,
+            is_registered=is_registered,
+            is_suspicious=is_suspicious
+        )
+        async with serialized_write():
+            # trg_active_entry puts the plate on campus
+            self.db.add(entry_log)
+            await self.db.commit()
+        entry_tracker.record(plate_number, entry_time, entry_log.id)
+        return _entry_record(entry_log)
+
+    async def _committed(self, written):
+        # Hand the request's connection back to the pool while the batch commits
+        await self.db.commit()
+        return await written
+
+    async def _acknowledged(self, written):
+        self._acked = written
+        await self.db.commit()
+        await group_commit.journaled()
+
+    def publish(self, kind, data):
+        written, self._acked = self._acked, None
+        if written is None:
+            publish_scan(kind, data)
+            return
+
+        def committed(future):
+            # None: an exit dropped because another process closed the entry first
+            if not future.cancelled() and future.exception() is None and future.result() is not None:
+                publish_scan(kind, {**data, "log_id": future.result()})
+        written.add_done_callback(committed)
+
+    def write_scope(self):
+        return self._hold_scope() if group_commit.enabled else serialized_write()
+
+    @asynccontextmanager
+    async def _hold_scope(self):
+        # Releases the plate if the exit fails before close_entry queued its write
+        try:
+            yield
+        finally:
+            for plate_number in self._held:
+                group_commit.release(plate_number)
+            self._held.clear()
+
+    async def pop_open_entry(self, plate_number):
+        if group_commit.enabled:
+            return await self._read_open_entry(plate_number)
+        entry_log = await pop_active_entry(self.db, plate_number)
+        if entry_log is None:
+            await self.db.commit()  # drop a stale on-campus row, if any
+            return None
+        self._open_logs[entry_log.id] = entry_log
+        return _entry_record(entry_log)
+
+    async def _read_open_entry(self, plate_number):
+        while True:
+            if group_commit.durable:
+                await group_commit.settle(plate_number)
+            else:
+                await group_commit.unheld(plate_number)
+            flushed = group_commit.flushed
+            row = (await self.db.execute(
+                select(*LOG_COLUMNS)
+                .join(ActiveEntry, ActiveEntry.entry_log_id == EntryLog.id)
+                .where(
+                    ActiveEntry.plate_number == plate_number,
+                    EntryLog.exit_time.is_(None),
+                    EntryLog.abandoned_at.is_(None),
+                )
+            )).first()
+            # Read again if the plate was held, or its writes were queued
+            # (durable) or committed (fast_ack) meanwhile
+            if group_commit.durable and group_commit.idle(plate_number):
+                entry = EntryRecord(*row) if row is not None else None
+                break
+            if not group_commit.durable and group_commit.flushed == flushed and not group_commit.held(plate_number):
+                entry = _newest_entry(row, group_commit.pending(plate_number))
+                break
+        if entry is None:
+            return None
+        group_commit.hold(plate_number)
+        self._held.append(plate_number)
+        return entry
+
+    async def close_entry(self, entry, exit_time, duration_minutes, is_suspicious):
+        if group_commit.enabled:
+            written = group_commit.submit(
+                "exit", entry.plate_number, entry_log_id=entry.id, entry_time=entry.entry_time,
+                exit_time=exit_time, duration_minutes=duration_minutes, is_suspicious=is_suspicious,
+            )
+            self._held.remove(entry.plate_number)
+            group_commit.release(entry.plate_number)
+            if group_commit.durable:
+                await self._committed(written)
+            else:
+                await self._acknowledged(written)
+            return
+        entry_log = self._open_logs.pop(entry.id)
+        entry_log.exit_time = exit_time
+        entry_log.duration_minutes = duration_minutes
+        entry_log.is_suspicious = is_suspicious
+        await self.db.commit()
+
+
+def _entry_record(entry_log):
+    return EntryRecord(*(getattr(entry_log, column.key) for column in LOG_COLUMNS))
+
+
+def _newest_entry(row, pending):
+    """
+    fast_ack: the entry an exit closes, given the plate's committed open
+    entry and its uncommitted writes. That is the newest entry, committed or
+    queued (without an id), unless an exit of it is queued already.
+    """
+    entries = [EntryRecord(*row)] if row is not None else []
+    entries += [
+        EntryRecord(None, write.plate_number, write.values["entry_time"], None, None,
+                    write.values["is_registered"], write.values["is_suspicious"])
+        for write in pending if write.kind == "entry"
+    ]
+    if not entries:
+        return None
+    # A queued entry may be committed by now: prefer the row with an id
+    newest = max(entries, key=lambda entry: (storage_value(entry.entry_time), entry.id is not None))
+    exited = {storage_value(write.values["entry_time"]) for write in pending if write.kind == "exit"}
+    return None if storage_value(newest.entry_time) in exited else newest
+
+
+# Firestore
+
+VEHICLES_COLLECTION = "vehicles"
+ENTRY_LOGS_COLLECTION = "entryLogs"
+
+# Firestore batches hold at most 500 writes
+MAX_BATCH_WRITES = 500
+
+def _field_filter():
+    """
+    FieldFilter of the Firestore SDK, or of the in-memory stand-in without
+    it. Imported when a FirestoreRepository is built: the SDK takes a good
+    part of a second to import and the SQLite backend never needs it.
+    """
+    try:
+        from google.cloud.firestore_v1.base_query import FieldFilter
+    except ImportError:  # pragma: no cover - optional dependency
+        from backend.memory_firestore import FieldFilter
+    return FieldFilter
+
+
+def _transactional(client):
+    """async_transactional for the client's transactions: the SDK's, or the stand-in's"""
+    from backend.memory_firestore import MemoryFirestore, async_transactional
+
+    if isinstance(client, MemoryFirestore):
+        return async_transactional
+    from google.cloud.firestore_v1.async_transaction import async_transactional
+    return async_transactional
+
+
+def _to_firestore_time(value):
+    """Naive IST -> aware (Firestore treats naive datetimes as UTC)"""
+    return localize_ist(value) if value is not None else value
+
+
+def _from_firestore_time(value):
+    return get_ist_datetime(value) if value is not None else None
+
+
+class WriteBatcher:
+    """
+    Groups the writes of concurrent requests into one Firestore batch.
+    A write waits at most FIRESTORE_BATCH_WINDOW_MS for others to join; a
+    failed commit fails every write in the batch.
+    """
+
+    def __init__(self, client, window_ms=FIRESTORE_BATCH_WINDOW_MS):
+        self.client = client
+        self.window = window_ms / 1000
+        self._pending = []
+        self._flusher = None
+        self.commits = 0
+
+    async def write(self, *ops):
+        """ops: (method, reference, data) with method "set", "update" or "delete"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((ops, future))
+        if sum(len(ops) for ops, _ in self._pending) >= MAX_BATCH_WRITES:
+            await self._flush()
+        elif self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_later())
+        await future
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._flusher = None
+        await self._flush()
+
+    async def _flush(self):
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        batch = self.client.batch()
+        for ops, _ in pending:
+            for method, reference, *data in ops:
+                getattr(batch, method)(reference, *data)
+        try:
+            await batch.commit()
+            self.commits += 1
+        except Exception as e:
+            for _, future in pending:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for _, future in pending:
+            if not future.done():
+                future.set_result(None)
+
+
+class FirestoreRepository(Repository):
+    """
+    Repository over the async Firestore client, with the document layout
+    the Android app uses. Every query matches an index declared in
+    firestore.indexes.json. A plate is on campus while its latest entryLogs
+    document has no exitTime (there is no on-campus collection).
+    """
+
+    def __init__(self, client, window_ms=FIRESTORE_BATCH_WINDOW_MS):
+        self.client = client
+        self.vehicles = client.collection(VEHICLES_COLLECTION)
+        self.entry_logs = client.collection(ENTRY_LOGS_COLLECTION)
+        self.writer = WriteBatcher(client, window_ms)
+        self._filter = _field_filter()
+        self._transactional = _transactional(client)
+
+    @staticmethod
+    def _vehicle(snapshot):
+        data = snapshot.to_dict()
+        return VehicleRecord(
+            data.get("plateNumber", snapshot.id),
+            data.get("ownerName"),
+            data.get("vehicleType"),
+            _from_firestore_time(data.get("registeredDate")),
+        )
+
+    @staticmethod
+    def _entry(snapshot):
+        data = snapshot.to_dict()
+        return EntryRecord(
+            snapshot.id,
+            data["plateNumber"],
+            _from_firestore_time(data["entryTime"]),
+            _from_firestore_time(data.get("exitTime")),
+            data.get("durationMinutes"),
+            bool(data.get("isRegistered")),
+            bool(data.get("isSuspicious")),
+        )
+
+    def _plate_logs(self, plate_number):
+        return self.entry_logs.where(filter=self._filter("plateNumber", "==", plate_number))
+
+    async def get_vehicle(self, plate_number):
+        snapshot = await self.vehicles.document(plate_number).get()
+        return self._vehicle(snapshot) if snapshot.exists else None
+
+    async def list_vehicles(self):
+        vehicles = [self._vehicle(snapshot) async for snapshot in self.vehicles.stream()]
+        return sorted(vehicles, key=lambda vehicle: vehicle.plate_number)
+
+    async def add_vehicle(self, plate_number, owner_name, vehicle_type):
+        reference = self.vehicles.document(plate_number)
+        if (await reference.get()).exists:
+            return None
+        registered_date = get_ist_datetime()
+        await self.writer.write(("set", reference, {
+            "plateNumber": plate_number,
+            "ownerName": owner_name,
+            "vehicleType": vehicle_type,
+            "registeredDate": _to_firestore_time(registered_date),
+        }))
+        return VehicleRecord(plate_number, owner_name, vehicle_type, registered_date)
+
+    async def delete_vehicle(self, plate_number):
+        reference = self.vehicles.document(plate_number)
+        if not (await reference.get()).exists:
+            return False
+        await self.writer.write(("delete", reference))
+        return True
+
+    async def history(self, plate_number, limit, before=None):
+        # Same order as LOG_ORDER, with document ids for row ids
+        query = (
+            self._plate_logs(plate_number)
+            .order_by("entryTime", direction="DESCENDING")
+            .order_by("__name__", direction="DESCENDING")
+        )
+        if before:
+            query = query.start_after({"entryTime": _to_firestore_time(before[0]), "__name__": str(before[1])})
+        return [self._entry(snapshot) async for snapshot in query.limit(limit).stream()]
+
+    async def entries_since(self, since):
+        query = self.entry_logs.where(filter=self._filter("entryTime", ">=", _to_firestore_time(since)))
+        entries = [self._entry(snapshot) async for snapshot in query.order_by("entryTime").stream()]
+        return [(entry.plate_number, entry.entry_time) for entry in entries]
+
+    async def record_entry(self, plate_number, entry_time, is_registered, is_suspicious):
+        reference = self.entry_logs.document()
+        await self.writer.write(("set", reference, {
+            "plateNumber": plate_number,
+            "entryTime": _to_firestore_time(entry_time),
+            "exitTime": None,
+            "durationMinutes": None,
+            "isRegistered": is_registered,
+            "isSuspicious": is_suspicious,
+        }))
+        entry_tracker.record(plate_number, entry_time, reference.id)
+        return EntryRecord(reference.id, plate_number, entry_time, None, None, is_registered, is_suspicious)
+
+    async def pop_open_entry(self, plate_number):
+        # Only the latest entry can be open, as with active_entries in SQLite.
+        # Setting its exitTime in a transaction takes the plate off campus, so
+        # of two concurrent exits only one gets the entry; close_entry then
+        # records the real exit time and duration.
+        query = self._plate_logs(plate_number).order_by("entryTime", direction="DESCENDING").limit(1)
+
+        @self._transactional
+        async def claim(transaction):
+            async for snapshot in query.stream(transaction=transaction):
+                entry = self._entry(snapshot)
+                if entry.exit_time is not None:
+                    return None
+                transaction.update(snapshot.reference, {"exitTime": _to_firestore_time(get_ist_now())})
+                return entry
+            return None
+
+        return await claim(self.client.transaction())
+
+    async def close_entry(self, entry, exit_time, duration_minutes, is_suspicious):
+        await self.writer.write(("update", self.entry_logs.document(entry.id), {
+            "exitTime": _to_firestore_time(exit_time),
+            "durationMinutes": duration_minutes,
+            "isSuspicious": is_suspicious,
+        }))
+
+
+def firestore_client():
+    """Async Firestore client; one per process, its gRPC channel is shared by all requests"""
+    import firebase_admin
+    from firebase_admin import credentials, firestore_async
+
+    try:
+        firebase_admin.get_app()
+    except ValueError:  # not initialized yet
+        firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS))
+    return firestore_async.client()
+
+
+_shared = None
+
+
+def shared_repository():
+    """The process-wide repository of the firestore / memory backends"""
+    global _shared
+    if _shared is None:
+        if STORAGE_BACKEND == "firestore":
+            _shared = FirestoreRepository(firestore_client())
+        elif STORAGE_BACKEND == "memory":
+            from backend.memory_firestore import MemoryFirestore
+            _shared = FirestoreRepository(MemoryFirestore())
+        else:
+            raise ValueError(f"Unknown STORAGE_BACKEND {STORAGE_BACKEND!r}, use one of: {', '.join(STORAGE_BACKENDS)}")
+    return _shared
+
+
+async def get_repository():
+    """FastAPI dependency: the configured Repository"""
+    if STORAGE_BACKEND == "sqlite":
+        async for db in get_db():
+            yield SQLiteRepository(db)
+    else:
+        yield shared_repository()
+
+
+async def load_registry(repository):
+    """Replace the registry cache with the vehicles of a repository"""
+    registry_cache.replace({vehicle.plate_number: vehicle.vehicle_type for vehicle in await repository.list_vehicles()})
+
+
+async def load_entry_windows(repository):
+    """Reload the entry tracker from a repository's entries inside the longest window"""
+    if entry_tracker.windows:
+        entry_tracker.load(await repository.entries_since(get_ist_now() - entry_tracker.windows[-1]))
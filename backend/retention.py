@@ -0,0 +1,309 @@
+"""
+Retention for entry_logs: archive old visits to files and compact the database.
+
+Closed and abandoned logs whose entry is older than RETENTION_DAYS are
+written to date-partitioned archive files and deleted from entry_logs in
+batches:
+
+    ARCHIVE_DIR/entry_logs/date=2024-01-05/part-<first id>-<last id>.ndjson.gz
+    ARCHIVE_DIR/entry_logs/date=2024-01-05/part-<first id>-<last id>.parquet
+
+Each batch is deleted in a transaction that is committed only after its
+archive file is on disk, so a crash can at worst leave a row both archived
+and live (or archived twice); readers drop duplicate ids. Open logs and
+logs still referenced from active_entries are never archived. The same
+transaction advances the archive horizon past the newest archived exit, so
+rebuilding rollups (backend.rollups.rebuild) keeps the buckets of archived
+days instead of recomputing them from the rows that are left.
+
+After deleting, freed pages are returned with PRAGMA incremental_vacuum
+(databases created with auto_vacuum=INCREMENTAL) and the planner statistics
+are refreshed with PRAGMA optimize.
+
+Usage:
+    python -m backend.retention [--days 365] [--format parquet] [--convert]
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import logging
+import os
+import time
+from collections import defaultdict, namedtuple
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, or_, select, text
+
+from backend import rollups
+from backend.config import ARCHIVE_DIR, ARCHIVE_FORMAT, RETENTION_BATCH_SIZE, RETENTION_DAYS
+from backend.database import ActiveEntry, EntryLog
+from backend.serialization import dumps
+from backend.timezone_utils import get_ist_now
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMATS = {"ndjson": ".ndjson.gz", "parquet": ".parquet"}
+
+ARCHIVE_COLUMNS = (
+    "id", "plate_number", "entry_time", "exit_time", "duration_minutes",
+    "is_registered", "is_suspicious", "created_at",
+)
+
+# An archived row in LOG_COLUMNS order, so it pages and serializes like a live one
+ArchivedLog = namedtuple("ArchivedLog", ARCHIVE_COLUMNS[:-1])
+
+# pyarrow, once _require_pyarrow() imported it (it is slow to import and
+# only Parquet archives need it)
+pa = pq = None
+
+# Freed pages handed back per incremental_vacuum statement
+VACUUM_STEP_PAGES = 2000
+
+# Pause between batches so gate writes get the write lock in between
+BATCH_PAUSE_SECONDS = 0.05
+
+
+def _expired_logs(cutoff, limit):
+    """Oldest closed or abandoned logs entered before `cutoff` that nothing points at"""
+    return (
+        select(*(getattr(EntryLog, column) for column in ARCHIVE_COLUMNS))
+        .where(
+            EntryLog.entry_time < cutoff,
+            or_(EntryLog.exit_time.is_not(None), EntryLog.abandoned_at.is_not(None)),
+            EntryLog.id.not_in(select(ActiveEntry.entry_log_id).where(ActiveEntry.entry_log_id.is_not(None))),
+        )
+        .order_by(EntryLog.entry_time, EntryLog.id)
+        .limit(limit)
+    )
+
+
+# Total rows archived by this process
+archived_total = 0
+
+
+class ArchiveUnavailable(RuntimeError):
+    """Raised when the Parquet format is requested without pyarrow"""
+
+
+def _require_pyarrow(message):
+    global pa, pq
+    if pq is None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:  # pragma: no cover - optional dependency
+            raise ArchiveUnavailable(message) from None
+
+
+def _check_format(fmt):
+    if fmt not in ARCHIVE_FORMATS:
+        raise ValueError(f"Unknown archive format {fmt!r}, use one of: {', '.join(ARCHIVE_FORMATS)}")
+    if fmt == "parquet":
+        _require_pyarrow("Parquet archives need pyarrow: pip install pyarrow")
+
+
+def _partition_dir(archive_dir, day):
+    return os.path.join(archive_dir, "entry_logs", f"date={day}")
+
+
+def _parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def _write_ndjson(path, rows):
+    with gzip.open(path, "wb") as f:
+        for row in rows:
+            f.write(dumps(dict(zip(ARCHIVE_COLUMNS, row))) + b"\n")
+
+
+def _write_parquet(path, rows):
+    schema = pa.schema([
+        ("id", pa.int64()),
+        ("plate_number", pa.string()),
+        ("entry_time", pa.timestamp("us")),
+        ("exit_time", pa.timestamp("us")),
+        ("duration_minutes", pa.float64()),
+        ("is_registered", pa.bool_()),
+        ("is_suspicious", pa.bool_()),
+        ("created_at", pa.timestamp("us")),
+    ])
+    columns = list(zip(*rows))
+    pq.write_table(pa.Table.from_arrays([pa.array(c, t) for c, t in zip(columns, schema.types)], schema=schema), path)
+
+
+def write_partition(archive_dir, day, rows, fmt):
+    """Write rows of one entry date to a new archive file; returns its path"""
+    directory = _partition_dir(archive_dir, day)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{rows[0][0]}-{rows[-1][0]}{ARCHIVE_FORMATS[fmt]}")
+    tmp = path + ".tmp"
+    if fmt == "parquet":
+        _write_parquet(tmp, rows)
+    else:
+        _write_ndjson(tmp, rows)
+    with open(tmp, "rb+") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def archive_batch(conn, cutoff, archive_dir=ARCHIVE_DIR, fmt=ARCHIVE_FORMAT, batch_size=RETENTION_BATCH_SIZE):
+    """
+    Archive and delete one batch of expired logs on a sync Connection.
+    Returns the number of rows archived (0 when nothing is left).
+    """
+    with conn.begin() as transaction:
+        rows = conn.execute(_expired_logs(cutoff, batch_size)).all()
+        if not rows:
+            return 0
+
+        # Deleting first takes the write lock; fewer deleted rows means another
+        # worker archived part of this batch, so leave it to that worker
+        deleted = conn.execute(delete(EntryLog).where(EntryLog.id.in_([row.id for row in rows]))).rowcount
+        if deleted != len(rows):
+            transaction.rollback()
+            return 0
+
+        rollups.advance_archive_horizon(conn, max(row.exit_time or row.entry_time for row in rows))
+
+        partitions = defaultdict(list)
+        for row in rows:
+            partitions[row.entry_time.date().isoformat()].append(tuple(row))
+        for day, partition in partitions.items():
+            write_partition(archive_dir, day, partition, fmt)
+    return len(rows)
+
+
+def vacuum(conn, max_pages=None):
+    """
+    Return free pages to the filesystem when the database uses
+    auto_vacuum=INCREMENTAL, then refresh planner statistics.
+    Returns the number of pages released.
+    """
+    released = 0
+    if conn.execute(text("PRAGMA auto_vacuum")).scalar() == 2:
+        while max_pages is None or released < max_pages:
+            free = conn.execute(text("PRAGMA freelist_count")).scalar()
+            if not free:
+                break
+            step = min(free, VACUUM_STEP_PAGES)
+            # executescript steps the pragma to completion; execute() would
+            # stop after the first page
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({step})")
+            released += step
+    conn.execute(text("PRAGMA optimize"))
+    conn.commit()
+    return released
+
+
+def enforce_retention(engine, days=RETENTION_DAYS, archive_dir=ARCHIVE_DIR, fmt=ARCHIVE_FORMAT,
+                      batch_size=RETENTION_BATCH_SIZE):
+    """Archive every log older than `days` days, then compact. Returns stats."""
+    global archived_total
+    _check_format(fmt)
+    cutoff = get_ist_now() - timedelta(days=days)
+    archived = 0
+    with engine.connect() as conn:
+        while count := archive_batch(conn, cutoff, archive_dir, fmt, batch_size):
+            archived += count
+            archived_total += count
+            time.sleep(BATCH_PAUSE_SECONDS)
+        released = vacuum(conn) if archived else 0
+
+    if archived:
+        logger.info("Archived %d entry logs older than %s, released %d pages", archived, cutoff, released)
+    return {"archived": archived, "cutoff": cutoff.isoformat(), "released_pages": released}
+
+
+def _read_partition_file(path, plate_number):
+    if path.endswith(ARCHIVE_FORMATS["parquet"]):
+        _require_pyarrow(f"{path}: reading Parquet archives needs pyarrow")
+        table = pq.read_table(path, filters=[("plate_number", "=", plate_number)])
+        return [ArchivedLog(*(row[c] for c in ArchivedLog._fields)) for row in table.to_pylist()]
+
+    # Lines are compact JSON, so a substring test skips other plates unparsed
+    needle = b'"plate_number":' + dumps(plate_number)
+    rows = []
+    with gzip.open(path, "rb") as f:
+        for line in f:
+            if needle not in line:
+                continue
+            record = json.loads(line)
+            rows.append(ArchivedLog(
+                record["id"], record["plate_number"],
+                _parse_datetime(record["entry_time"]), _parse_datetime(record["exit_time"]),
+                record["duration_minutes"], record["is_registered"], record["is_suspicious"],
+            ))
+    return rows
+
+
+def read_archived_history(plate_number, limit, before=None, archive_dir=ARCHIVE_DIR):
+    """
+    Up to `limit` archived logs of a plate, newest first (entry_time, id DESC),
+    strictly after the `before` (entry_time, id) position when given.
+    Partitions are scanned newest first and the scan stops once `limit` rows
+    are found, since older partitions can only hold older rows.
+    """
+    partitions = glob.glob(_partition_dir(archive_dir, "*"))
+    days = sorted((os.path.basename(path)[len("date="):] for path in partitions), reverse=True)
+    rows = []
+    for day in days:
+        if before and day > before[0].date().isoformat():
+            continue
+        for path in glob.glob(os.path.join(_partition_dir(archive_dir, day), "part-*")):
+            if path.endswith(".tmp"):
+                continue
+            rows.extend(
+                row for row in _read_partition_file(path, plate_number)
+                if before is None or (row.entry_time, row.id) < before
+            )
+        if len(rows) >= limit:
+            break
+    return merge_history(rows, [], limit)
+
+
+def merge_history(live, archived, limit):
+    """Merge live and archived rows in LOG_ORDER, dropping duplicate ids"""
+    seen = set()
+    merged = []
+    for row in sorted([*live, *archived], key=lambda row: (row.entry_time, row.id), reverse=True):
+        if row.id not in seen:
+            seen.add(row.id)
+            merged.append(row)
+            if len(merged) == limit:
+                break
+    return merged
+
+
+def convert_to_incremental(engine):
+    """Switch an existing database to auto_vacuum=INCREMENTAL (rewrites the file)"""
+    with engine.connect() as conn:
+        conn.execute(text("PRAGMA auto_vacuum = INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+        return conn.execute(text("PRAGMA auto_vacuum")).scalar() == 2
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old entry logs and compact the database")
+    parser.add_argument("--days", type=float, default=RETENTION_DAYS or 365,
+                        help="archive closed logs older than this many days")
+    parser.add_argument("--format", choices=ARCHIVE_FORMATS, default=ARCHIVE_FORMAT)
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR)
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--convert", action="store_true",
+                        help="first switch the database to auto_vacuum=INCREMENTAL with a full VACUUM")
+    args = parser.parse_args()
+
+    from backend.database import Base, engine
+
+    Base.metadata.create_all(engine)
+    if args.convert:
+        print(f"auto_vacuum=INCREMENTAL: {convert_to_incremental(engine)}")
+    stats = enforce_retention(engine, args.days, args.archive_dir, args.format, args.batch_size)
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
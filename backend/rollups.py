@@ -0,0 +1,265 @@
+"""
+Hourly and daily traffic rollups over entry_logs.
+
+SQLite triggers keep traffic_rollups current inside the same transaction
+as every insert into entry_logs and every exit recorded on it, so the gate
+endpoints, the batch endpoints and offline scripts all feed the same totals.
+
+- entries, unique plates, registered/unregistered and suspicious are counted
+  in the bucket of the entry time (an exit that marks a visit suspicious
+  updates the bucket the visit started in)
+- exits and durations are counted in the bucket of the exit time; durations
+  are kept as a sum, a histogram and the shortest and longest visit, so
+  averages and percentiles can be read back without touching entry_logs
+- visits abandoned by a re-entry without an exit scan (abandoned_at set,
+  exit_time NULL) are not exits until a replayed exit scan closes them
+
+Rebuild from history with:
+    python -m backend.rollups [--since 2024-01-01]
+
+A rebuild only recomputes buckets from the archive horizon on: the
+retention job deletes archived rows from entry_logs, so older buckets are
+kept as they are.
+"""
+
+import argparse
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from backend.timestamps import sql_time, storage_value
+
+# Bucket keys in SQLAlchemy's SQLite datetime format, so they compare
+# correctly against bound datetime parameters
+BUCKET_FORMATS = {
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000",
+}
+
+# Upper edges (minutes) of the duration histogram bins; the last bin is open
+DURATION_BINS = (1, 2, 5, 10, 15, 20, 30, 45, 60, 90, 120, 180, 240, 360, 480, 720, 1440)
+
+
+def _bin_expr(column):
+    """SQL CASE mapping a duration in minutes to its histogram bin index"""
+    cases = " ".join(f"WHEN {column} < {edge} THEN {i}" for i, edge in enumerate(DURATION_BINS))
+    return f"CASE {cases} ELSE {len(DURATION_BINS)} END"
+
+
+def _bucket(granularity, column):
+    return f"strftime('{BUCKET_FORMATS[granularity]}', {sql_time(column)})"
+
+
+def _entry_trigger_body(granularity):
+    bucket = _bucket(granularity, "NEW.entry_time")
+    return f"""
+        INSERT INTO traffic_rollups
+            (granularity, bucket_start, entries, exits, unique_plates,
+             registered_entries, unregistered_entries, suspicious, duration_sum)
+        VALUES ('{granularity}', {bucket}, 1, 0,
+                NOT EXISTS (SELECT 1 FROM traffic_rollup_plates
+                            WHERE granularity = '{granularity}' AND bucket_start = {bucket}
+                              AND plate_number = NEW.plate_number),
+                NEW.is_registered = 1, NEW.is_registered = 0, NEW.is_suspicious = 1, 0)
+        ON CONFLICT (granularity, bucket_start) DO UPDATE SET
+            entries = entries + 1,
+            unique_plates = unique_plates + excluded.unique_plates,
+            registered_entries = registered_entries + excluded.registered_entries,
+            unregistered_entries = unregistered_entries + excluded.unregistered_entries,
+            suspicious = suspicious + excluded.suspicious;
+        INSERT OR IGNORE INTO traffic_rollup_plates (granularity, bucket_start, plate_number)
+        VALUES ('{granularity}', {bucket}, NEW.plate_number);
+    """
+
+
+def _exit_trigger_body(granularity):
+    bucket = _bucket(granularity, "NEW.exit_time")
+    return f"""
+        INSERT INTO traffic_rollups
+            (granularity, bucket_start, entries, exits, unique_plates,
+             registered_entries, unregistered_entries, suspicious, duration_sum,
+             duration_min, duration_max)
+        VALUES ('{granularity}', {bucket}, 0, 1, 0, 0, 0, 0, NEW.duration_minutes,
+                NEW.duration_minutes, NEW.duration_minutes)
+        ON CONFLICT (granularity, bucket_start) DO UPDATE SET
+            exits = exits + 1,
+            duration_sum = duration_sum + excluded.duration_sum,
+            duration_min = min(coalesce(duration_min, excluded.duration_min), excluded.duration_min),
+            duration_max = max(coalesce(duration_max, excluded.duration_max), excluded.duration_max);
+        INSERT INTO traffic_duration_bins (granularity, bucket_start, bin, count)
+        VALUES ('{granularity}', {bucket}, {_bin_expr("NEW.duration_minutes")}, 1)
+        ON CONFLICT (granularity, bucket_start, bin) DO UPDATE SET count = count + 1;
+    """
+
+
+def _suspicious_trigger_body(granularity):
+    return f"""
+        UPDATE traffic_rollups SET suspicious = suspicious + 1
+        WHERE granularity = '{granularity}' AND bucket_start = {_bucket(granularity, "NEW.entry_time")};
+    """
+
+
+TRIGGERS = {
+    "trg_rollup_entry": (
+        "AFTER INSERT ON entry_logs",
+        _entry_trigger_body,
+    ),
+    "trg_rollup_exit": (
+        "AFTER UPDATE OF exit_time, duration_minutes ON entry_logs "
+        "WHEN (OLD.exit_time IS NULL OR OLD.duration_minutes IS NULL) "
+        "AND NEW.exit_time IS NOT NULL AND NEW.duration_minutes IS NOT NULL",
+        _exit_trigger_body,
+    ),
+    "trg_rollup_suspicious": (
+        "AFTER UPDATE OF is_suspicious ON entry_logs "
+        "WHEN NEW.is_suspicious = 1 AND coalesce(OLD.is_suspicious, 0) = 0",
+        _suspicious_trigger_body,
+    ),
+}
+
+
+def triggers_current(conn):
+    """Whether the installed rollup triggers read the configured TIMESTAMP_STORAGE format"""
+    sql = conn.execute(text("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'trg_rollup_entry'")).scalar()
+    return sql is None or _bucket("hour", "NEW.entry_time") in sql
+
+
+def create_triggers(conn):
+    """(Re)create the rollup triggers on a sync Connection"""
+    for name, (when, body) in TRIGGERS.items():
+        statements = "".join(body(granularity) for granularity in BUCKET_FORMATS)
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(text(f"CREATE TRIGGER {name} {when} BEGIN {statements} END"))
+
+
+def archive_horizon(conn):
+    """First day whose buckets rebuild() can recompute, or None when nothing was archived"""
+    value = conn.execute(text("SELECT rollups_from FROM archive_horizon WHERE id = 1")).scalar()
+    return datetime.fromisoformat(value) if value else None
+
+
+def advance_archive_horizon(conn, newest):
+    """Record that rows up to `newest` (an entry or exit time) left entry_logs"""
+    conn.execute(text("""
+        INSERT INTO archive_horizon (id, rollups_from) VALUES (1, :day)
+        ON CONFLICT (id) DO UPDATE SET rollups_from = max(rollups_from, excluded.rollups_from)
+    """), {"day": (newest + timedelta(days=1)).strftime(BUCKET_FORMATS["day"])})
+
+
+def rebuild(conn, since=None):
+    """
+    Recompute rollups from entry_logs on a sync Connection, either entirely
+    or for every bucket from the day of `since` onwards. Buckets before the
+    archive horizon are kept: their rows are no longer in entry_logs.
+    """
+    since = max(since or datetime.min, archive_horizon(conn) or datetime.min)
+    since = since.replace(hour=0, minute=0, second=0, microsecond=0)
+    params = {"since": since.strftime(BUCKET_FORMATS["day"]), "since_time": storage_value(since)}
+    for granularity in BUCKET_FORMATS:
+        entry_bucket = _bucket(granularity, "entry_time")
+        exit_bucket = _bucket(granularity, "exit_time")
+        scope = f"granularity = '{granularity}' AND bucket_start >= :since"
+        for table in ("traffic_rollups", "traffic_rollup_plates", "traffic_duration_bins"):
+            conn.execute(text(f"DELETE FROM {table} WHERE {scope}"), params)
+
+        conn.execute(text(f"""
+            INSERT INTO traffic_rollups
+                (granularity, bucket_start, entries, exits, unique_plates,
+                 registered_entries, unregistered_entries, suspicious, duration_sum)
+            SELECT '{granularity}', {entry_bucket}, count(*), 0, count(DISTINCT plate_number),
+                   sum(is_registered = 1), sum(is_registered = 0), sum(is_suspicious = 1), 0
+            FROM entry_logs WHERE entry_time >= :since_time
+            GROUP BY 2
+        """), params)
+        conn.execute(text(f"""
+            INSERT INTO traffic_rollups
+                (granularity, bucket_start, entries, exits, unique_plates,
+                 registered_entries, unregistered_entries, suspicious, duration_sum,
+                 duration_min, duration_max)
+            SELECT '{granularity}', {exit_bucket}, 0, count(*), 0, 0, 0, 0, total(duration_minutes),
+                   min(duration_minutes), max(duration_minutes)
+            FROM entry_logs WHERE exit_time >= :since_time AND duration_minutes IS NOT NULL
+            GROUP BY 2
+            ON CONFLICT (granularity, bucket_start) DO UPDATE SET
+                exits = excluded.exits, duration_sum = excluded.duration_sum,
+                duration_min = excluded.duration_min, duration_max = excluded.duration_max
+        """), params)
+        conn.execute(text(f"""
+            INSERT OR IGNORE INTO traffic_rollup_plates (granularity, bucket_start, plate_number)
+            SELECT DISTINCT '{granularity}', {entry_bucket}, plate_number
+            FROM entry_logs WHERE entry_time >= :since_time
+        """), params)
+        conn.execute(text(f"""
+            INSERT INTO traffic_duration_bins (granularity, bucket_start, bin, count)
+            SELECT '{granularity}', {exit_bucket}, {_bin_expr("duration_minutes")}, count(*)
+            FROM entry_logs WHERE exit_time >= :since_time AND duration_minutes IS NOT NULL
+            GROUP BY 2, 3
+        """), params)
+
+
+def duration_percentile(bins, pct, shortest=None, longest=None):
+    """
+    Estimate a duration percentile (minutes) from {bin index: count},
+    interpolating linearly inside the bin that holds the rank, and clamped
+    to the bucket's shortest and longest visit when they are known.
+    """
+    total = sum(bins.values())
+    if not total:
+        return None
+    estimate = _interpolate(bins, pct, total)
+    if shortest is not None:
+        estimate = max(estimate, shortest)
+    if longest is not None:
+        estimate = min(estimate, longest)
+    return estimate
+
+
+def _interpolate(bins, pct, total):
+    rank = pct / 100 * total
+    seen = 0
+    for index in range(len(DURATION_BINS) + 1):
+        count = bins.get(index, 0)
+        if count and seen + count >= rank:
+            lower = DURATION_BINS[index - 1] if index else 0
+            if index == len(DURATION_BINS):
+                return float(lower)  # open-ended last bin
+            return lower + (DURATION_BINS[index] - lower) * (rank - seen) / count
+        seen += count
+    return float(DURATION_BINS[-1])
+
+
+def serialize_rollup(rollup, bins):
+    """API representation of one rollup row and its duration histogram"""
+    return {
+        "bucket_start": rollup.bucket_start.isoformat(),
+        "entries": rollup.entries,
+        "exits": rollup.exits,
+        "unique_plates": rollup.unique_plates,
+        "registered_entries": rollup.registered_entries,
+        "unregistered_entries": rollup.unregistered_entries,
+        "suspicious": rollup.suspicious,
+        "avg_duration_minutes": rollup.duration_sum / rollup.exits if rollup.exits else None,
+        "p50_duration_minutes": duration_percentile(bins, 50, rollup.duration_min, rollup.duration_max),
+        "p90_duration_minutes": duration_percentile(bins, 90, rollup.duration_min, rollup.duration_max),
+        "p99_duration_minutes": duration_percentile(bins, 99, rollup.duration_min, rollup.duration_max),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild traffic rollups from entry_logs")
+    parser.add_argument("--since", type=datetime.fromisoformat,
+                        help="only rebuild buckets from this date on (default: everything)")
+    args = parser.parse_args()
+
+    from backend.database import engine, Base, migrate_db
+
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        migrate_db(conn)
+        rebuild(conn, args.since)
+        rows = conn.execute(text("SELECT count(*) FROM traffic_rollups")).scalar()
+    print(f"Rebuilt rollups: {rows} hourly/daily buckets")
+
+
+if __name__ == "__main__":
+    main()
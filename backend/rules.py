@@ -0,0 +1,182 @@
+"""
+Configurable suspicion rules for the entry and exit gates.
+
+Rules are declared as JSON objects (DEFAULT_RULES, or the list in the file
+named by SUSPICION_RULES_FILE) and compiled once into plain predicates. They
+are evaluated against in-memory state only: prior-entry counts from the
+entry tracker, registration and vehicle type from the registry cache, and
+the scan's own timestamps. Adding rules never adds queries to the gate path.
+
+Every rule has a unique "name", a "type", a "reason" shown at the gate and
+optional filters:
+    "applies_to":    "unregistered" (default), "registered" or "all"
+    "vehicle_types": only registered vehicles of these types
+
+Rule types:
+    window_count  {"window_minutes": 20, "min_prior": 1}
+                  entry scan with at least min_prior earlier entries of the
+                  same plate inside the window
+    time_of_day   {"start": "22:00", "end": "06:00"}
+                  entry scan inside the time range (may wrap midnight)
+    duration      {"max_minutes": 20}
+                  exit scan after a visit longer than max_minutes
+"""
+
+import json
+from datetime import time, timedelta
+
+from backend.config import SUSPICION_RULES_FILE
+
+# Today's gate behaviour
+DEFAULT_RULES = [
+    {
+        "name": "frequent_20min",
+        "type": "window_count",
+        "window_minutes": 20,
+        "min_prior": 1,
+        "reason": "Entered more than 1 time in last 20 minutes",
+    },
+    {
+        "name": "frequent_1hr",
+        "type": "window_count",
+        "window_minutes": 60,
+        "min_prior": 1,
+        "reason": "Entered 2+ times in last 1 hour",
+    },
+    {
+        "name": "long_stay",
+        "type": "duration",
+        "max_minutes": 20,
+        "applies_to": "all",
+        "reason": ">20min",
+    },
+]
+
+APPLIES_TO = ("unregistered", "registered", "all")
+
+
+class Rule:
+    """A compiled rule: `check(scan)` is only called when `matches(scan)`"""
+
+    __slots__ = ("name", "reason", "phase", "window", "limit", "matches", "check")
+
+    def __init__(self, name, reason, phase, matches, check, window=None, limit=None):
+        self.name = name
+        self.reason = reason
+        self.phase = phase  # "entry" or "exit"
+        self.window = window
+        self.limit = limit  # min_prior of a window_count rule, max_minutes of a duration rule
+        self.matches = matches
+        self.check = check
+
+
+class Scan:
+    """What the rules can see about one gate scan"""
+
+    __slots__ = ("time", "is_registered", "vehicle_type", "prior", "duration")
+
+    def __init__(self, time, is_registered, vehicle_type=None, prior=None, duration=None):
+        self.time = time
+        self.is_registered = is_registered
+        self.vehicle_type = vehicle_type
+        self.prior = prior          # window (timedelta) -> earlier entries inside it
+        self.duration = duration    # minutes, exit scans only
+
+
+def _parse_time(value, name):
+    try:
+        return time.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Rule {name!r}: invalid time {value!r}, expected HH:MM")
+
+
+def _required(spec, field, name, kind=float):
+    if field not in spec:
+        raise ValueError(f"Rule {name!r}: missing {field!r}")
+    try:
+        return kind(spec[field])
+    except (TypeError, ValueError):
+        raise ValueError(f"Rule {name!r}: invalid {field!r}: {spec[field]!r}")
+
+
+def _subject_filter(spec, name):
+    """Predicate for applies_to / vehicle_types"""
+    applies_to = spec.get("applies_to", "unregistered")
+    if applies_to not in APPLIES_TO:
+        raise ValueError(f"Rule {name!r}: applies_to must be one of {', '.join(APPLIES_TO)}")
+    vehicle_types = frozenset(spec.get("vehicle_types") or ())
+
+    def matches(scan):
+        if applies_to == "unregistered" and scan.is_registered:
+            return False
+        if applies_to == "registered" and not scan.is_registered:
+            return False
+        return not vehicle_types or scan.vehicle_type in vehicle_types
+    return matches
+
+
+def compile_rule(spec):
+    name = spec.get("name")
+    if not name:
+        raise ValueError(f"Rule without a name: {spec!r}")
+    kind = spec.get("type")
+    reason = spec.get("reason", name)
+    matches = _subject_filter(spec, name)
+
+    if kind == "window_count":
+        window = timedelta(minutes=_required(spec, "window_minutes", name))
+        min_prior = _required(spec, "min_prior", name, int)
+        return Rule(name, reason, "entry", matches, lambda scan: scan.prior(window) >= min_prior, window, min_prior)
+
+    if kind == "time_of_day":
+        start = _parse_time(spec.get("start"), name)
+        end = _parse_time(spec.get("end"), name)
+        if start <= end:
+            check = lambda scan: start <= scan.time.time() < end
+        else:  # wraps midnight
+            check = lambda scan: scan.time.time() >= start or scan.time.time() < end
+        return Rule(name, reason, "entry", matches, check)
+
+    if kind == "duration":
+        max_minutes = _required(spec, "max_minutes", name)
+        return Rule(name, reason, "exit", matches, lambda scan: scan.duration > max_minutes, limit=max_minutes)
+
+    raise ValueError(f"Rule {name!r}: unknown type {kind!r}")
+
+
+class RuleSet:
+    """Compiled rules, evaluated in declaration order"""
+
+    def __init__(self, specs):
+        rules = [compile_rule(spec) for spec in specs]
+        names = [rule.name for rule in rules]
+        duplicates = {name for name in names if names.count(name) > 1}
+        if duplicates:
+            raise ValueError(f"Duplicate rule names: {', '.join(sorted(duplicates))}")
+
+        self.entry_rules = [rule for rule in rules if rule.phase == "entry"]
+        self.exit_rules = [rule for rule in rules if rule.phase == "exit"]
+        # Windows the entry tracker has to keep
+        self.windows = tuple(sorted({rule.window for rule in rules if rule.window}))
+
+    def check_entry(self, scan):
+        """Rules triggered by an entry scan"""
+        return [rule for rule in self.entry_rules if rule.matches(scan) and rule.check(scan)]
+
+    def check_exit(self, scan):
+        """Rules triggered by an exit scan"""
+        return [rule for rule in self.exit_rules if rule.matches(scan) and rule.check(scan)]
+
+
+def load_rule_specs(path=SUSPICION_RULES_FILE):
+    """Rule specs from a JSON file, or the defaults when no file is configured"""
+    if not path:
+        return DEFAULT_RULES
+    with open(path) as f:
+        specs = json.load(f)
+    if not isinstance(specs, list):
+        raise ValueError(f"{path}: expected a JSON list of rules")
+    return specs
+
+
+suspicion_rules = RuleSet(load_rule_specs())
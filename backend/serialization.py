@@ -0,0 +1,44 @@
+"""
+Fast JSON responses for the list endpoints.
+
+Endpoints that return hundreds of log rows build plain dicts with datetime
+values left as-is and return a FastJSONResponse directly, which skips
+FastAPI's jsonable_encoder pass and response-model validation. orjson is
+used when installed (it writes naive datetimes exactly like isoformat());
+otherwise the stdlib encoder is used with the same output.
+"""
+
+import json
+from datetime import datetime
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    def dumps(content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(content) -> bytes:
+        return json.dumps(
+            content, default=_default, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode("utf-8")
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with dumps(); content may contain datetimes"""
+
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return dumps(content)
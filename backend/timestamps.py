@@ -0,0 +1,120 @@
+"""
+Storage format of the entry and exit times.
+
+TIMESTAMP_STORAGE=datetime (default) keeps entry_logs.entry_time/exit_time
+and active_entries.entry_time as SQLAlchemy's naive IST datetime strings.
+TIMESTAMP_STORAGE=epoch_ms keeps them as integer milliseconds since the
+Unix epoch, so range scans, the keyset cursors and the rollup triggers
+compare integers instead of strings. Python code sees naive IST datetimes
+either way (the Timestamp column type converts).
+
+Raw SQL that reads these columns goes through sql_time / sql_ist_ms, and
+migrate_db converts existing rows (convert_timestamps) when the setting
+changes. Other datetime columns (registration dates, rollup buckets,
+created_at) stay datetime strings.
+"""
+
+from sqlalchemy import BigInteger, DateTime, Integer, text, tuple_
+from sqlalchemy.types import TypeDecorator
+
+from backend.config import TIMESTAMP_STORAGE
+from backend.timezone_utils import IST_OFFSET, from_epoch_ms, to_epoch_ms
+
+TIMESTAMP_FORMATS = ("datetime", "epoch_ms")
+
+if TIMESTAMP_STORAGE not in TIMESTAMP_FORMATS:
+    raise ValueError(f"TIMESTAMP_STORAGE must be one of: {', '.join(TIMESTAMP_FORMATS)}")
+
+EPOCH_MS = TIMESTAMP_STORAGE == "epoch_ms"
+
+_OFFSET_SECONDS = int(IST_OFFSET.total_seconds())
+_OFFSET_MINUTES = _OFFSET_SECONDS // 60
+
+# Columns holding entry/exit times: {table: [columns]}
+TIMESTAMP_COLUMNS = {
+    "entry_logs": ["entry_time", "exit_time", "abandoned_at"],
+    "active_entries": ["entry_time"],
+}
+
+
+class Timestamp(TypeDecorator):
+    """Naive IST datetime stored per TIMESTAMP_STORAGE"""
+
+    impl = DateTime
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        return dialect.type_descriptor(BigInteger() if EPOCH_MS else DateTime())
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not EPOCH_MS:
+            return value
+        return to_epoch_ms(value)
+
+    def process_result_value(self, value, dialect):
+        if value is None or not EPOCH_MS:
+            return value
+        return from_epoch_ms(value)
+
+
+def time_tuple(entry_time, log_id):
+    """(entry_time, id) literal to compare with tuple_(EntryLog.entry_time, EntryLog.id)"""
+    return tuple_(entry_time, log_id, types=(Timestamp(), Integer()))
+
+
+def storage_value(dt):
+    """A naive IST datetime as stored in a Timestamp column (for raw SQL parameters)"""
+    return to_epoch_ms(dt) if EPOCH_MS else dt.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+def sql_time(column: str) -> str:
+    """Arguments for SQLite's date and time functions reading a Timestamp column as IST"""
+    if EPOCH_MS:
+        return f"{column} / 1000, 'unixepoch', '+{_OFFSET_MINUTES} minutes'"
+    return column
+
+
+def sql_ist_ms(column: str) -> str:
+    """SQL for a Timestamp column as milliseconds since the epoch of its naive IST time"""
+    if EPOCH_MS:
+        return f"({column} + {_OFFSET_SECONDS * 1000})"
+    return f"CAST(round((julianday({column}) - 2440587.5) * 86400000) AS INTEGER)"
+
+
+def _to_epoch_sql(column):
+    # strftime('%s') reads the string as UTC and truncates to whole seconds;
+    # the milliseconds are cut from "YYYY-MM-DD HH:MM:SS.ffffff" the same way
+    # to_epoch_ms truncates them
+    return (
+        f"(CAST(strftime('%s', {column}) AS INTEGER) - {_OFFSET_SECONDS}) * 1000"
+        f" + CAST(substr({column} || '.000', 21, 3) AS INTEGER)"
+    )
+
+
+def _to_datetime_sql(column):
+    # Microsecond precision like the strings SQLAlchemy writes
+    return f"strftime('%Y-%m-%d %H:%M:%f', {column} / 1000.0, 'unixepoch', '+{_OFFSET_MINUTES} minutes') || '000'"
+
+
+def stored_format(conn):
+    """Format of the newest entry log's times ("datetime", "epoch_ms" or None for an empty table)"""
+    stored = conn.execute(text("SELECT typeof(entry_time) FROM entry_logs ORDER BY id DESC LIMIT 1")).scalar()
+    return {"text": "datetime", "integer": "epoch_ms"}.get(stored)
+
+
+def convert_timestamps(conn, target=TIMESTAMP_STORAGE):
+    """
+    Rewrite stored entry/exit times into the `target` format (default: the
+    configured TIMESTAMP_STORAGE), on a sync Connection. Returns True if
+    rows were converted.
+    """
+    stored = stored_format(conn)
+    if stored is None or stored == target:
+        return False
+    source_type, convert = ("text", _to_epoch_sql) if target == "epoch_ms" else ("integer", _to_datetime_sql)
+    for table, columns in TIMESTAMP_COLUMNS.items():
+        for column in columns:
+            conn.execute(text(
+                f"UPDATE {table} SET {column} = {convert(column)} WHERE typeof({column}) = '{source_type}'"
+            ))
+    return True
@@ -4,13 +4,24 @@ IST is UTC+5:30
 
 Note: SQLite stores datetimes as naive (no timezone). We store all times in IST
 as naive datetimes, assuming they are always in IST timezone.
+
+IST has had a fixed offset (no DST) since 1945, so a fixed-offset tzinfo
+gives the same results as the tz database without its per-call lookups.
+Endpoints read the clock once per request and pass that `now` along.
+With TIMESTAMP_STORAGE=epoch_ms the database keeps times as integer
+milliseconds since the Unix epoch (see backend/timestamps.py); to_epoch_ms
+and from_epoch_ms convert between the two.
 """
 
-from datetime import datetime
-import pytz
+from datetime import datetime, timedelta, timezone
 
 # Indian Standard Time zone
-IST = pytz.timezone('Asia/Kolkata')
+IST_OFFSET = timedelta(hours=5, minutes=30)
+IST = timezone(IST_OFFSET, "IST")
+
+# The Unix epoch as a naive IST datetime
+_EPOCH_IST = datetime(1970, 1, 1) + IST_OFFSET
+_MILLISECOND = timedelta(milliseconds=1)
 
 def get_ist_now():
     """
@@ -18,9 +29,8 @@ def get_ist_now():
     SQLite doesn't support timezone-aware datetimes, so we return naive datetime
     but it represents IST time.
     """
-    ist_now = datetime.now(IST)
     # Return as naive datetime (SQLite compatible) but represents IST
-    return ist_now.replace(tzinfo=None)
+    return datetime.now(IST).replace(tzinfo=None)
 
 def get_ist_datetime(dt=None):
     """
@@ -39,6 +49,19 @@ def get_ist_datetime(dt=None):
     ist_dt = dt.astimezone(IST)
     return ist_dt.replace(tzinfo=None)
 
+def localize_ist(dt):
+    """Naive IST datetime -> timezone-aware datetime (aware ones are returned as-is)"""
+    return dt.replace(tzinfo=IST) if dt.tzinfo is None else dt
+
+def to_epoch_ms(dt) -> int:
+    """Naive IST (or aware) datetime -> milliseconds since the Unix epoch"""
+    return (get_ist_datetime(dt) - _EPOCH_IST) // _MILLISECOND
+
+def from_epoch_ms(ms: int):
+    """Milliseconds since the Unix epoch -> naive IST datetime"""
+    # Positional (days, seconds, microseconds, milliseconds) is the fastest constructor
+    return _EPOCH_IST + timedelta(0, 0, 0, ms)
+
 def format_ist_datetime(dt, format_str="%Y-%m-%d %H:%M:%S"):
     """
     Format datetime. Assumes dt is a naive datetime representing IST time.
@@ -48,4 +71,3 @@ def format_ist_datetime(dt, format_str="%Y-%m-%d %H:%M:%S"):
     
     # dt is naive but represents IST, so format directly
     return dt.strftime(format_str)
-
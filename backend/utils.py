@@ -1,55 +1,64 @@
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from backend.database import EntryLog
+import math
+from functools import lru_cache
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from backend.database import ActiveEntry, EntryLog
+from backend.frequency import entry_tracker
+from backend.registry import registry_cache
+from backend.rules import Scan, suspicion_rules
 from backend.timezone_utils import get_ist_now
 
-def check_suspicious_duration(duration_minutes: float) -> bool:
-    """Check if duration is suspicious (>20 minutes)"""
-    return duration_minutes > 20 if duration_minutes else False
-
-def check_suspicious_frequency(db: Session, plate_number: str, is_registered: bool):
+def check_entry_rules(plate_number: str, is_registered: bool, vehicle_type=None, now=None):
     """
-    Check if vehicle entered suspiciously frequently.
-    Returns: (is_suspicious: bool, reason: str)
+    Evaluate the suspicion rules for an entry scan.
+    Prior-entry counts come from the in-memory entry tracker, not from entry_logs.
+    Returns the triggered rules (empty when the entry is not suspicious).
     """
-    if is_registered:
-        return False, ""
-    
-    now = get_ist_now()
-    twenty_minutes_ago = now - timedelta(minutes=20)
-    one_hour_ago = now - timedelta(hours=1)
-    
-    # Count entries in last 20 minutes (before adding current entry)
-    entries_20min = db.query(EntryLog).filter(
-        EntryLog.plate_number == plate_number,
-        EntryLog.entry_time >= twenty_minutes_ago
-    ).count()
+    now = now or get_ist_now()
     
-    # Count entries in last 1 hour (before adding current entry)
-    entries_1hr = db.query(EntryLog).filter(
-        EntryLog.plate_number == plate_number,
-        EntryLog.entry_time >= one_hour_ago
-    ).count()
+    # Entries before the current one, per rule window
+    def prior(window):
+        return entry_tracker.count(plate_number, window, now)
     
-    # Check conditions
-    # If there's already 1+ entry in last 20 min, this new entry makes it 2+, so flag it
-    if entries_20min >= 1:
-        return True, "Entered more than 1 time in last 20 minutes"
-    
-    # If there's already 1+ entry in last 1 hour, this new entry makes it 2+, so flag it
-    if entries_1hr >= 1:
-        return True, "Entered 2+ times in last 1 hour"
-    
-    return False, ""
+    return suspicion_rules.check_entry(Scan(now, is_registered, vehicle_type, prior=prior))
 
-def get_past_entries(db: Session, plate_number: str, limit: int = 3):
-    """Get past N entries for a vehicle"""
-    entries = db.query(EntryLog).filter(
-        EntryLog.plate_number == plate_number
-    ).order_by(EntryLog.entry_time.desc()).limit(limit).all()
-    
+def check_exit_rules(duration_minutes: float, is_registered: bool, vehicle_type=None, now=None):
+    """Evaluate the suspicion rules for an exit scan. Returns the triggered rules."""
+    scan = Scan(now or get_ist_now(), is_registered, vehicle_type, duration=duration_minutes or 0)
+    return suspicion_rules.check_exit(scan)
+
+def suspicious_reason(triggered) -> str:
+    """Reason of the first triggered rule (rules are checked in declaration order)"""
+    return triggered[0].reason if triggered else ""
+
+async def check_registered(repository, plate_number: str):
+    """
+    Check registration from the registry cache, or the repository until it is loaded.
+    Returns: (is_registered: bool, vehicle_type: str or None)
+    """
+    if registry_cache.loaded:
+        return registry_cache.lookup(plate_number)
+    vehicle = await repository.get_vehicle(plate_number)
+    return vehicle is not None, vehicle.vehicle_type if vehicle else None
+
+def entry_message(is_registered: bool, is_suspicious: bool, suspicious_reason: str) -> str:
+    """Message shown at the entry gate"""
+    if is_suspicious:
+        return f"⚠️ RED FLAG: {suspicious_reason}"
+    elif not is_registered:
+        return "❌ UNREGISTERED VEHICLE"
+    return "✅ REGISTERED VEHICLE"
+
+def exit_message(duration: float, is_suspicious: bool, suspicious_reason: str = "") -> str:
+    """Message shown at the exit gate"""
+    if is_suspicious:
+        return f"⚠️ SUSPICIOUS: Stayed {format_duration(duration)} ({suspicious_reason})"
+    return "✅ Exit recorded"
+
+def format_past_entries(entries, now=None):
+    """Past entries of a vehicle (newest first) as shown at the entry gate"""
     result = []
-    now = get_ist_now()
+    now = now or get_ist_now()
     
     for entry in entries:
         # Calculate time ago
@@ -76,15 +85,84 @@ def get_past_entries(db: Session, plate_number: str, limit: int = 3):
     
     return result
 
+async def pop_active_entry(db: AsyncSession, plate_number: str):
+    """
+    Take a plate off campus and return its open EntryLog, or None if the
+    plate is not on campus. The DELETE claims the on-campus row: of
+    concurrent exits of one plate only one gets it back, and the write lock
+    it takes is held until the caller commits the exit.
+    """
+    entry_log_id = await db.scalar(
+        delete(ActiveEntry)
+        .where(ActiveEntry.plate_number == plate_number)
+        .returning(ActiveEntry.entry_log_id)
+        .execution_options(synchronize_session=False)
+    )
+    if entry_log_id is None:
+        return None
+    entry_log = await db.get(EntryLog, entry_log_id)
+    if entry_log is None or entry_log.exit_time is not None or entry_log.abandoned_at is not None:
+        # Stale pointer (log removed, already closed or abandoned)
+        return None
+    return entry_log
+
 def format_duration(minutes: float) -> str:
     """Format duration in minutes to readable string"""
     if not minutes:
         return "N/A"
-    
-    hours = int(minutes // 60)
-    mins = int(minutes % 60)
+    # Only whole minutes are shown, so the strings are cached per minute
+    return _format_whole_minutes(math.floor(minutes))
+
+@lru_cache(maxsize=4096)
+def _format_whole_minutes(minutes: int) -> str:
+    hours = minutes // 60
+    mins = minutes % 60
     
     if hours > 0:
         return f"{hours}hr {mins}min"
     return f"{mins}min"
 
+# Columns loaded for log listings and exports (no full ORM entities)
+LOG_COLUMNS = (
+    EntryLog.id,
+    EntryLog.plate_number,
+    EntryLog.entry_time,
+    EntryLog.exit_time,
+    EntryLog.duration_minutes,
+    EntryLog.is_registered,
+    EntryLog.is_suspicious,
+)
+
+LOG_FIELDS = [
+    "id", "plate_number", "entry_time", "exit_time", "duration_minutes",
+    "duration_formatted", "is_registered", "is_suspicious",
+]
+
+def log_records(rows):
+    """
+    LOG_COLUMNS rows as dicts for FastJSONResponse (datetimes are left for the
+    encoder, so this is the only per-row Python work)
+    """
+    return [{
+        "id": id,
+        "plate_number": plate_number,
+        "entry_time": entry_time,
+        "exit_time": exit_time,
+        "duration_minutes": duration_minutes,
+        "duration_formatted": format_duration(duration_minutes),
+        "is_registered": is_registered,
+        "is_suspicious": is_suspicious,
+    } for id, plate_number, entry_time, exit_time, duration_minutes, is_registered, is_suspicious in rows]
+
+def serialize_log(log):
+    """Convert an entry log (ORM object or LOG_COLUMNS row) to a JSON-ready dict"""
+    return {
+        "id": log.id,
+        "plate_number": log.plate_number,
+        "entry_time": log.entry_time.isoformat() if log.entry_time else None,
+        "exit_time": log.exit_time.isoformat() if log.exit_time else None,
+        "duration_minutes": log.duration_minutes,
+        "duration_formatted": format_duration(log.duration_minutes),
+        "is_registered": log.is_registered,
+        "is_suspicious": log.is_suspicious
+    }
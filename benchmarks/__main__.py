@@ -0,0 +1,158 @@
+"""
+Gate API benchmark suite.
+
+Seeds a database, drives a traffic mix against the FastAPI app (in-process
+through httpx's ASGI transport, or over a real uvicorn server) and reports
+throughput and p50/p95/p99 latency per endpoint as JSON. With --compare, the
+result is checked against an earlier JSON report and the run fails when an
+endpoint's p95 regressed by more than --tolerance.
+
+Usage:
+    python -m benchmarks --mix gate --requests 5000 --output bench.json
+    python -m benchmarks --mix gate --requests 5000 --compare bench.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine, text
+
+from benchmarks.runner import ROOT, latency_summary, uvicorn_server
+from benchmarks.traffic import MIXES, TrafficState, run_client
+
+
+def on_campus_plates(path):
+    engine = create_engine(f"sqlite:///{path}")
+    with engine.connect() as conn:
+        plates = [row[0] for row in conn.execute(text("SELECT plate_number FROM active_entries"))]
+    engine.dispose()
+    return plates
+
+
+async def drive(client, state, args):
+    per_client = args.requests // args.clients
+    t0 = time.perf_counter()
+    await asyncio.gather(*(
+        run_client(client, state, MIXES[args.mix], per_client, seed=args.seed + i)
+        for i in range(args.clients)
+    ))
+    return time.perf_counter() - t0
+
+
+async def run_in_process(state, args):
+    """Serve the app in this process; lifespan runs exactly as under uvicorn"""
+    from backend.app import app
+
+    async with app.router.lifespan_context(app):
+        # Unhandled app errors become 500s and count as errors, as they would over HTTP
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            return await drive(client, state, args)
+
+
+async def run_over_http(url, state, args):
+    limits = httpx.Limits(max_connections=args.clients)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=60.0) as client:
+        return await drive(client, state, args)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline, tolerance):
+    """Print p95 deltas per endpoint; return the endpoints that regressed"""
+    regressed = []
+    for endpoint, current in report["endpoints"].items():
+        previous = baseline.get("endpoints", {}).get(endpoint)
+        if not previous or not previous.get("count") or not current.get("count"):
+            continue
+        change = (current["p95_ms"] - previous["p95_ms"]) / previous["p95_ms"]
+        flag = "REGRESSED" if change > tolerance else ""
+        print(f"{endpoint:<14} p95 {previous['p95_ms']:>9.2f} -> {current['p95_ms']:>9.2f} ms ({change:+.0%}) {flag}",
+              file=sys.stderr)
+        if change > tolerance:
+            regressed.append(endpoint)
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gate API benchmark suite")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="gate")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--vehicles", type=int, default=2000)
+    parser.add_argument("--logs", type=int, default=200_000)
+    parser.add_argument("--visitors", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=5000, help="total requests")
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers (uvicorn mode)")
+    parser.add_argument("--output", help="write the JSON report here (default: stdout)")
+    parser.add_argument("--compare", help="earlier JSON report to check for p95 regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 increase (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        # backend.database resolves ./vehicle_tracking.db when it is first
+        # imported, so nothing from backend may be imported before this chdir
+        os.chdir(workdir)
+        from benchmarks.seed import seed_database
+
+        path = os.path.join(workdir, "vehicle_tracking.db")
+        t0 = time.perf_counter()
+        seed_database(path, args.vehicles, args.logs, args.visitors, seed=args.seed)
+        seed_seconds = time.perf_counter() - t0
+
+        state = TrafficState(args.vehicles, args.visitors, on_campus_plates(path))
+        try:
+            if args.mode == "inprocess":
+                elapsed = asyncio.run(run_in_process(state, args))
+            else:
+                with uvicorn_server(workdir, args.port, extra_args=("--workers", str(args.workers))) as url:
+                    elapsed = asyncio.run(run_over_http(url, state, args))
+        finally:
+            os.chdir(cwd)
+
+    all_latencies = [ms for values in state.latencies.values() for ms in values]
+    report = {
+        "revision": git_revision(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "seed_seconds": round(seed_seconds, 2),
+        "elapsed_seconds": round(elapsed, 3),
+        "total": latency_summary(all_latencies, elapsed, sum(state.errors.values())),
+        "endpoints": {
+            op: latency_summary(values, elapsed, state.errors[op])
+            for op, values in sorted(state.latencies.items())
+        },
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(report, json.load(f), args.tolerance)
+        if regressed:
+            sys.exit(f"p95 regression in: {', '.join(regressed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark the vectorized suspicion report on synthetic history.
+
+Builds LogArrays directly (no database), so it measures the analytics
+themselves: two rolling-window passes, duration percentiles and the
+repeat-offender ranking. With --load-rows it first seeds a SQLite database
+and times load_log_arrays: cold (no cache), rebuilding the column cache,
+and reading it back.
+
+Usage:
+    python -m benchmarks.bench_analytics --rows 10000000
+    python -m benchmarks.bench_analytics --load-rows 1000000 --rows 0
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+
+from backend.analytics import LogArrays, load_log_arrays, suspicion_report
+from benchmarks.seed import seed_database
+
+
+def synthetic_logs(rows, plates, days, seed=1234):
+    rng = np.random.default_rng(seed)
+    entry_ms = np.sort(rng.integers(0, days * 86_400_000, rows)) + 1_700_000_000_000
+    duration = rng.exponential(25, rows)
+    on_campus = rng.random(rows) < 0.01
+    duration[on_campus] = np.nan
+    columns = {
+        "id": np.arange(1, rows + 1, dtype=np.int64),
+        "plate": rng.zipf(1.3, rows).astype(np.int64) % plates,
+        "entry_ms": entry_ms,
+        "duration": duration,
+        "is_registered": rng.random(rows) < 0.7,
+        "is_suspicious": rng.random(rows) < 0.05,
+        "open": on_campus,
+        "abandoned": np.zeros(rows, bool),
+    }
+    columns["plate"] = columns["plate"].astype(np.int32)
+    return LogArrays(columns, [f"P{i:07d}" for i in range(plates)])
+
+
+def bench_load(rows, repeat):
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "load.db")
+        t0 = time.perf_counter()
+        seed_database(path, logs=rows)
+        print(f"Seeded {rows:,} rows in {time.perf_counter() - t0:.2f}s")
+        engine = create_engine(f"sqlite:///{path}")
+        cache_dir = os.path.join(workdir, "cache")
+        with engine.connect() as conn:
+            for label, cache in (("cold", None), ("cache rebuild", cache_dir), ("cached", cache_dir)):
+                timings = []
+                for _ in range(repeat if label != "cache rebuild" else 1):
+                    t0 = time.perf_counter()
+                    arrays = load_log_arrays(conn, cache)
+                    timings.append(time.perf_counter() - t0)
+                print(f"load {label}: best {min(timings):.2f}s, {len(arrays):,} rows")
+        engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analytics report")
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--plates", type=int, default=200_000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--load-rows", type=int, default=0,
+                        help="also time loading this many seeded rows from SQLite")
+    args = parser.parse_args()
+
+    if args.load_rows:
+        bench_load(args.load_rows, args.repeat)
+    if not args.rows:
+        return
+
+    t0 = time.perf_counter()
+    arrays = synthetic_logs(args.rows, args.plates, args.days)
+    print(f"Generated {args.rows:,} rows in {time.perf_counter() - t0:.2f}s")
+
+    for thresholds in ({}, {"short_window_minutes": 10, "long_window_minutes": 120, "max_duration_minutes": 45}):
+        timings = []
+        for _ in range(args.repeat):
+            t0 = time.perf_counter()
+            report = suspicion_report(arrays, thresholds, top=20)
+            timings.append(time.perf_counter() - t0)
+        print(f"thresholds={thresholds or 'defaults'}: best {min(timings):.2f}s, "
+              f"flagged {report['flagged']['total']:,}")
+
+
+if __name__ == "__main__":
+    main()
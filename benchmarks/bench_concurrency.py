@@ -0,0 +1,82 @@
+"""
+Load test: /api/check-entry latency under many concurrent gate clients.
+
+Starts uvicorn on a fresh database in a temp directory (or targets --url) and
+fires requests from N concurrent clients, then prints p50/p99 latency and
+throughput. To compare against another revision of the backend (e.g. the
+sync-session version), point --source at a checkout of it:
+
+    git worktree add /tmp/sync-backend <commit>
+    python -m benchmarks.bench_concurrency --source /tmp/sync-backend
+    python -m benchmarks.bench_concurrency
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from contextlib import nullcontext
+
+import httpx
+
+from benchmarks.runner import ROOT, percentile, uvicorn_server
+
+
+async def run_clients(url, clients, requests_per_client, plates, timeout):
+    latencies = []
+    errors = 0
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+
+    async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        async def gate_client():
+            nonlocal errors
+            for _ in range(requests_per_client):
+                plate = f"KA{random.randrange(plates):05d}"
+                t0 = time.perf_counter()
+                try:
+                    response = await client.post(url + "/api/check-entry", json={"plate_number": plate})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                latencies.append((time.perf_counter() - t0) * 1000)
+                if not ok:
+                    errors += 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(gate_client() for _ in range(clients)))
+        elapsed = time.perf_counter() - t0
+
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--plates", type=int, default=5000)
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout (s)")
+    parser.add_argument("--source", default=ROOT, help="backend source tree to serve")
+    parser.add_argument("--url", help="benchmark an already running server instead")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        server = nullcontext(args.url) if args.url else uvicorn_server(workdir, args.port, args.source)
+        with server as url:
+            latencies, errors, elapsed = asyncio.run(
+                run_clients(url, args.clients, args.requests, args.plates, args.timeout)
+            )
+
+    total = len(latencies)
+    print(f"source:     {args.url or os.path.abspath(args.source)}")
+    print(f"requests:   {total} from {args.clients} clients ({errors} errors)")
+    print(f"throughput: {total / elapsed:.1f} req/s")
+    print(f"p50:        {statistics.median(latencies):.1f} ms")
+    print(f"p99:        {percentile(latencies, 99):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
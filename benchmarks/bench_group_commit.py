@@ -0,0 +1,71 @@
+"""
+Gate writes under concurrent clients with each GROUP_COMMIT mode.
+
+Starts one uvicorn server per mode on a fresh database and drives
+/api/check-entry from N concurrent clients (the same load as
+bench_concurrency), then prints throughput, p50/p99 latency and how many
+transactions the writes took (gate_group_commits_total; "off" commits once
+per request).
+
+Batching pays off when commits are expensive and requests overlap: with
+the default synchronous=NORMAL a WAL commit does not fsync, so also try
+SQLITE_SYNCHRONOUS=FULL, and keep in mind that on a single core the
+clients and the server share the CPU and requests rarely overlap.
+
+Usage:
+    python -m benchmarks.bench_group_commit
+    python -m benchmarks.bench_group_commit --modes off durable --clients 400
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+
+import httpx
+
+from benchmarks.bench_concurrency import run_clients
+from benchmarks.runner import ROOT, percentile, uvicorn_server
+
+MODES = ("off", "durable", "fast_ack")
+
+
+def commits(url):
+    for line in httpx.get(url + "/metrics").text.splitlines():
+        if line.startswith("gate_group_commits_total "):
+            return int(float(line.split()[1]))
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES))
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=10, help="requests per client")
+    parser.add_argument("--plates", type=int, default=5000)
+    parser.add_argument("--window-ms", type=int, default=5, help="GROUP_COMMIT_WINDOW_MS")
+    parser.add_argument("--timeout", type=float, default=60.0, help="per-request timeout (s)")
+    parser.add_argument("--source", default=ROOT, help="backend source tree to serve")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    print(f"{args.clients} clients x {args.requests} check-entry requests, window {args.window_ms} ms")
+    print(f"{'mode':10} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7} {'commits':>8}")
+    for mode in args.modes:
+        os.environ["GROUP_COMMIT"] = mode
+        os.environ["GROUP_COMMIT_WINDOW_MS"] = str(args.window_ms)
+        with tempfile.TemporaryDirectory() as workdir:
+            with uvicorn_server(workdir, args.port, args.source) as url:
+                latencies, errors, elapsed = asyncio.run(
+                    run_clients(url, args.clients, args.requests, args.plates, args.timeout)
+                )
+                transactions = commits(url) if mode != "off" else len(latencies) - errors
+        print(
+            f"{mode:10} {len(latencies) / elapsed:8.1f} {statistics.median(latencies):8.1f} "
+            f"{percentile(latencies, 99):8.1f} {errors:7} {transactions:8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
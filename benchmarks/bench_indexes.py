@@ -0,0 +1,133 @@
+"""
+Benchmark: entry_logs query plans and latency before/after the secondary indexes.
+
+Builds a throwaway SQLite database with the current schema minus its indexes,
+fills it with N log rows, times the hot queries, then runs migrate_db() (the
+same path an existing vehicle_tracking.db takes) and times them again.
+
+Usage:
+    python -m benchmarks.bench_indexes --rows 1000000
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, text
+
+from backend.database import Base, migrate_db
+
+# Raw SQL mirroring the ORM queries in backend.app / backend.utils
+QUERIES = {
+    "check_exit": (
+        "SELECT * FROM entry_logs WHERE plate_number = :plate AND exit_time IS NULL "
+        "ORDER BY entry_time DESC LIMIT 1"
+    ),
+    "past_entries": (
+        "SELECT * FROM entry_logs WHERE plate_number = :plate "
+        "ORDER BY entry_time DESC LIMIT 3"
+    ),
+    "history": (
+        "SELECT * FROM entry_logs WHERE plate_number = :plate "
+        "ORDER BY entry_time DESC"
+    ),
+    "logs": "SELECT * FROM entry_logs ORDER BY entry_time DESC LIMIT 1000",
+}
+
+
+def seed(engine, rows: int, plates: int):
+    """Create the schema without indexes and insert synthetic log rows"""
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for index in Base.metadata.tables["entry_logs"].indexes:
+            conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+
+    start = datetime(2024, 1, 1)
+    batch = []
+    with engine.begin() as conn:
+        for i in range(rows):
+            entry_time = start + timedelta(seconds=i * 30)
+            closed = random.random() > 0.02
+            duration = random.uniform(1, 120)
+            batch.append({
+                "plate": f"KA{random.randrange(plates):06d}",
+                "entry": entry_time,
+                "exit": entry_time + timedelta(minutes=duration) if closed else None,
+                "duration": duration if closed else None,
+                "reg": random.random() > 0.3,
+                "sus": random.random() > 0.95,
+            })
+            if len(batch) == 50_000:
+                _insert(conn, batch)
+                batch = []
+        if batch:
+            _insert(conn, batch)
+
+
+def _insert(conn, batch):
+    conn.execute(text(
+        "INSERT INTO entry_logs (plate_number, entry_time, exit_time, duration_minutes, "
+        "is_registered, is_suspicious) VALUES (:plate, :entry, :exit, :duration, :reg, :sus)"
+    ), batch)
+
+
+def run_queries(engine, plates: int, repeat: int):
+    """Return {query: {"plan": [...], "median_ms": float}}"""
+    results = {}
+    with engine.connect() as conn:
+        for name, sql in QUERIES.items():
+            params = {"plate": f"KA{random.randrange(plates):06d}"}
+            plan = [row[-1] for row in conn.execute(text("EXPLAIN QUERY PLAN " + sql), params)]
+            timings = []
+            for _ in range(repeat):
+                params = {"plate": f"KA{random.randrange(plates):06d}"}
+                t0 = time.perf_counter()
+                conn.execute(text(sql), params).fetchall()
+                timings.append((time.perf_counter() - t0) * 1000)
+            results[name] = {"plan": plan, "median_ms": statistics.median(timings)}
+    return results
+
+
+def report(label, results):
+    print(f"\n== {label} ==")
+    for name, result in results.items():
+        print(f"{name:<14} {result['median_ms']:>10.3f} ms   {' | '.join(result['plan'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--plates", type=int, default=20_000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    random.seed(42)
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        t0 = time.perf_counter()
+        seed(engine, args.rows, args.plates)
+        print(f"Seeded {args.rows} rows in {time.perf_counter() - t0:.1f}s")
+
+        before = run_queries(engine, args.plates, args.repeat)
+        report("before (no indexes)", before)
+
+        t0 = time.perf_counter()
+        with engine.begin() as conn:
+            created = migrate_db(conn)
+        print(f"\nmigrate_db created {created} in {time.perf_counter() - t0:.1f}s")
+
+        after = run_queries(engine, args.plates, args.repeat)
+        report("after", after)
+
+        print("\n== speedup ==")
+        for name in QUERIES:
+            print(f"{name:<14} {before[name]['median_ms'] / after[name]['median_ms']:>8.1f}x")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
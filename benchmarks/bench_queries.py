@@ -0,0 +1,129 @@
+"""
+SQL statements per request for the gate and history endpoints, checked
+against QUERY_BUDGETS. Exits with status 1 when an endpoint runs more
+statements than its budget, so a change that adds a round trip to the hot
+path fails the check even when latency noise hides it.
+
+Also reports the latency of check-entry with the fused snapshot read.
+
+Usage:
+    python -m benchmarks.bench_queries
+    python -m benchmarks.bench_queries --show-sql
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+import httpx
+
+# Most statements one request may run (commits are not statements)
+QUERY_BUDGETS = {
+    # snapshot SELECT (vehicle + last 3 entries), INSERT (active_entries by trigger)
+    "check-entry": 2,
+    # DELETE on-campus row (RETURNING its log id), its entry log, UPDATE entry log
+    "check-exit": 3,
+    "history": 1,
+    # processed-event lookup, frequency history, INSERT logs, INSERT results
+    "check-entry-batch": 4,
+}
+
+
+async def measure(args):
+    from sqlalchemy import event
+
+    from backend.app import app
+    from backend.database import async_engine
+    from backend.group_commit import group_commit
+    from backend.registry import registry_cache
+    from benchmarks.traffic import registered_plate, visitor_plate
+
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        # Group-commit batches run on their own connection, not the request's
+        if group_commit._conn is None or conn is not group_commit._conn.sync_connection:
+            statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "after_cursor_execute", count)
+
+    plates = [registered_plate(i) for i in range(args.samples // 2)] + [
+        visitor_plate(i) for i in range(args.samples // 2)
+    ]
+    cases = {name: [] for name in QUERY_BUDGETS}
+    samples = {}
+    entry_ms = []
+
+    async with app.router.lifespan_context(app):
+        # Caches load in the background after startup; their reads are not a request's
+        while not registry_cache.loaded:
+            await asyncio.sleep(0.01)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            async def run(name, method, url, **kwargs):
+                statements.clear()
+                t0 = time.perf_counter()
+                response = await client.request(method, url, **kwargs)
+                elapsed = time.perf_counter() - t0
+                response.raise_for_status()
+                cases[name].append(len(statements))
+                samples.setdefault(name, list(statements))
+                return elapsed
+
+            for plate in plates:
+                entry_ms.append(await run("check-entry", "POST", "/api/check-entry", json={"plate_number": plate}) * 1000)
+            for plate in plates:
+                await run("check-exit", "POST", "/api/check-exit", json={"plate_number": plate})
+            for plate in plates:
+                await run("history", "GET", f"/api/history/{plate}", params={"limit": 50})
+            for i in range(0, len(plates), 10):
+                events = [{
+                    "plate_number": plate,
+                    "timestamp": "2026-01-01T08:00:00+05:30",
+                    "idempotency_key": f"bench-{i}-{plate}",
+                } for plate in plates[i:i + 10]]
+                await run("check-entry-batch", "POST", "/api/check-entry/batch", json={"events": events})
+
+    event.remove(async_engine.sync_engine, "after_cursor_execute", count)
+    return cases, samples, entry_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check SQL statements per request against the query budgets")
+    parser.add_argument("--logs", type=int, default=50_000)
+    parser.add_argument("--samples", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--show-sql", action="store_true", help="print one request's statements per endpoint")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-queries-")
+    os.chdir(workdir)  # backend.database resolves its sqlite path at import
+    # No background jobs: every statement seen belongs to the request
+    os.environ["CACHE_SYNC_INTERVAL"] = "0"
+    os.environ["REGISTRY_REFRESH_SECONDS"] = "0"
+
+    from benchmarks.runner import percentile
+    from benchmarks.seed import seed_database
+
+    seed_database(os.path.join(workdir, "vehicle_tracking.db"), logs=args.logs)
+    cases, samples, entry_ms = asyncio.run(measure(args))
+
+    over = []
+    for name, counts in cases.items():
+        budget = QUERY_BUDGETS[name]
+        worst = max(counts)
+        status = "ok" if worst <= budget else "OVER BUDGET"
+        print(f"{name:18} statements max {worst} / budget {budget}  (mean {sum(counts) / len(counts):.2f})  {status}")
+        if args.show_sql:
+            for statement in samples[name]:
+                print(f"    {' '.join(statement.split())[:160]}")
+        if worst > budget:
+            over.append(name)
+    print(f"check-entry latency p50 {percentile(entry_ms, 50):.2f} ms, p95 {percentile(entry_ms, 95):.2f} ms")
+    sys.exit(1 if over else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark log listing serialization: rows/sec of the old response path
+(serialize_log -> jsonable_encoder -> JSONResponse) against log_records +
+FastJSONResponse, plus ORM entity loading against the column-only select.
+
+Runs against a freshly seeded SQLite file in a temporary directory.
+
+Usage:
+    python -m benchmarks.bench_serialization --logs 100000 --page 1000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+
+def rate(fn, rows, repeat):
+    """Best-of-`repeat` rows/sec"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark log listing serialization")
+    parser.add_argument("--logs", type=int, default=100_000)
+    parser.add_argument("--page", type=int, default=1000, help="rows per response")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-serialization-")
+    os.chdir(workdir)  # backend.database resolves its sqlite path at import
+
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from sqlalchemy import create_engine, select
+    from sqlalchemy.orm import Session
+
+    from backend.database import EntryLog
+    from backend.pagination import LOG_ORDER
+    from backend.serialization import FastJSONResponse, orjson
+    from backend.utils import LOG_COLUMNS, log_records, serialize_log
+    from benchmarks.seed import seed_database
+
+    path = os.path.join(workdir, "bench.db")
+    seed_database(path, logs=args.logs)
+    engine = create_engine(f"sqlite:///{path}")
+    print(f"{args.logs:,} logs, {args.page} rows per response, encoder: {'orjson' if orjson else 'json'}")
+
+    with Session(engine) as db:
+        def load_entities():
+            db.expunge_all()
+            return db.scalars(select(EntryLog).order_by(*LOG_ORDER).limit(args.page)).all()
+
+        def load_columns():
+            return db.execute(select(*LOG_COLUMNS).order_by(*LOG_ORDER).limit(args.page)).all()
+
+        rows = load_columns()
+        cases = {
+            "load: ORM entities": load_entities,
+            "load: LOG_COLUMNS": load_columns,
+            "encode: serialize_log + jsonable_encoder": lambda: JSONResponse(
+                jsonable_encoder([serialize_log(row) for row in rows])
+            ).body,
+            "encode: log_records + FastJSONResponse": lambda: FastJSONResponse(log_records(rows)).body,
+        }
+        for name, fn in cases.items():
+            print(f"{name:45} {rate(fn, len(rows), args.repeat):>12,.0f} rows/s")
+
+        before = JSONResponse(jsonable_encoder([serialize_log(row) for row in rows])).body
+        after = FastJSONResponse(log_records(rows)).body
+        print(f"identical bodies: {before == after}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark: mixed read/write throughput under different SQLite profiles.
+
+Gate writers insert entry logs while dashboard readers poll the /api/logs
+query, all against one database file through the async engine. Each profile
+is run on a fresh copy of a seeded database.
+
+Usage:
+    python -m benchmarks.bench_sqlite_profile --seconds 10 --writers 8 --readers 8
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event, insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+from backend.config import SQLITE_PRAGMAS
+from backend.database import Base, EntryLog, sqlite_profile
+
+PROFILES = {
+    # What sqlite3 gives you with no PRAGMAs
+    "default": ({"journal_mode": "DELETE", "synchronous": "FULL"}, False),
+    "tuned": (SQLITE_PRAGMAS, False),
+    "tuned+single-writer": (SQLITE_PRAGMAS, True),
+}
+
+
+def seed(path, rows):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        conn.execute(insert(EntryLog), [{
+            "plate_number": f"KA{random.randrange(5000):05d}",
+            "entry_time": start + timedelta(seconds=i * 30),
+            "is_registered": True,
+            "is_suspicious": False,
+        } for i in range(rows)])
+    engine.dispose()
+
+
+async def run_profile(path, pragmas, single_writer, seconds, writers, readers):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=writers + readers)
+    event.listen(engine.sync_engine, "connect", sqlite_profile(pragmas))
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+    write_lock = asyncio.Lock()
+    counts = {"writes": 0, "reads": 0, "locked": 0}
+    deadline = time.perf_counter() + seconds
+
+    async def writer():
+        while time.perf_counter() < deadline:
+            async with Session() as db:
+                try:
+                    if single_writer:
+                        async with write_lock:
+                            db.add(_log())
+                            await db.commit()
+                    else:
+                        db.add(_log())
+                        await db.commit()
+                    counts["writes"] += 1
+                except OperationalError:
+                    counts["locked"] += 1
+
+    async def reader():
+        while time.perf_counter() < deadline:
+            async with Session() as db:
+                try:
+                    await db.execute(select(EntryLog).order_by(EntryLog.entry_time.desc()).limit(100))
+                    counts["reads"] += 1
+                except OperationalError:
+                    counts["locked"] += 1
+
+    await asyncio.gather(*[writer() for _ in range(writers)], *[reader() for _ in range(readers)])
+    await engine.dispose()
+    return {k: v / seconds if k != "locked" else v for k, v in counts.items()}
+
+
+def _log():
+    return EntryLog(
+        plate_number=f"KA{random.randrange(5000):05d}",
+        entry_time=datetime.now(),
+        is_registered=False,
+        is_suspicious=False,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--rows", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        seeded = os.path.join(tmp, "seed.db")
+        seed(seeded, args.rows)
+
+        print(f"{'profile':<22}{'writes/s':>10}{'reads/s':>10}{'locked errors':>15}")
+        for name, (pragmas, single_writer) in PROFILES.items():
+            path = os.path.join(tmp, f"{name}.db")
+            shutil.copy(seeded, path)
+            result = asyncio.run(run_profile(
+                path, pragmas, single_writer, args.seconds, args.writers, args.readers
+            ))
+            print(f"{name:<22}{result['writes']:>10.1f}{result['reads']:>10.1f}{result['locked']:>15}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Cold start: how long after the process starts the API answers, serves a
+check-entry, and has its caches warm, against one seeded database.
+
+Each run starts a fresh uvicorn process and polls it every few
+milliseconds for:
+
+    import      importing backend.app (separate interpreter, no server)
+    listening   first response (GET /metrics, no database access)
+    gate        first 200 from POST /api/check-entry
+    warm        registry cache loaded (gate_registry_cache_size in /metrics)
+
+The first run against the database also migrates it; later runs find the
+schema current. To compare against another revision, point --source at a
+checkout of it:
+
+    git worktree add /tmp/before <commit>
+    python -m benchmarks.bench_startup --source /tmp/before
+    python -m benchmarks.bench_startup
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.runner import ROOT
+from benchmarks.seed import seed_database
+from benchmarks.traffic import registered_plate
+
+POLL_SECONDS = 0.002
+
+
+def time_import(workdir, source):
+    """Seconds to import backend.app in a fresh interpreter"""
+    code = "import time; t = time.perf_counter(); import backend.app; print(time.perf_counter() - t)"
+    env = {**os.environ, "PYTHONPATH": os.path.abspath(source)}
+    return float(subprocess.check_output([sys.executable, "-c", code], cwd=workdir, env=env))
+
+
+def registry_size(client, url):
+    for line in client.get(url + "/metrics").text.splitlines():
+        if line.startswith("gate_registry_cache_size "):
+            return float(line.split()[1])
+    return 0.0
+
+
+def time_startup(workdir, source, port, timeout):
+    """Seconds from process start to listening, first check-entry and warm caches"""
+    url = f"http://127.0.0.1:{port}"
+    t0 = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app:app", "--app-dir", os.path.abspath(source),
+         "--port", str(port), "--log-level", "warning"],
+        cwd=workdir,
+    )
+    marks = {}
+    try:
+        with httpx.Client(timeout=timeout) as client:
+            def poll(name, ready):
+                while True:
+                    try:
+                        if ready():
+                            marks[name] = time.perf_counter() - t0
+                            return
+                    except httpx.TransportError:
+                        pass
+                    if server.poll() is not None or time.perf_counter() - t0 > timeout:
+                        raise RuntimeError(f"Server at {url} did not start")
+                    time.sleep(POLL_SECONDS)
+
+            poll("listening", lambda: client.get(url + "/metrics").status_code == 200)
+            poll("gate", lambda: client.post(
+                url + "/api/check-entry", json={"plate_number": registered_plate(0)}
+            ).status_code == 200)
+            poll("warm", lambda: registry_size(client, url) > 0)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+    return marks
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API cold-start time")
+    parser.add_argument("--logs", type=int, default=200_000)
+    parser.add_argument("--vehicles", type=int, default=2000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--source", default=ROOT, help="backend source tree to start (default: this checkout)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-startup-")
+    seed_database(os.path.join(workdir, "vehicle_tracking.db"), vehicles=args.vehicles, logs=args.logs)
+    # Without a background schedule the first run's timings are not skewed by the periodic jobs
+    os.environ.setdefault("RETENTION_DAYS", "0")
+
+    imports = [time_import(workdir, args.source) for _ in range(args.runs)]
+    runs = [time_startup(workdir, args.source, args.port, args.timeout) for _ in range(args.runs)]
+
+    print(f"{args.source}: {args.logs:,} logs, {args.vehicles:,} vehicles, {args.runs} runs (ms)")
+    print(f"{'':10} {'first':>8} {'median':>8} {'min':>8}")
+    rows = [("import", imports)] + [(name, [run[name] for run in runs]) for name in ("listening", "gate", "warm")]
+    for name, seconds in rows:
+        print(f"{name:10} {seconds[0] * 1e3:8.1f} {statistics.median(seconds) * 1e3:8.1f} {min(seconds) * 1e3:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
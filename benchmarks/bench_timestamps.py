@@ -0,0 +1,108 @@
+"""
+Benchmark the time paths: the IST clock (fixed offset, and the tz database
+when pytz is installed), and for both TIMESTAMP_STORAGE formats: an indexed
+range count and fetch, decoding the stored values back to datetimes, and
+extracting the millisecond column the analytics reports read.
+
+Seeds one database, copies it and converts the copy with
+convert_timestamps, so both formats hold the same rows.
+
+Usage:
+    python -m benchmarks.bench_timestamps --logs 200000
+"""
+
+import argparse
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+
+def best_of(fn, repeat, number=1):
+    """Best-of-`repeat` seconds per call"""
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - t0) / number)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark IST clock and timestamp storage formats")
+    parser.add_argument("--logs", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=7)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-timestamps-")
+    os.chdir(workdir)  # backend.database resolves its sqlite path at import
+    os.environ["TIMESTAMP_STORAGE"] = "datetime"
+
+    from sqlalchemy import DateTime, create_engine
+    from sqlalchemy.dialects import sqlite
+
+    from backend.timestamps import convert_timestamps
+    from backend.timezone_utils import from_epoch_ms, get_ist_now, to_epoch_ms
+    from benchmarks.seed import seed_database
+
+    # Clock; the tz database comparison needs pytz, which the app no longer uses
+    cases = {"fixed offset": get_ist_now}
+    try:
+        import pytz
+        tz = pytz.timezone("Asia/Kolkata")
+        cases["pytz"] = lambda: datetime.now(tz).replace(tzinfo=None)
+    except ImportError:
+        print("get_ist_now (pytz        ) skipped: pip install pytz to compare with the tz database")
+    for name, fn in cases.items():
+        print(f"get_ist_now ({name:12}) {best_of(fn, args.repeat, 100_000) * 1e9:8.0f} ns")
+
+    # Storage formats
+    text_path = os.path.join(workdir, "datetime.db")
+    seed_database(text_path, logs=args.logs)
+    epoch_path = os.path.join(workdir, "epoch_ms.db")
+    shutil.copy(text_path, epoch_path)
+    engine = create_engine(f"sqlite:///{epoch_path}")
+    with engine.begin() as conn:
+        convert_timestamps(conn, "epoch_ms")
+    engine.dispose()
+
+    now = get_ist_now()
+    since, until = now - timedelta(days=30), now - timedelta(days=20)
+    params = {
+        "datetime": (text_path, since.strftime("%Y-%m-%d %H:%M:%S.%f"), until.strftime("%Y-%m-%d %H:%M:%S.%f")),
+        "epoch_ms": (epoch_path, to_epoch_ms(since), to_epoch_ms(until)),
+    }
+    dialect = sqlite.dialect()
+    decode_text = dialect.type_descriptor(DateTime()).result_processor(dialect, None)
+    decoders = {"datetime": decode_text, "epoch_ms": from_epoch_ms}
+    # What analytics.load_log_arrays extracts per row in each format
+    ms_sql = {
+        "datetime": "CAST(round((julianday(entry_time) - 2440587.5) * 86400000) AS INTEGER)",
+        "epoch_ms": "entry_time + 19800000",
+    }
+    print(f"{args.logs:,} logs, 10-day range")
+    for name, (path, low, high) in params.items():
+        conn = sqlite3.connect(path)
+        count = lambda: conn.execute(
+            "SELECT count(*) FROM entry_logs WHERE entry_time >= ? AND entry_time < ?", (low, high)
+        ).fetchone()
+        scan = lambda: conn.execute(
+            "SELECT entry_time, exit_time FROM entry_logs WHERE entry_time >= ? AND entry_time < ?", (low, high)
+        ).fetchall()
+        analytics = lambda: conn.execute(f"SELECT {ms_sql[name]} FROM entry_logs").fetchall()
+        rows = scan()
+        decode = decoders[name]
+        decoded = lambda: [(decode(entry), decode(exit) if exit is not None else None) for entry, exit in rows]
+        print(f"{name:9} count {best_of(count, args.repeat) * 1e3:7.2f} ms   "
+              f"fetch {best_of(scan, args.repeat) * 1e3:7.2f} ms   "
+              f"decode {len(rows) / best_of(decoded, args.repeat):12,.0f} rows/s   "
+              f"analytics column {best_of(analytics, args.repeat) * 1e3:7.2f} ms   "
+              f"file {os.path.getsize(path) / 2**20:6.1f} MiB")
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Shared helpers for the benchmarks: latency statistics and a throwaway
+uvicorn server serving a backend source tree from a given directory.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def latency_summary(latencies_ms, elapsed_s, errors=0):
+    """p50/p95/p99/mean and throughput for one set of request latencies"""
+    if not latencies_ms:
+        return {"count": 0, "errors": errors}
+    return {
+        "count": len(latencies_ms),
+        "errors": errors,
+        "throughput_rps": round(len(latencies_ms) / elapsed_s, 2),
+        "mean_ms": round(statistics.fmean(latencies_ms), 3),
+        "p50_ms": round(percentile(latencies_ms, 50), 3),
+        "p95_ms": round(percentile(latencies_ms, 95), 3),
+        "p99_ms": round(percentile(latencies_ms, 99), 3),
+    }
+
+
+@contextmanager
+def uvicorn_server(workdir, port, source=ROOT, extra_args=(), timeout=30.0):
+    """Run backend.app:app from `source` with `workdir` as cwd; yields the base URL"""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app:app", "--app-dir", os.path.abspath(source),
+         "--port", str(port), "--log-level", "warning", *extra_args],
+        cwd=workdir,
+    )
+    url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.perf_counter() + timeout
+        while True:
+            try:
+                httpx.get(url + "/api/vehicles", timeout=1.0)
+                break
+            except httpx.TransportError:
+                if server.poll() is not None or time.perf_counter() > deadline:
+                    raise RuntimeError(f"Server at {url} did not start")
+                time.sleep(0.1)
+        yield url
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
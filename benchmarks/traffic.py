@@ -0,0 +1,99 @@
+"""
+Traffic mixes for the gate API and the clients that drive them.
+
+Each simulated client draws operations from a weighted mix with its own
+seeded RNG and records per-endpoint latencies. Exits pick plates that are
+known to be on campus (seeded open entries plus entries made during the run).
+"""
+
+import random
+import time
+from collections import defaultdict
+
+import httpx
+
+# operation -> weight
+MIXES = {
+    "gate": {"check_entry": 50, "check_exit": 40, "get_history": 5, "get_all_logs": 5},
+    "admin": {"get_all_logs": 40, "get_history": 30, "on_campus": 20, "check_entry": 10},
+    "mixed": {"check_entry": 35, "check_exit": 30, "get_history": 15, "get_all_logs": 15, "on_campus": 5},
+}
+
+
+def registered_plate(i: int) -> str:
+    return f"KA{i:06d}"
+
+
+def visitor_plate(i: int) -> str:
+    return f"TN{i:06d}"
+
+
+class TrafficState:
+    """State shared by all clients of one run"""
+
+    def __init__(self, vehicles, visitors, on_campus):
+        self.vehicles = vehicles
+        self.visitors = visitors
+        # Plates with an open entry, once each (a re-entry doesn't add a
+        # second exit); the list is for random picks, the set for membership
+        self.on_campus = list(dict.fromkeys(on_campus))
+        self._on_campus = set(self.on_campus)
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def arrived(self, plate):
+        if plate not in self._on_campus:
+            self._on_campus.add(plate)
+            self.on_campus.append(plate)
+
+    def leaving(self, rng):
+        """Remove and return a random plate on campus"""
+        index = rng.randrange(len(self.on_campus))
+        self.on_campus[index], self.on_campus[-1] = self.on_campus[-1], self.on_campus[index]
+        plate = self.on_campus.pop()
+        self._on_campus.discard(plate)
+        return plate
+
+    def random_plate(self, rng):
+        if rng.random() < 0.7:
+            return registered_plate(rng.randrange(self.vehicles))
+        return visitor_plate(rng.randrange(self.visitors))
+
+
+async def _request(client: httpx.AsyncClient, state: TrafficState, op, rng):
+    """Send one operation; returns (method, path, json body)"""
+    if op == "check_exit" and state.on_campus:
+        plate = state.leaving(rng)
+        return await client.post("/api/check-exit", json={"plate_number": plate})
+    if op in ("check_entry", "check_exit"):
+        plate = state.random_plate(rng)
+        response = await client.post("/api/check-entry", json={"plate_number": plate})
+        if response.status_code == 200:
+            state.arrived(plate)
+        return response
+    if op == "get_history":
+        return await client.get(f"/api/history/{state.random_plate(rng)}", params={"limit": 50})
+    if op == "get_all_logs":
+        return await client.get("/api/logs", params={"limit": 100})
+    if op == "on_campus":
+        return await client.get("/api/on-campus")
+    raise ValueError(f"Unknown operation {op}")
+
+
+async def run_client(client, state: TrafficState, mix, requests, seed):
+    """Run `requests` operations drawn from `mix`"""
+    rng = random.Random(seed)
+    ops, weights = zip(*mix.items())
+    for _ in range(requests):
+        op = rng.choices(ops, weights)[0]
+        if op == "check_exit" and not state.on_campus:
+            op = "check_entry"
+        t0 = time.perf_counter()
+        try:
+            response = await _request(client, state, op, rng)
+            ok = response.status_code < 400
+        except httpx.HTTPError:
+            ok = False
+        state.latencies[op].append((time.perf_counter() - t0) * 1000)
+        if not ok:
+            state.errors[op] += 1
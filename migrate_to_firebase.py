@@ -3,25 +3,62 @@ Migration Script: SQLite → Firebase Firestore
 
 This script migrates your existing vehicle data from SQLite to Firebase.
 
+Rows are streamed from SQLite in chunks and written with Firestore batched
+writes from a pool of worker threads. Document IDs are deterministic
+(plate number for vehicles, entry_logs.id for logs), so re-running the
+script overwrites instead of duplicating, and a checkpoint file records the
+last fully written chunk so an interrupted run resumes where it stopped.
+
 Prerequisites:
 1. Install Firebase Admin SDK: pip install firebase-admin
 2. Generate Firebase service account key:
    - Go to Firebase Console → Project Settings → Service Accounts
    - Click "Generate New Private Key"
    - Save as firebase-admin-key.json in this directory
+
+Usage:
+    python migrate_to_firebase.py                 # migrate (resumes from checkpoint)
+    python migrate_to_firebase.py --restart       # ignore the checkpoint
+    python migrate_to_firebase.py --fake          # dry run against an in-memory Firestore
+
+To run against the Firestore emulator, set FIRESTORE_EMULATOR_HOST
+(e.g. localhost:8080) before starting; the Admin SDK picks it up.
 """
 
+import argparse
+import json
+import os
 import sqlite3
-import firebase_admin
-from firebase_admin import credentials, firestore
-from datetime import datetime
 import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from backend.plates import normalize_plate
+from backend.timezone_utils import from_epoch_ms, localize_ist
+
+DATABASE_PATH = 'vehicle_tracking.db'
+CHECKPOINT_PATH = 'migration_checkpoint.json'
+
+# Firestore allows at most 500 writes per batch
+BATCH_SIZE = 500
+WORKERS = 8
+
+# Stand-in for firestore.SERVER_TIMESTAMP when running against the fake client
+SERVER_TIMESTAMP = "SERVER_TIMESTAMP"
+
 
 def init_firebase():
     """Initialize Firebase Admin SDK"""
+    global SERVER_TIMESTAMP
     try:
+        import firebase_admin
+        from firebase_admin import credentials, firestore
+
         cred = credentials.Certificate('firebase-admin-key.json')
         firebase_admin.initialize_app(cred)
+        SERVER_TIMESTAMP = firestore.SERVER_TIMESTAMP
         return firestore.client()
     except Exception as e:
         print(f"❌ Error initializing Firebase: {e}")
@@ -31,159 +68,284 @@ def init_firebase():
         print("   3. Installed firebase-admin: pip install firebase-admin")
         sys.exit(1)
 
-def migrate_vehicles(db):
+
+# ---------------------------------------------------------------------------
+# Checkpointing and progress
+# ---------------------------------------------------------------------------
+
+def load_checkpoint(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_checkpoint(path, checkpoint):
+    # Write then rename so a crash never leaves a half-written checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp_path, path)
+
+
+class Progress:
+    """Prints rows written, throughput and ETA at most once per second"""
+
+    def __init__(self, label, total):
+        self.label = label
+        self.total = total
+        self.done = 0
+        self.started = time.perf_counter()
+        self._last_print = 0
+
+    def advance(self, count, force=False):
+        self.done += count
+        now = time.perf_counter()
+        if not force and now - self._last_print < 1:
+            return
+        self._last_print = now
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.done / elapsed
+        eta = (self.total - self.done) / rate if rate and self.total else 0
+        print(f"   {self.label}: {self.done}/{self.total} rows  {rate:,.0f} rows/s  ETA {eta:,.0f}s")
+
+    def summary(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return f"{self.done} rows in {elapsed:.1f}s ({self.done / elapsed:,.0f} rows/s)"
+
+
+# ---------------------------------------------------------------------------
+# Pipeline
+# ---------------------------------------------------------------------------
+
+def stream_chunks(conn, query, key_index, after, chunk_size):
+    """
+    Yield chunks of rows in key order, starting after `after`.
+    `query` must take the last key as its only parameter and ORDER BY that key.
+    """
+    while True:
+        rows = conn.execute(query + " LIMIT ?", (after, chunk_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][key_index]
+
+
+def write_chunk(db, collection, docs):
+    """Write [(doc_id, data), ...] as one batched commit"""
+    batch = db.batch()
+    ref = db.collection(collection)
+    for doc_id, data in docs:
+        batch.set(ref.document(doc_id), data)
+    batch.commit()
+    return len(docs)
+
+
+def run_pipeline(db, collection, chunks, to_doc, last_key, on_checkpoint, progress, workers):
+    """
+    Write chunks through a worker pool. Results are consumed in submission
+    order, so the checkpoint only ever advances past fully written chunks.
+    """
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        def drain(limit):
+            while len(pending) > limit:
+                future, key = pending.popleft()
+                try:
+                    progress.advance(future.result())
+                except Exception as e:
+                    # Stop advancing the checkpoint; a rerun retries from here
+                    print(f"   ❌ Batch ending at {key!r} failed: {e}")
+                    for other, _ in pending:
+                        other.cancel()
+                    raise
+                on_checkpoint(key)
+
+        for rows in chunks:
+            docs = [to_doc(row) for row in rows]
+            pending.append((pool.submit(write_chunk, db, collection, docs), last_key(rows)))
+            drain(workers * 2)
+        drain(0)
+    progress.advance(0, force=True)
+
+
+def vehicle_doc(row):
+    plate_number, owner_name, vehicle_type, registered_date = row
+    # Same canonical form as the API (letters and digits, uppercase)
+    normalized_plate = normalize_plate(plate_number)
+    return normalized_plate, {
+        'plateNumber': normalized_plate,
+        'ownerName': owner_name or "Unknown",
+        'vehicleType': vehicle_type or "Unknown",
+        'registeredDate': SERVER_TIMESTAMP
+    }
+
+
+def parse_stored_time(value):
+    """Stored entry/exit time -> aware datetime (Firestore reads naive datetimes as UTC)"""
+    if value is None:
+        return None
+    if isinstance(value, int):
+        return localize_ist(from_epoch_ms(value))
+    return localize_ist(datetime.fromisoformat(value.replace('Z', '+00:00')))
+
+
+def entry_log_doc(row):
+    log_id, plate_number, entry_time, exit_time, duration_minutes, is_registered, is_suspicious = row
+    # Normalize plate number
+    normalized_plate = normalize_plate(plate_number)
+
+    # Stored as naive IST: ISO strings, or epoch milliseconds with TIMESTAMP_STORAGE=epoch_ms
+    entry_dt = parse_stored_time(entry_time)
+    exit_dt = parse_stored_time(exit_time)
+
+    # Document ID derived from entry_logs.id so reruns overwrite, never duplicate
+    return str(log_id), {
+        'plateNumber': normalized_plate,
+        'entryTime': entry_dt,
+        'exitTime': exit_dt,
+        'durationMinutes': duration_minutes,
+        'isRegistered': bool(is_registered),
+        'isSuspicious': bool(is_suspicious),
+        'suspiciousReason': None  # Old system didn't have reasons
+    }
+
+
+def migrate_table(db, conn, name, collection, count_sql, query, to_doc, checkpoint, checkpoint_path, workers):
+    """Migrate one table, resuming after its checkpointed key"""
+    total = conn.execute(count_sql).fetchone()[0]
+    after = checkpoint.get(name, {}).get("after", "" if name == "vehicles" else 0)
+    already = checkpoint.get(name, {}).get("rows", 0)
+
+    if checkpoint.get(name, {}).get("complete"):
+        print(f"   ⏭️  {name} already migrated ({already} rows), skipping")
+        return already
+    if already:
+        print(f"   ↪️  Resuming {name} after {after!r} ({already} rows already written)")
+
+    progress = Progress(name, total)
+    progress.done = already
+
+    def on_checkpoint(key):
+        checkpoint[name] = {"after": key, "rows": progress.done}
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    chunks = stream_chunks(conn, query, 0, after, BATCH_SIZE)
+    run_pipeline(db, collection, chunks, to_doc, lambda rows: rows[-1][0], on_checkpoint, progress, workers)
+
+    checkpoint[name] = {"after": checkpoint.get(name, {}).get("after", after), "rows": progress.done, "complete": True}
+    save_checkpoint(checkpoint_path, checkpoint)
+    print(f"\n✅ Migrated {name}: {progress.summary()}")
+    return progress.done
+
+
+def migrate_vehicles(db, conn, checkpoint, checkpoint_path, workers=WORKERS):
     """Migrate vehicles from SQLite to Firestore"""
     print("\n[*] Migrating vehicles...")
-    
-    try:
-        conn = sqlite3.connect('vehicle_tracking.db')
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT plate_number, owner_name, vehicle_type, registered_date FROM vehicles")
-        vehicles = cursor.fetchall()
-        
-        if not vehicles:
-            print("   ⚠️  No vehicles found in SQLite database")
-            return 0
-        
-        count = 0
-        for plate_number, owner_name, vehicle_type, registered_date in vehicles:
-            try:
-                # Normalize plate number (remove spaces, uppercase)
-                normalized_plate = plate_number.upper().replace(" ", "")
-                
-                vehicle_data = {
-                    'plateNumber': normalized_plate,
-                    'ownerName': owner_name or "Unknown",
-                    'vehicleType': vehicle_type or "Unknown",
-                    'registeredDate': firestore.SERVER_TIMESTAMP
-                }
-                
-                # Use plate number as document ID for easy lookup
-                db.collection('vehicles').document(normalized_plate).set(vehicle_data)
-                print(f"   ✅ {normalized_plate} - {owner_name}")
-                count += 1
-                
-            except Exception as e:
-                print(f"   ❌ Failed to migrate {plate_number}: {e}")
-        
-        conn.close()
-        print(f"\n✅ Successfully migrated {count} vehicles")
-        return count
-        
-    except sqlite3.Error as e:
-        print(f"❌ SQLite error: {e}")
-        return 0
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        return 0
+    return migrate_table(
+        db, conn, "vehicles", "vehicles",
+        "SELECT COUNT(*) FROM vehicles",
+        "SELECT plate_number, owner_name, vehicle_type, registered_date FROM vehicles "
+        "WHERE plate_number > ? ORDER BY plate_number",
+        vehicle_doc, checkpoint, checkpoint_path, workers,
+    )
+
 
-def migrate_entry_logs(db):
+def migrate_entry_logs(db, conn, checkpoint, checkpoint_path, workers=WORKERS):
     """Migrate entry logs from SQLite to Firestore"""
     print("\n📝 Migrating entry logs...")
-    
-    try:
-        conn = sqlite3.connect('vehicle_tracking.db')
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT id, plate_number, entry_time, exit_time, duration_minutes, 
-                   is_registered, is_suspicious 
-            FROM entry_logs 
-            ORDER BY entry_time DESC
-        """)
-        logs = cursor.fetchall()
-        
-        if not logs:
-            print("   ⚠️  No entry logs found in SQLite database")
-            return 0
-        
-        count = 0
-        for log_id, plate_number, entry_time, exit_time, duration_minutes, is_registered, is_suspicious in logs:
-            try:
-                # Normalize plate number
-                normalized_plate = plate_number.upper().replace(" ", "")
-                
-                # Parse datetime strings (SQLite stores as ISO format strings)
-                entry_dt = datetime.fromisoformat(entry_time.replace('Z', '+00:00')) if entry_time else None
-                exit_dt = datetime.fromisoformat(exit_time.replace('Z', '+00:00')) if exit_time else None
-                
-                log_data = {
-                    'plateNumber': normalized_plate,
-                    'entryTime': entry_dt,
-                    'exitTime': exit_dt,
-                    'durationMinutes': duration_minutes,
-                    'isRegistered': bool(is_registered),
-                    'isSuspicious': bool(is_suspicious),
-                    'suspiciousReason': None  # Old system didn't have reasons
-                }
-                
-                # Add to Firestore (auto-generate ID)
-                db.collection('entryLogs').add(log_data)
-                
-                status = "In campus" if not exit_dt else f"{duration_minutes:.0f}min"
-                print(f"   ✅ {normalized_plate} - {entry_dt.strftime('%d/%m %H:%M') if entry_dt else 'N/A'} ({status})")
-                count += 1
-                
-            except Exception as e:
-                print(f"   ❌ Failed to migrate log {log_id}: {e}")
-        
-        conn.close()
-        print(f"\n✅ Successfully migrated {count} entry logs")
-        return count
-        
-    except sqlite3.Error as e:
-        print(f"❌ SQLite error: {e}")
-        return 0
-    except Exception as e:
-        print(f"❌ Error: {e}")
-        return 0
+    return migrate_table(
+        db, conn, "entry_logs", "entryLogs",
+        "SELECT COUNT(*) FROM entry_logs",
+        """
+            SELECT id, plate_number, entry_time, exit_time, duration_minutes,
+                   is_registered, is_suspicious
+            FROM entry_logs
+            WHERE id > ?
+            ORDER BY id
+        """,
+        entry_log_doc, checkpoint, checkpoint_path, workers,
+    )
+
 
-def verify_migration(db):
+def verify_migration(db, expected_vehicles=None, expected_logs=None):
     """Verify the migration was successful"""
     print("\n🔍 Verifying migration...")
-    
+
     try:
-        vehicles_count = len(db.collection('vehicles').limit(1000).get())
-        logs_count = len(db.collection('entryLogs').limit(1000).get())
-        
+        limit = 1000 if expected_logs is None else max(expected_vehicles, expected_logs) + 1
+        vehicles_count = len(db.collection('vehicles').limit(limit).get())
+        logs_count = len(db.collection('entryLogs').limit(limit).get())
+
         print(f"   📦 Vehicles in Firestore: {vehicles_count}")
         print(f"   📝 Entry logs in Firestore: {logs_count}")
-        
+
+        if expected_logs is not None and (vehicles_count, logs_count) != (expected_vehicles, expected_logs):
+            print(f"\n❌ Expected {expected_vehicles} vehicles and {expected_logs} entry logs")
+            return False
         if vehicles_count > 0 or logs_count > 0:
             print("\n✅ Migration verified successfully!")
             return True
         else:
             print("\n⚠️  No data found in Firestore")
             return False
-            
+
     except Exception as e:
         print(f"❌ Verification error: {e}")
         return False
 
+
 def main():
+    parser = argparse.ArgumentParser(description="Migrate vehicle_tracking.db to Cloud Firestore")
+    parser.add_argument("--database", default=DATABASE_PATH)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_PATH)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--restart", action="store_true", help="ignore any existing checkpoint")
+    parser.add_argument("--fake", action="store_true",
+                        help="write to an in-memory Firestore, run twice and verify counts")
+    args = parser.parse_args()
+
     print("=" * 60)
     print("   Firebase Migration Tool")
     print("   SQLite -> Cloud Firestore")
     print("=" * 60)
-    
+
+    try:
+        conn = sqlite3.connect(args.database)
+    except sqlite3.Error as e:
+        print(f"❌ SQLite error: {e}")
+        sys.exit(1)
+
+    if args.fake:
+        run_fake(conn, args)
+        return
+
     # Initialize Firebase
     db = init_firebase()
     print("✅ Firebase connection established")
-    
+
     # Auto-proceed with migration
     print("\n[!] WARNING: This will upload your data to Firebase Cloud")
     print("   Project: vehicle-entry-system1")
     print("\n[*] Proceeding with migration...")
-    
+
+    checkpoint = {} if args.restart else load_checkpoint(args.checkpoint)
+
     # Migrate data
-    vehicles_migrated = migrate_vehicles(db)
-    logs_migrated = migrate_entry_logs(db)
-    
+    try:
+        vehicles_migrated = migrate_vehicles(db, conn, checkpoint, args.checkpoint, args.workers)
+        logs_migrated = migrate_entry_logs(db, conn, checkpoint, args.checkpoint, args.workers)
+    except Exception as e:
+        print(f"\n❌ Migration interrupted: {e}")
+        print(f"   Progress is saved in {args.checkpoint}; run the script again to resume.")
+        sys.exit(1)
+    finally:
+        conn.close()
+
     # Verify
     if vehicles_migrated > 0 or logs_migrated > 0:
         verify_migration(db)
-        
+
         print("\n" + "=" * 60)
         print("✅ Migration Complete!")
         print("=" * 60)
@@ -195,6 +357,49 @@ def main():
     else:
         print("\n⚠️  No data was migrated")
 
+
+def run_fake(conn, args):
+    """
+    Exercise the pipeline against MemoryFirestore: a run that crashes halfway,
+    a resumed run from its checkpoint, then a full rerun from scratch. Document
+    counts must match SQLite afterwards, i.e. resume and rerun are idempotent.
+    """
+    import tempfile
+
+    from backend.memory_firestore import MemoryFirestore
+
+    expected_vehicles = conn.execute("SELECT COUNT(*) FROM vehicles").fetchone()[0]
+    expected_logs = conn.execute("SELECT COUNT(*) FROM entry_logs").fetchone()[0]
+    total_batches = -(-expected_vehicles // BATCH_SIZE) + -(-expected_logs // BATCH_SIZE)
+    client = MemoryFirestore(fail_after=total_batches // 2)
+    db = client.sync()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        checkpoint_path = os.path.join(tmp, "checkpoint.json")
+
+        print(f"\n[*] Fake run 1: crash after {client.fail_after} of {total_batches} batches")
+        checkpoint = {}
+        try:
+            migrate_vehicles(db, conn, checkpoint, checkpoint_path, args.workers)
+            migrate_entry_logs(db, conn, checkpoint, checkpoint_path, args.workers)
+        except ConnectionError as e:
+            print(f"   Run 1 stopped: {e}")
+
+        print("\n[*] Fake run 2: resume from checkpoint")
+        client.fail_after = None
+        checkpoint = load_checkpoint(checkpoint_path)
+        migrate_vehicles(db, conn, checkpoint, checkpoint_path, args.workers)
+        migrate_entry_logs(db, conn, checkpoint, checkpoint_path, args.workers)
+
+        print("\n[*] Fake run 3: full rerun without checkpoint")
+        migrate_vehicles(db, conn, {}, checkpoint_path, args.workers)
+        migrate_entry_logs(db, conn, {}, checkpoint_path, args.workers)
+
+    print(f"\n   Batches committed: {client.commits}")
+    ok = verify_migration(db, expected_vehicles, expected_logs)
+    conn.close()
+    sys.exit(0 if ok else 1)
+
+
 if __name__ == "__main__":
     main()
-
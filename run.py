@@ -1,8 +1,77 @@
 """
 Run the Vehicle Entry Management System
+
+    python run.py                  single process (what the gate kiosks run)
+    python run.py --reload         development server with auto-reload
+    python run.py --prod           production: N workers, no reload
+    python run.py --prod --workers 4 --port 8000
+
+The application is built by backend.app:create_app in the server process;
+the reloader is opt-in because its file watcher and extra process slow
+every cold start.
 """
+import argparse
+import asyncio
+import importlib.util
+import os
+
 import uvicorn
 
-if __name__ == "__main__":
-    uvicorn.run("backend.app:app", host="0.0.0.0", port=8000, reload=True)
 
+# CACHE_SYNC_INTERVAL for several workers, unless set in the environment
+WORKER_SYNC_INTERVAL = "0.5"
+
+
+def run_production(args):
+    # Workers inherit the environment: with more than one, each polls for
+    # the others' writes (see backend/coherence.py)
+    if args.workers > 1:
+        os.environ.setdefault("CACHE_SYNC_INTERVAL", WORKER_SYNC_INTERVAL)
+        if float(os.environ["CACHE_SYNC_INTERVAL"]) <= 0:
+            print("Warning: CACHE_SYNC_INTERVAL=0 with several workers; their caches and event streams diverge")
+
+    # Create tables and run migrations once, before the workers start, so
+    # they don't race each other through init_db()
+    from backend.database import init_db
+    asyncio.run(init_db())
+
+    # uvloop and httptools come with uvicorn[standard]; fall back to the
+    # pure-Python implementations when they are missing
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    print(f"Starting {args.workers} workers on {args.host}:{args.port} (loop={loop}, http={http})")
+
+    uvicorn.run(
+        "backend.app:create_app",
+        factory=True,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=args.keepalive,
+        backlog=args.backlog,
+        access_log=False,
+        reload=False,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Vehicle Entry Management API")
+    parser.add_argument("--prod", action="store_true", help="multi-worker production mode")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--keepalive", type=int, default=30, help="keep-alive timeout (seconds)")
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--reload", action="store_true", help="restart on code changes (development)")
+    args = parser.parse_args()
+
+    if args.prod:
+        run_production(args)
+    else:
+        uvicorn.run("backend.app:create_app", factory=True, host=args.host, port=args.port, reload=args.reload)
+
+
+if __name__ == "__main__":
+    main()
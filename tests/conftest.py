@@ -0,0 +1,54 @@
+"""
+Shared test setup. backend.config reads the environment and
+backend.database resolves its SQLite path at import, so the session runs in
+a directory of its own with the background jobs off, before any test
+module imports the backend.
+
+Run from the repository root:
+    python -m pytest
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+os.chdir(tempfile.mkdtemp(prefix="vehicle-tests-"))
+os.environ.setdefault("CACHE_SYNC_INTERVAL", "0")
+os.environ.setdefault("REGISTRY_REFRESH_SECONDS", "0")
+
+
+@pytest.fixture(scope="module")
+def app_database(tmp_path_factory):
+    """
+    A new working directory for the app's ./vehicle_tracking.db, for the
+    tests of one module. The engines resolve the path when they are built,
+    so they are closed and built again on next use, and the registry cache
+    forgets the previous database's plates.
+    """
+    from backend import database
+    from backend.registry import registry_cache
+
+    def reconnect():
+        if database.get_engine.cache_info().currsize:
+            database.get_engine().dispose()
+        if database.get_async_engine.cache_info().currsize:
+            asyncio.run(database.get_async_engine().dispose())
+        for factory in (database.get_engine, database.get_async_engine, database._async_sessionmaker):
+            factory.cache_clear()
+        for name in database._LAZY_ATTRIBUTES:
+            vars(database).pop(name, None)
+        registry_cache.replace({})
+        registry_cache.loaded = False
+
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp("app"))
+    reconnect()
+    yield os.path.abspath("vehicle_tracking.db")
+    reconnect()
+    os.chdir(previous)
@@ -0,0 +1,49 @@
+"""Entries left open by a re-entry without an exit scan (trg_active_entry)"""
+
+import asyncio
+import sqlite3
+
+import httpx
+
+from backend.app import app
+
+
+async def replay(client, kind, *times):
+    events = [{
+        "plate_number": "AB12CD3456",
+        "timestamp": f"2026-01-05T{time}:00+05:30",
+        "idempotency_key": f"{kind}-{time}",
+    } for time in times]
+    response = await client.post(f"/api/check-{kind}/batch", json={"events": events})
+    response.raise_for_status()
+    return [result["status"] for result in response.json()["results"]]
+
+
+def abandoned(path):
+    with sqlite3.connect(path) as db:
+        return db.execute("SELECT count(*) FROM entry_logs WHERE abandoned_at IS NOT NULL").fetchone()[0]
+
+
+async def scenario(path):
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            assert await replay(client, "entry", "08:00", "10:00") == ["applied", "applied"]
+            history = (await client.get("/api/history/AB12CD3456")).json()["entries"]
+            on_campus = (await client.get("/api/on-campus")).json()
+            assert abandoned(path) == 1
+
+            # The device's buffered exit for the first visit still pairs up with it
+            assert await replay(client, "exit", "09:00", "11:00") == ["applied", "applied"]
+            closed = (await client.get("/api/history/AB12CD3456")).json()["entries"]
+            assert abandoned(path) == 0
+    return history, on_campus, closed
+
+
+def test_a_re_entry_abandons_the_open_entry_without_an_exit_time(app_database):
+    history, on_campus, closed = asyncio.run(scenario(app_database))
+
+    assert [log["exit_time"] for log in history] == [None, None]
+    assert on_campus["count"] == 1
+    assert on_campus["vehicles"][0]["entry_time"] == history[0]["entry_time"]
+    assert [log["duration_minutes"] for log in closed] == [60, 60]
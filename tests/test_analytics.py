@@ -0,0 +1,60 @@
+"""Column cache of backend.analytics.load_log_arrays"""
+
+import numpy as np
+from sqlalchemy import create_engine, insert, select, text, update
+
+from backend import analytics
+from backend.database import ActiveEntry, EntryLog
+from backend.timezone_utils import get_ist_now
+from benchmarks.seed import seed_database
+
+
+def columns_equal(a, b):
+    return all(
+        np.array_equal(getattr(a, name), getattr(b, name), equal_nan=name == "duration")
+        for name in analytics.COLUMNS if name != "plate"
+    ) and [a.plates[code] for code in a.plate] == [b.plates[code] for code in b.plate]
+
+
+def test_abandoned_visits_do_not_hold_back_the_cache(tmp_path, monkeypatch):
+    path = tmp_path / "logs.db"
+    seed_database(str(path), vehicles=50, logs=2000, visitors=30)
+    engine = create_engine(f"sqlite:///{path}")
+    cache_dir = str(tmp_path / "cache")
+
+    with engine.begin() as conn:
+        analytics.load_log_arrays(conn, cache_dir)
+        # A re-entry abandons the oldest visit still on campus
+        plate, entry_id = conn.execute(
+            select(ActiveEntry.plate_number, ActiveEntry.entry_log_id).order_by(ActiveEntry.entry_time).limit(1)
+        ).one()
+        conn.execute(insert(EntryLog).values(
+            plate_number=plate, entry_time=get_ist_now(), is_registered=False, is_suspicious=False,
+        ))
+        oldest_abandoned = conn.execute(text("SELECT min(id) FROM entry_logs WHERE abandoned_at IS NOT NULL")).scalar()
+    assert oldest_abandoned <= entry_id
+
+    reads = []
+    fetch = analytics._fetch
+    monkeypatch.setattr(analytics, "_fetch", lambda conn, from_id, plates: reads.append(from_id) or fetch(conn, from_id, plates))
+
+    with engine.connect() as conn:
+        analytics.load_log_arrays(conn, cache_dir)
+        arrays = analytics.load_log_arrays(conn, cache_dir)
+    # The entry was on campus at the first load; after that, loads re-read
+    # from the oldest visit still on campus, not from the abandoned ones
+    assert reads == [entry_id, arrays.id[np.flatnonzero(arrays.open)[0]]]
+    assert reads[1] > entry_id
+    at = int(np.searchsorted(arrays.id, entry_id))
+    assert arrays.abandoned[at] and np.isnan(arrays.duration[at])
+
+    # A replayed exit scan closes the abandoned visit (see backend.batch)
+    with engine.begin() as conn:
+        conn.execute(update(EntryLog).where(EntryLog.id == entry_id).values(
+            exit_time=get_ist_now(), duration_minutes=42.0, is_suspicious=True, abandoned_at=None,
+        ))
+    with engine.connect() as conn:
+        arrays = analytics.load_log_arrays(conn, cache_dir)
+        cold = analytics.load_log_arrays(conn)
+    assert arrays.duration[at] == 42.0 and arrays.is_suspicious[at] and not arrays.abandoned[at]
+    assert columns_equal(arrays, cold)
@@ -0,0 +1,39 @@
+"""Registry uploads through /api/vehicles/import (backend.bulk_vehicles)"""
+
+import asyncio
+
+import httpx
+
+from backend.app import app
+
+
+async def upload(*files):
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return [
+                await client.post("/api/vehicles/import", files={"file": (name, body)})
+                for name, body in files
+            ]
+
+
+def test_updated_counts_the_plates_that_changed(app_database):
+    first, second, bad = asyncio.run(upload(
+        ("vehicles.csv", "plate_number,owner_name\nAB12CD0001,Asha\nAB12CD0002,Ravi\n"),
+        ("vehicles.ndjson", "\n".join([
+            '{"plate_number": "AB12CD0001", "owner_name": "Asha"}',  # unchanged
+            '{"plate_number": "AB12CD0002", "owner_name": "Ravi K"}',
+            '{"plate_number": "AB12CD0002", "owner_name": "Ravi Kumar"}',  # last row wins
+            '{"plate_number": "AB12CD0003", "owner_name": "Meera"}',
+            '{"plate_number": "AB12CD0004"}',
+        ])),
+        ("vehicles.csv", "plate,owner\nAB12CD0005,Dev\n"),
+    ))
+
+    assert {key: first.json()[key] for key in ("rows", "created", "updated")} == {"rows": 2, "created": 2, "updated": 0}
+    report = second.json()
+    assert {key: report[key] for key in ("rows", "created", "updated", "error_count")} == {
+        "rows": 5, "created": 1, "updated": 1, "error_count": 1,
+    }
+    assert report["errors"] == [{"line": 5, "error": "Missing owner_name"}]
+    assert bad.status_code == 400
@@ -0,0 +1,66 @@
+"""Live events for scans committed by other workers (backend.coherence.EventRelay)"""
+
+import asyncio
+import json
+from collections import OrderedDict
+from datetime import timedelta
+
+from sqlalchemy import insert, update
+
+from backend.coherence import EventRelay
+from backend.database import EntryLog, get_engine, init_db, new_session
+from backend.events import event_broker, publish_scan
+from backend.timezone_utils import get_ist_now
+
+
+def other_worker_entry(plate_number, entry_time):
+    with get_engine().begin() as conn:
+        return conn.execute(insert(EntryLog).values(
+            plate_number=plate_number, entry_time=entry_time, is_registered=False, is_suspicious=False,
+        )).inserted_primary_key[0]
+
+
+def other_worker_exit(log_id, exit_time):
+    with get_engine().begin() as conn:
+        conn.execute(update(EntryLog).where(EntryLog.id == log_id).values(exit_time=exit_time, duration_minutes=30.0))
+
+
+async def sync(relay):
+    async with new_session() as db:
+        await relay.sync(db)
+
+
+def streamed(since):
+    events = []
+    for event in list(event_broker.history)[since:]:
+        data = json.loads(event.frame.split(b"data: ", 1)[1])
+        events.append((event.type, data["log_id"]))
+    return events
+
+
+def test_scans_of_other_workers_reach_the_stream_once(app_database, monkeypatch):
+    monkeypatch.setattr(event_broker, "relaying", False)
+    monkeypatch.setattr(event_broker, "claimed", OrderedDict())
+    asyncio.run(init_db())
+    now = get_ist_now()
+    before = other_worker_entry("AB12CD0001", now - timedelta(hours=2))
+
+    relay = EventRelay()
+    asyncio.run(sync(relay))
+    assert event_broker.relaying
+    start = len(event_broker.history)
+
+    other = other_worker_entry("AB12CD0002", now - timedelta(minutes=30))
+    other_worker_exit(before, now)
+    # A scan this worker committed and published itself
+    own = other_worker_entry("AB12CD0003", now)
+    assert publish_scan("entry", {"log_id": own, "plate_number": "AB12CD0003", "is_suspicious": False})
+    asyncio.run(sync(relay))
+
+    assert streamed(start) == [("entry", own), ("entry", other), ("exit", before)]
+    assert relay.relayed == 2
+    # The relay published it first: the request's own publish is dropped
+    other_worker_exit(other, now)
+    asyncio.run(sync(relay))
+    assert not publish_scan("exit", {"log_id": other, "plate_number": "AB12CD0002", "is_suspicious": False})
+    assert streamed(start)[-1] == ("exit", other)
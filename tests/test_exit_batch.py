@@ -0,0 +1,49 @@
+"""Exit batches racing other requests for the same visits (backend.batch)"""
+
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+
+from backend import batch
+from backend.app import app
+
+
+def event(kind, plate_number, time):
+    return {
+        "plate_number": plate_number,
+        "timestamp": f"2026-01-05T{time}:00+05:30",
+        "idempotency_key": f"{kind}-{plate_number}-{time}",
+    }
+
+
+async def scenario():
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            entries = [event("entry", "AB12CD0001", "08:00"), event("entry", "AB12CD0002", "08:00")]
+            (await client.post("/api/check-entry/batch", json={"events": entries})).raise_for_status()
+            exits = [event("exit", "AB12CD0001", "09:00"), event("exit", "AB12CD0002", "09:00")]
+            response = await client.post("/api/check-exit/batch", json={"events": exits})
+            response.raise_for_status()
+            return response.json()["results"]
+
+
+def test_a_visit_closed_on_every_attempt_fails_alone(app_database, monkeypatch):
+    attempts = []
+    open_visit = batch._open_visit
+
+    def closed_elsewhere(visits, exit_time):
+        visit = open_visit(visits, exit_time)
+        if visit is not None and visit.plate_number == "AB12CD0001":
+            attempts.append(visit.id)
+            return SimpleNamespace(**{**visit._asdict(), "id": -1})  # no open row has this id
+        return visit
+
+    monkeypatch.setattr(batch, "_open_visit", closed_elsewhere)
+    monkeypatch.setattr(batch, "EXIT_BATCH_BACKOFF", 0)
+    first, second = asyncio.run(scenario())
+
+    assert len(attempts) == batch.EXIT_BATCH_ATTEMPTS
+    assert first["status"] == "error" and "concurrent" in first["detail"]
+    assert second["status"] == "applied" and second["duration_minutes"] == 60
@@ -0,0 +1,20 @@
+"""fast_ack journals of backend.group_commit"""
+
+import asyncio
+import glob
+import os
+
+from backend.group_commit import JOURNAL_PATTERN, Journal, replay_journals
+
+
+def test_a_new_journal_is_locked_before_replay_can_see_it(tmp_path):
+    journal = Journal(str(tmp_path))
+    journal.open()
+    try:
+        assert glob.glob(os.path.join(tmp_path, JOURNAL_PATTERN)) == [journal.path]
+        assert os.listdir(tmp_path) == [journal.name]
+        # Another worker starting now leaves the running worker's journal alone
+        assert asyncio.run(replay_journals(str(tmp_path))) == 0
+        assert os.path.exists(journal.path)
+    finally:
+        os.close(journal._fd)
@@ -0,0 +1,105 @@
+"""migrate_to_firebase.py against MemoryFirestore, the client --fake runs on"""
+
+import sqlite3
+
+import pytest
+
+import migrate_to_firebase as migration
+from backend.memory_firestore import MAX_BATCH_WRITES, MemoryFirestore
+from backend.plates import normalize_plate
+from benchmarks.seed import seed_database
+
+
+@pytest.fixture
+def source(tmp_path):
+    path = tmp_path / "source.db"
+    seed_database(str(path), vehicles=300, logs=1200, visitors=100)
+    conn = sqlite3.connect(path)
+    yield conn
+    conn.close()
+
+
+def migrate(db, conn, checkpoint, checkpoint_path):
+    migration.migrate_vehicles(db, conn, checkpoint, checkpoint_path)
+    migration.migrate_entry_logs(db, conn, checkpoint, checkpoint_path)
+
+
+def source_ids(conn):
+    plates = {normalize_plate(row[0]) for row in conn.execute("SELECT plate_number FROM vehicles")}
+    log_ids = {str(row[0]) for row in conn.execute("SELECT id FROM entry_logs")}
+    return plates, log_ids
+
+
+def test_crash_resume_and_rerun_write_every_row_once(source, tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    client = MemoryFirestore(fail_after=2)
+    db = client.sync()
+
+    with pytest.raises(ConnectionError):
+        migrate(db, source, {}, checkpoint_path)
+    checkpoint = migration.load_checkpoint(checkpoint_path)
+    assert checkpoint["vehicles"]["complete"]
+    assert not checkpoint.get("entry_logs", {}).get("complete")
+
+    client.fail_after = None
+    migrate(db, source, migration.load_checkpoint(checkpoint_path), checkpoint_path)
+    assert migration.load_checkpoint(checkpoint_path)["entry_logs"]["complete"]
+    migrate(db, source, {}, checkpoint_path)
+
+    plates, log_ids = source_ids(source)
+    assert set(client.store["vehicles"]) == plates
+    assert set(client.store["entryLogs"]) == log_ids
+    assert migration.verify_migration(db, len(plates), len(log_ids))
+
+
+def test_completed_checkpoint_writes_nothing(source, tmp_path):
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    client = MemoryFirestore()
+    migrate(client.sync(), source, {}, checkpoint_path)
+    commits = client.commits
+
+    migrate(client.sync(), source, migration.load_checkpoint(checkpoint_path), checkpoint_path)
+    assert client.commits == commits
+
+
+def test_verify_migration_reports_missing_documents(source, tmp_path):
+    client = MemoryFirestore()
+    db = client.sync()
+    migration.migrate_vehicles(db, source, {}, str(tmp_path / "checkpoint.json"))
+
+    plates, log_ids = source_ids(source)
+    assert not migration.verify_migration(db, len(plates), len(log_ids))
+
+
+def test_entry_log_doc_converts_stored_times(source):
+    row = source.execute(
+        "SELECT id, plate_number, entry_time, exit_time, duration_minutes, is_registered, is_suspicious "
+        "FROM entry_logs WHERE exit_time IS NOT NULL ORDER BY id LIMIT 1"
+    ).fetchone()
+    doc_id, doc = migration.entry_log_doc(row)
+
+    assert doc_id == str(row[0])
+    assert doc["plateNumber"] == normalize_plate(row[1])
+    assert doc["entryTime"].tzinfo is not None
+    assert doc["entryTime"] == migration.parse_stored_time(row[2])
+    assert doc["exitTime"] > doc["entryTime"]
+    assert doc["durationMinutes"] == row[4]
+    assert doc["isRegistered"] is bool(row[5])
+    assert doc["isSuspicious"] is bool(row[6])
+
+
+def test_vehicle_doc_uses_the_api_plate_form():
+    doc_id, doc = migration.vehicle_doc((" ka-01 ab 1234", None, "car", "2024-01-01"))
+    assert doc_id == doc["plateNumber"] == normalize_plate("KA01AB1234")
+    assert doc["ownerName"] == "Unknown"
+    assert doc["registeredDate"] == migration.SERVER_TIMESTAMP
+
+
+def test_migration_batches_fit_the_firestore_limit():
+    assert migration.BATCH_SIZE <= MAX_BATCH_WRITES
+
+    client = MemoryFirestore()
+    docs = [(str(i), {"n": i}) for i in range(MAX_BATCH_WRITES + 1)]
+    with pytest.raises(ValueError):
+        migration.write_chunk(client.sync(), "entryLogs", docs)
+    assert not client.store.get("entryLogs")
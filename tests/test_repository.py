@@ -0,0 +1,180 @@
+"""FirestoreRepository over MemoryFirestore (STORAGE_BACKEND=memory)"""
+
+import asyncio
+from datetime import timedelta
+
+import pytest
+
+from backend.memory_firestore import (
+    MAX_BATCH_WRITES, Aborted, FieldFilter, MemoryFirestore, MissingIndexError, async_transactional,
+)
+from backend.repository import ENTRY_LOGS_COLLECTION, FirestoreRepository
+from backend.timezone_utils import get_ist_now
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+@pytest.fixture
+def repository():
+    return FirestoreRepository(MemoryFirestore(), window_ms=0)
+
+
+async def record(repository, plate_number, count, start=None):
+    start = start or get_ist_now().replace(microsecond=0) - timedelta(hours=count)
+    entries = []
+    for i in range(count):
+        entry = await repository.record_entry(plate_number, start + timedelta(minutes=10 * i), True, False)
+        entries.append(entry)
+    return entries
+
+
+def test_vehicle_registry(repository):
+    async def scenario():
+        added = await repository.add_vehicle("KA01AB1234", "Asha", "car")
+        assert added.plate_number == "KA01AB1234"
+        assert await repository.add_vehicle("KA01AB1234", "Someone else", "bike") is None
+        await repository.add_vehicle("DL02CD5678", "Ravi", "bike")
+
+        vehicle = await repository.get_vehicle("KA01AB1234")
+        assert (vehicle.owner_name, vehicle.vehicle_type) == ("Asha", "car")
+        assert [v.plate_number for v in await repository.list_vehicles()] == ["DL02CD5678", "KA01AB1234"]
+
+        assert await repository.delete_vehicle("KA01AB1234")
+        assert not await repository.delete_vehicle("KA01AB1234")
+        assert await repository.get_vehicle("KA01AB1234") is None
+
+    run(scenario())
+
+
+def test_history_pages_newest_first(repository):
+    async def scenario():
+        entries = await record(repository, "MH12EF0001", 7)
+        await record(repository, "MH12EF0002", 3)
+
+        pages, before = [], None
+        while True:
+            page = await repository.history("MH12EF0001", 3, before=before)
+            if not page:
+                break
+            pages.append(page)
+            before = (page[-1].entry_time, page[-1].id)
+
+        assert [len(page) for page in pages] == [3, 3, 1]
+        seen = [entry for page in pages for entry in page]
+        assert [entry.id for entry in seen] == [entry.id for entry in reversed(entries)]
+        assert [entry.entry_time for entry in seen] == [entry.entry_time for entry in reversed(entries)]
+
+    run(scenario())
+
+
+def test_entries_since(repository):
+    async def scenario():
+        entries = await record(repository, "TN09GH4321", 4)
+        since = entries[2].entry_time
+        assert await repository.entries_since(since) == [
+            ("TN09GH4321", entry.entry_time) for entry in entries[2:]
+        ]
+
+    run(scenario())
+
+
+def test_exit_closes_the_latest_entry_once(repository):
+    async def scenario():
+        entries = await record(repository, "GJ05IJ1111", 2)
+
+        entry = await repository.pop_open_entry("GJ05IJ1111")
+        assert entry.id == entries[-1].id
+        assert await repository.pop_open_entry("GJ05IJ1111") is None
+
+        exit_time = entry.entry_time + timedelta(minutes=45)
+        await repository.close_entry(entry, exit_time, 45, False)
+        latest = (await repository.history("GJ05IJ1111", 1))[0]
+        assert (latest.id, latest.exit_time, latest.duration_minutes) == (entry.id, exit_time, 45)
+
+    run(scenario())
+
+
+def test_concurrent_exits_claim_one_entry(repository):
+    async def scenario():
+        await record(repository, "RJ14KL2222", 1)
+        claimed = await asyncio.gather(*(repository.pop_open_entry("RJ14KL2222") for _ in range(3)))
+        assert sum(entry is not None for entry in claimed) == 1
+
+    run(scenario())
+
+
+def test_concurrent_writes_share_a_batch(repository):
+    async def scenario():
+        repository.writer.window = 0.05
+        await asyncio.gather(*(
+            repository.record_entry(f"UP32MN{i:04d}", get_ist_now(), False, False) for i in range(10)
+        ))
+        assert repository.writer.commits == 1
+        assert len(repository.client.store[ENTRY_LOGS_COLLECTION]) == 10
+
+    run(scenario())
+
+
+def test_write_batches_stay_within_the_firestore_limit(repository):
+    async def scenario():
+        repository.writer.window = 0.05
+        count = MAX_BATCH_WRITES + 100
+        await asyncio.gather(*(
+            repository.record_entry(f"AP09PQ{i:04d}", get_ist_now(), False, False) for i in range(count)
+        ))
+        assert repository.writer.commits == 2
+        assert len(repository.client.store[ENTRY_LOGS_COLLECTION]) == count
+
+        batch = repository.client.batch()
+        for i in range(MAX_BATCH_WRITES + 1):
+            batch.set(repository.vehicles.document(f"X{i}"), {})
+        with pytest.raises(ValueError):
+            await batch.commit()
+        assert not repository.client.store.get("vehicles")
+
+    run(scenario())
+
+
+def test_transaction_retries_after_a_conflicting_write():
+    client = MemoryFirestore()
+    counters = client.collection("counters")
+    attempts = []
+
+    def increment(conflicts):
+        @async_transactional
+        async def attempt(transaction):
+            attempts.append(None)
+            async for snapshot in counters.stream(transaction=transaction):
+                if len(attempts) <= conflicts:
+                    # Another client writes between this attempt's read and its commit
+                    await counters.document("visits").set({"n": 10 * len(attempts)})
+                transaction.update(snapshot.reference, {"n": snapshot.get("n") + 1})
+        return attempt
+
+    async def scenario():
+        await counters.document("visits").set({"n": 0})
+
+        await increment(conflicts=1)(client.transaction())
+        assert len(attempts) == 2
+        assert (await counters.document("visits").get()).get("n") == 11
+
+        attempts.clear()
+        with pytest.raises(Aborted):
+            await increment(conflicts=3)(client.transaction(max_attempts=3))
+        assert len(attempts) == 3
+        assert (await counters.document("visits").get()).get("n") == 30
+
+    run(scenario())
+
+
+def test_queries_without_a_declared_index_fail():
+    client = MemoryFirestore()
+    query = (
+        client.collection(ENTRY_LOGS_COLLECTION)
+        .where(filter=FieldFilter("plateNumber", "==", "KA01AB1234"))
+        .order_by("isSuspicious")
+    )
+    with pytest.raises(MissingIndexError):
+        run(query.get())
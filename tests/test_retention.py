@@ -0,0 +1,44 @@
+"""Archiving entry_logs with backend.retention, and the rollups read by /api/stats"""
+
+import asyncio
+from datetime import timedelta
+
+import httpx
+import pytest
+
+from backend import retention, rollups
+from backend.app import app
+from backend.database import get_engine
+from backend.timezone_utils import get_ist_now
+from benchmarks.seed import seed_database
+
+
+async def daily_stats(since):
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            response = await client.get("/api/stats/daily", params={"since": since.isoformat()})
+            response.raise_for_status()
+            return response.json()["buckets"]
+
+
+def assert_same_buckets(actual, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        for key, value in want.items():
+            assert got[key] == (pytest.approx(value) if isinstance(value, float) else value), key
+
+
+def test_rebuild_after_archiving_keeps_archived_days(app_database, tmp_path):
+    seed_database(app_database, vehicles=50, logs=600, visitors=30, days=30)
+    since = get_ist_now() - timedelta(days=31)
+    before = asyncio.run(daily_stats(since))
+    assert sum(day["entries"] for day in before) == 600
+
+    stats = retention.enforce_retention(get_engine(), days=10, archive_dir=str(tmp_path), fmt="ndjson")
+    assert stats["archived"] > 300
+    with get_engine().begin() as conn:
+        assert rollups.archive_horizon(conn) is not None
+        rollups.rebuild(conn)
+
+    assert_same_buckets(asyncio.run(daily_stats(since)), before)
@@ -0,0 +1,24 @@
+"""SQL statements per gate and history request, against benchmarks.bench_queries.QUERY_BUDGETS"""
+
+import argparse
+import asyncio
+
+import pytest
+
+from benchmarks import bench_queries
+from benchmarks.seed import seed_database
+
+
+@pytest.fixture(scope="module")
+def statement_counts(app_database):
+    seed_database(app_database, logs=2000)
+    cases, samples, _ = asyncio.run(bench_queries.measure(argparse.Namespace(samples=20)))
+    return cases, samples
+
+
+@pytest.mark.parametrize("endpoint", sorted(bench_queries.QUERY_BUDGETS))
+def test_endpoint_stays_within_its_statement_budget(statement_counts, endpoint):
+    cases, samples = statement_counts
+    assert cases[endpoint], f"no {endpoint} requests were measured"
+    statements = "\n".join(" ".join(statement.split())[:160] for statement in samples[endpoint])
+    assert max(cases[endpoint]) <= bench_queries.QUERY_BUDGETS[endpoint], statements
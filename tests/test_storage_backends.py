@@ -0,0 +1,37 @@
+"""Endpoints that read SQLite directly, under the other STORAGE_BACKENDs"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from backend import app as app_module
+from backend.app import app
+
+SQLITE_ONLY = [
+    ("GET", "/api/on-campus"),
+    ("GET", "/api/logs"),
+    ("GET", "/api/logs/export"),
+    ("GET", "/api/history/AB12CD3456/export"),
+    ("GET", "/api/vehicles/export"),
+    ("POST", "/api/vehicles/import"),
+    ("POST", "/api/check-entry/batch"),
+    ("POST", "/api/check-exit/batch"),
+    ("GET", "/api/stats/hourly"),
+    ("GET", "/api/stats/daily"),
+    ("GET", "/api/reports/suspicious"),
+]
+
+
+async def request(method, path):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        return await client.request(method, path)
+
+
+@pytest.mark.parametrize("method, path", SQLITE_ONLY)
+def test_sqlite_only_endpoints_answer_501_on_other_backends(monkeypatch, method, path):
+    monkeypatch.setattr(app_module, "STORAGE_BACKEND", "memory")
+    response = asyncio.run(request(method, path))
+    assert response.status_code == 501
+    assert "STORAGE_BACKEND=memory" in response.json()["detail"]